@@ -0,0 +1,175 @@
+"""配额检查基准测试
+
+对不同规模的隧道数（默认 1千、1万、10万），比较配额引擎与直接聚合查询的单次检查耗时：
+    tunnels：按主键读取计数行 对比 COUNT(*) 用户的隧道；acquire 为实际创建时的带条件更新（随后回滚）
+    traffic：traffic_used（按主键读取计数行） 对比 SUM 本月每日汇总
+每个规模使用独立的临时SQLite数据库，用户数为隧道数除以 --tunnels-per-user，流量日志行数为隧道数乘以 --logs-per-tunnel。
+DATABASE_URI 指向MySQL时只测试一个规模（--sizes 的第一个值）。结果以JSON输出。
+
+用法：
+    python benchmarks/bench_quota.py
+    python benchmarks/bench_quota.py --sizes 100000 --checks 5000 --output results/quota.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import func, select
+from src.main import create_app
+from src.models.user import db
+from src.models.tunnel import Tunnel
+from src.models.traffic import TrafficSummary
+from src.services.data_generator import generate_dataset
+from src.services.quota import quota_engine, current_period
+
+
+def summarize(latencies, elapsed):
+    ordered = sorted(latencies)
+    us = lambda v: round(v * 1e6, 1)
+    return {
+        'checks': len(ordered),
+        'elapsed_s': round(elapsed, 3),
+        'mean_us': us(sum(ordered) / len(ordered)),
+        'p50_us': us(ordered[len(ordered) // 2]),
+        'p99_us': us(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))])
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def naive_tunnels(user_id):
+    return db.session.scalar(select(func.count(Tunnel.id)).where(Tunnel.user_id == user_id))
+
+
+def naive_traffic(user_id):
+    return db.session.scalar(
+        select(func.coalesce(func.sum(TrafficSummary.upload + TrafficSummary.download), 0))
+        .where(TrafficSummary.user_id == user_id, TrafficSummary.date >= current_period())
+    )
+
+
+def engine_tunnels(user_id):
+    return quota_engine.usage(user_id)['tunnel_count']
+
+
+def engine_acquire(user_id):
+    quota_engine.acquire_tunnels(user_id, limit=1 << 30)
+    db.session.rollback()
+
+
+def engine_traffic(user_id):
+    return quota_engine.traffic_used(user_id)
+
+
+def measure(check, user_ids, checks):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(checks):
+        user_id = random.choice(user_ids)
+        t0 = time.perf_counter()
+        check(user_id)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    db.session.rollback()
+    return summarize(latencies, elapsed)
+
+
+def run_size(tunnels, args):
+    database_uri = os.environ.get('DATABASE_URI')
+    if database_uri is None:
+        tmpdir = tempfile.mkdtemp(prefix='frp_panel_bench_')
+        database_uri = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'BACKGROUND_SERVICES': False
+    })
+
+    with app.app_context():
+        users = max(1, tunnels // args.tunnels_per_user)
+        seed_start = time.perf_counter()
+        dataset = generate_dataset(
+            users=users, nodes=10, tunnels_per_user=args.tunnels_per_user, days=args.days,
+            traffic_rows=tunnels * args.logs_per_tunnel, prefix='quota', seed=args.seed
+        )
+        seed_elapsed = time.perf_counter() - seed_start
+        user_ids = dataset['user_ids']
+
+        results = {}
+        for name, check in (('naive_tunnels', naive_tunnels), ('engine_tunnels', engine_tunnels),
+                            ('engine_acquire', engine_acquire),
+                            ('naive_traffic', naive_traffic), ('engine_traffic', engine_traffic)):
+            for _ in range(min(args.checks, 50)):
+                check(random.choice(user_ids))
+            db.session.rollback()
+            results[name] = measure(check, user_ids, args.checks)
+        db.session.remove()
+
+    return {
+        'tunnels': len(dataset['tunnels']),
+        'users': len(user_ids),
+        'traffic_logs': dataset['traffic_logs'],
+        'seed_s': round(seed_elapsed, 2),
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='配额检查基准测试')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='隧道总数，逗号分隔')
+    parser.add_argument('--tunnels-per-user', type=int, default=10)
+    parser.add_argument('--logs-per-tunnel', type=int, default=5)
+    parser.add_argument('--days', type=int, default=30, help='流量历史覆盖的天数')
+    parser.add_argument('--checks', type=int, default=2000, help='每种检查的次数')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    parser.add_argument('--output', help='结果JSON文件路径，缺省输出到标准输出')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    if os.environ.get('DATABASE_URI'):
+        sizes = sizes[:1]
+
+    runs = {}
+    for size in sizes:
+        runs[str(size)] = run = run_size(size, args)
+        line = '  '.join(f"{name} p50={result['p50_us']}us" for name, result in run['results'].items())
+        print(f"{run['tunnels']:>8} 条隧道: {line}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {k: v for k, v in vars(args).items() if k != 'output'}
+        },
+        'runs': runs
+    }
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
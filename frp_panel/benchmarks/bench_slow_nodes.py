@@ -0,0 +1,162 @@
+"""节点面板无响应时的并发处理能力测试
+
+启动一个只接受连接、从不响应的TCP服务模拟无响应的 frps 面板，用 gunicorn 启动应用，
+同时发起查询节点详细状态的慢请求（等待至 NODE_HEALTH_TIMEOUT 超时）和查询套餐列表的快请求，
+统计快请求的延迟和整体完成时间。对比不同工作模式：
+
+用法：
+    python benchmarks/bench_slow_nodes.py --worker-class gthread
+    python benchmarks/bench_slow_nodes.py --worker-class gevent   # 需要 pip install -r requirements-gevent.txt
+    NODE_HEALTH_CONCURRENCY=200 python benchmarks/bench_slow_nodes.py --worker-class gevent --slow 200 --fast 200
+
+节点面板请求的总并发受 NODE_HEALTH_CONCURRENCY 限制（每次状态查询会并发请求9个接口），
+gevent 模式下可适当调大。
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def start_blackhole():
+    """启动只接受连接不响应的TCP服务，返回端口"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1024)
+    held = []
+
+    def accept():
+        while True:
+            conn, _ = server.accept()
+            held.append(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def seed(database_uri, node_count, dashboard_port):
+    """创建管理员和指向无响应面板的节点，返回 (token, 节点ID列表)"""
+    from flask_jwt_extended import create_access_token
+    from src.main import create_app
+    from src.models.user import db, User
+    from src.models.node import Node
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri, 'BACKGROUND_SERVICES': False})
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', is_active=True, is_admin=True)
+        user.set_password('bench123456')
+        db.session.add(user)
+        db.session.flush()
+
+        nodes = [
+            Node(name=f'slow-{i}', host='127.0.0.1', port=7000, dashboard_port=dashboard_port, user_id=user.id)
+            for i in range(node_count)
+        ]
+        db.session.add_all(nodes)
+        db.session.commit()
+        return create_access_token(identity=user.id), [n.id for n in nodes]
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn 启动超时')
+
+
+def timed_get(url, headers):
+    start = time.perf_counter()
+    try:
+        status = requests.get(url, headers=headers, timeout=120).status_code
+    except requests.exceptions.RequestException:
+        status = None
+    return status, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='节点面板无响应时的并发处理能力测试')
+    parser.add_argument('--worker-class', default='gthread', choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn 工作进程数')
+    parser.add_argument('--threads', type=int, default=4, help='gthread 模式下每个进程的线程数')
+    parser.add_argument('--slow', type=int, default=50, help='并发的节点状态请求数（每个请求对应一个无响应节点）')
+    parser.add_argument('--fast', type=int, default=100, help='并发的套餐列表请求数')
+    parser.add_argument('--timeout', type=float, default=2, help='节点面板请求超时（秒）')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='frp_panel_bench_')
+    database_uri = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    dashboard_port = start_blackhole()
+    token, node_ids = seed(database_uri, args.slow, dashboard_port)
+    headers = {'Authorization': f'Bearer {token}'}
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URI': database_uri,
+        'GUNICORN_BIND': f'127.0.0.1:{args.port}',
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_THREADS': str(args.threads),
+        'GUNICORN_WORKER_CLASS': args.worker_class,
+        'NODE_HEALTH_TIMEOUT': str(args.timeout),
+        'NODE_HEALTH_INTERVAL': '0',
+        'NODE_STATUS_CACHE_TTL': '0'
+    })
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'src.wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_ready(base_url)
+
+        slow_urls = [f'{base_url}/api/nodes/{node_id}/status' for node_id in node_ids]
+        fast_urls = [f'{base_url}/api/packages'] * args.fast
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(slow_urls) + len(fast_urls)) as executor:
+            slow_futures = [executor.submit(timed_get, url, headers) for url in slow_urls]
+            # 慢请求先占住工作进程，再发起快请求
+            time.sleep(0.2)
+            fast_futures = [executor.submit(timed_get, url, headers) for url in fast_urls]
+            slow_results = [f.result() for f in slow_futures]
+            fast_results = [f.result() for f in fast_futures]
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    fast_latency = [r[1] * 1000 for r in fast_results]
+    print(f"工作模式: {args.worker_class}，进程数 {args.workers}，"
+          f"{'线程数 ' + str(args.threads) + '，' if args.worker_class == 'gthread' else ''}面板超时 {args.timeout}s")
+    print(f"慢请求: {len(slow_results)} 个，成功 {sum(1 for r in slow_results if r[0] == 200)}，"
+          f"最长 {max(r[1] for r in slow_results):.2f}s")
+    if fast_latency:
+        print(f"快请求: {len(fast_results)} 个，成功 {sum(1 for r in fast_results if r[0] == 200)}，"
+              f"p50 {statistics.median(fast_latency):.0f} ms / p95 {percentile(fast_latency, 0.95):.0f} ms / "
+              f"最长 {max(fast_latency):.0f} ms")
+    print(f"总耗时: {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
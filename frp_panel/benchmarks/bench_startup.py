@@ -0,0 +1,65 @@
+"""应用启动耗时基准测试
+
+每轮在新的Python进程中分别计时：导入 src.main、create_app()、首个请求。
+默认使用临时SQLite数据库，可通过 DATABASE_URI 指定其他数据库，SCHEMA_MODE 控制启动时的数据库结构处理。
+
+用法：
+    python benchmarks/bench_startup.py --runs 10
+    SCHEMA_MODE=off python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中执行，输出各阶段耗时（秒）的JSON
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+t0 = time.perf_counter()
+from src.main import create_app
+t1 = time.perf_counter()
+app = create_app({'BACKGROUND_SERVICES': False})
+t2 = time.perf_counter()
+response = app.test_client().get('/api/packages')
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2, 'status': response.status_code}))
+'''
+
+
+def run_once(env):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, ROOT],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='应用启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=5, help='测试轮数')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    tmpdir = tempfile.mkdtemp(prefix='frp_panel_bench_')
+    env.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+
+    # 先执行一轮完成建表，避免首轮迁移耗时影响结果
+    run_once(env)
+    results = [run_once(env) for _ in range(args.runs)]
+
+    print(f"数据库: {env['DATABASE_URI']}，SCHEMA_MODE={env.get('SCHEMA_MODE', 'upgrade')}，{args.runs} 轮中位数")
+    for phase in ('import', 'create_app', 'first_request'):
+        values = [r[phase] * 1000 for r in results]
+        print(f"{phase:>14}: {statistics.median(values):8.1f} ms  (最小 {min(values):.1f} / 最大 {max(values):.1f})")
+    total = [sum(r[p] for p in ('import', 'create_app', 'first_request')) * 1000 for r in results]
+    print(f"{'total':>14}: {statistics.median(total):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""流量上报吞吐基准测试
+
+对比逐条上报（POST /api/traffic/log）与批量上报（POST /api/traffic/log/batch）
+每秒可写入的样本数。默认使用临时SQLite数据库，可通过 DATABASE_URI 指定其他数据库。
+
+用法：
+    python benchmarks/bench_traffic_ingest.py --samples 2000 --tunnels 50 --batch-size 500
+    TRAFFIC_WRITE_BEHIND=true python benchmarks/bench_traffic_ingest.py  # 启用写后缓冲
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='frp_panel_bench_')
+os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from flask_jwt_extended import create_access_token
+from src.main import create_app
+from src.models.user import db, User
+from src.models.node import Node
+from src.models.tunnel import Tunnel
+
+app = create_app()
+
+
+def seed(tunnel_count):
+    """创建测试用户、节点和隧道，返回 (token, 隧道ID列表)"""
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', is_active=True)
+        user.set_password('bench123456')
+        db.session.add(user)
+        db.session.flush()
+
+        node = Node(name='bench-node', host='127.0.0.1', port=7000, user_id=user.id)
+        db.session.add(node)
+        db.session.flush()
+
+        tunnels = [
+            Tunnel(name=f'bench-{i}', type='tcp', local_port=10000 + i,
+                   node_id=node.id, user_id=user.id)
+            for i in range(tunnel_count)
+        ]
+        db.session.add_all(tunnels)
+        db.session.commit()
+
+        token = create_access_token(identity=user.id)
+        return token, [t.id for t in tunnels]
+
+
+def make_samples(tunnel_ids, count):
+    return [{
+        'tunnel_id': random.choice(tunnel_ids),
+        'upload': random.randint(0, 1 << 20),
+        'download': random.randint(0, 1 << 20)
+    } for _ in range(count)]
+
+
+def bench_single(client, headers, samples):
+    start = time.perf_counter()
+    for sample in samples:
+        response = client.post('/api/traffic/log', json=sample, headers=headers)
+        assert response.status_code == 201, response.get_json()
+    return time.perf_counter() - start
+
+
+def bench_batch(client, headers, samples, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(samples), batch_size):
+        response = client.post('/api/traffic/log/batch',
+                               json={'samples': samples[offset:offset + batch_size]},
+                               headers=headers)
+        assert response.status_code == 201, response.get_json()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流量上报吞吐基准测试')
+    parser.add_argument('--samples', type=int, default=2000, help='每种方式写入的样本数')
+    parser.add_argument('--tunnels', type=int, default=50, help='隧道数量')
+    parser.add_argument('--batch-size', type=int, default=500, help='批量上报的单批大小')
+    args = parser.parse_args()
+
+    token, tunnel_ids = seed(args.tunnels)
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    single_elapsed = bench_single(client, headers, make_samples(tunnel_ids, args.samples))
+    batch_elapsed = bench_batch(client, headers, make_samples(tunnel_ids, args.samples), args.batch_size)
+
+    single_rate = args.samples / single_elapsed
+    batch_rate = args.samples / batch_elapsed
+    print(f"数据库: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"逐条上报: {args.samples} 条 / {single_elapsed:.2f}s = {single_rate:,.0f} 条/秒")
+    print(f"批量上报: {args.samples} 条 / {batch_elapsed:.2f}s = {batch_rate:,.0f} 条/秒 (批大小 {args.batch_size})")
+    print(f"加速比: {batch_rate / single_rate:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""节点详细状态查询与后台探测的线程池隔离检查
+
+启动一个正常响应的模拟 frps 面板（每个接口延迟 --delay 毫秒）和一个只接受连接、从不响应的TCP服务，
+先在探测空闲时测量正常节点的详细状态查询耗时，再让后台探测同时探测 --hanging 个无响应节点
+（占满 NODE_HEALTH_CONCURRENCY 个探测线程，直到 --timeout 超时），期间再次测量。
+探测期间的耗时超过空闲时耗时加 --margin 毫秒时以非零状态退出。
+
+用法：
+    python benchmarks/check_status_isolation.py
+    python benchmarks/check_status_isolation.py --hanging 50 --timeout 5
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.main import create_app
+from src.models.user import db, User
+from src.models.node import Node
+from src.services.node_monitor import node_monitor, node_snapshot
+
+
+def start_blackhole():
+    """启动只接受连接不响应的TCP服务，返回端口"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1024)
+    held = []
+
+    def accept():
+        while True:
+            conn, _ = server.accept()
+            held.append(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def start_dashboard(delay):
+    """启动正常响应的模拟 frps 面板，返回端口"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = {'version': 'fake'} if self.path == '/api/serverinfo' else {'proxies': []}
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def measure(snapshot, rounds):
+    """返回详细状态查询的最长耗时（毫秒）"""
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        status = node_monitor.get_dashboard_status(snapshot)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status['status'] != 'online':
+            raise SystemExit(f"正常节点的状态为 {status['status']}: {status['error']}")
+    return max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='节点详细状态查询与后台探测的线程池隔离检查')
+    parser.add_argument('--hanging', type=int, default=32, help='无响应节点数')
+    parser.add_argument('--concurrency', type=int, default=8, help='NODE_HEALTH_CONCURRENCY')
+    parser.add_argument('--timeout', type=float, default=3, help='节点面板请求超时（秒）')
+    parser.add_argument('--delay', type=float, default=50, help='模拟面板每个接口的延迟（毫秒）')
+    parser.add_argument('--rounds', type=int, default=5, help='每个阶段的查询次数')
+    parser.add_argument('--margin', type=float, default=200, help='允许的耗时增加（毫秒）')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='frp_panel_check_')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmpdir, 'check.db')}",
+        'BACKGROUND_SERVICES': False,
+        'NODE_HEALTH_TIMEOUT': args.timeout,
+        'NODE_HEALTH_CONCURRENCY': args.concurrency,
+        'NODE_STATUS_CACHE_TTL': 0
+    })
+    blackhole_port = start_blackhole()
+    dashboard_port = start_dashboard(args.delay / 1000)
+
+    with app.app_context():
+        user = User(username='check', email='check@example.com', is_active=True, is_admin=True)
+        user.set_password('check123456')
+        db.session.add(user)
+        db.session.flush()
+        healthy = Node(name='healthy', host='127.0.0.1', port=7000, dashboard_port=dashboard_port, user_id=user.id)
+        db.session.add(healthy)
+        db.session.add_all([
+            Node(name=f'hanging-{i}', host='127.0.0.1', port=7000, dashboard_port=blackhole_port, user_id=user.id)
+            for i in range(args.hanging)
+        ])
+        db.session.commit()
+        snapshot = node_snapshot(healthy)
+        db.session.remove()
+
+    idle = measure(snapshot, args.rounds)
+    print(f'探测空闲时: 详细状态查询最长 {idle:.0f} ms')
+
+    refresh = threading.Thread(target=node_monitor.refresh, daemon=True)
+    refresh.start()
+    # 等待探测线程被无响应节点占满
+    time.sleep(0.3)
+    busy = measure(snapshot, args.rounds)
+    still_probing = refresh.is_alive()
+    print(f'{args.hanging} 个节点探测挂起时: 详细状态查询最长 {busy:.0f} ms（探测仍在进行: {still_probing}）')
+    refresh.join()
+    node_monitor.shutdown()
+
+    if busy > idle + args.margin:
+        raise SystemExit(f'后台探测挂起时详细状态查询变慢: {idle:.0f} ms -> {busy:.0f} ms')
+    if not still_probing:
+        raise SystemExit('测量结束前后台探测已完成，请增大 --timeout 或 --hanging')
+    print('通过：详细状态查询不受后台探测影响')
+
+
+if __name__ == '__main__':
+    main()
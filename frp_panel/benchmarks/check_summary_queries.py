@@ -0,0 +1,99 @@
+"""流量汇总接口查询数回归检查
+
+GET /api/traffic/summary 的SQL语句数应与用户的隧道数无关（分组聚合，而不是逐个隧道查询）。
+在临时SQLite数据库中生成两个用户，分别拥有 1 条和 --tunnels 条隧道（默认200），
+通过 before_cursor_execute 事件统计每次请求执行的语句数，两者不相等时以非零状态退出。
+
+用法：
+    python benchmarks/check_summary_queries.py
+    python benchmarks/check_summary_queries.py --tunnels 1000 --verbose
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from src.main import create_app
+from src.models.user import db
+from src.services.data_generator import generate_dataset
+
+
+class StatementCounter:
+    """统计引擎上执行的SQL语句"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+def count_summary_queries(client, user_id, path):
+    """请求一次（预热缓存）后，返回第二次请求执行的语句列表和隧道数"""
+    headers = {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+    client.get(path, headers=headers)
+    with StatementCounter(db.engine) as counter:
+        response = client.get(path, headers=headers)
+    if response.status_code != 200:
+        raise SystemExit(f'{path} 返回 {response.status_code}: {response.get_data(as_text=True)}')
+    return counter.statements, len(response.get_json()['tunnel_stats'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流量汇总接口查询数回归检查')
+    parser.add_argument('--tunnels', type=int, default=200, help='较大用户的隧道数')
+    parser.add_argument('--logs-per-tunnel', type=int, default=5)
+    parser.add_argument('--verbose', action='store_true', help='输出执行的SQL语句')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='frp_panel_check_')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmpdir, 'check.db')}",
+        'BACKGROUND_SERVICES': False
+    })
+
+    with app.app_context():
+        users = {}
+        for tunnels in sorted({1, args.tunnels}):
+            dataset = generate_dataset(
+                users=1, nodes=2, tunnels_per_user=tunnels, days=7,
+                traffic_rows=tunnels * args.logs_per_tunnel, prefix=f'check{tunnels}', seed=tunnels
+            )
+            users[tunnels] = dataset['user_ids'][0]
+        db.session.remove()
+
+        client = app.test_client()
+        counts = {}
+        for path in ('/api/traffic/summary', '/api/traffic/summary?top_n=10'):
+            for tunnels, user_id in users.items():
+                statements, returned = count_summary_queries(client, user_id, path)
+                counts[(path, tunnels)] = len(statements)
+                print(f'{path:<32} {tunnels:>6} 条隧道（返回 {returned}）: {len(statements)} 条语句')
+                if args.verbose:
+                    for statement in statements:
+                        print('    ' + ' '.join(statement.split()))
+
+            expected = counts[(path, 1)]
+            mismatched = {t: c for (p, t), c in counts.items() if p == path and c != expected}
+            if mismatched:
+                raise SystemExit(f'{path} 的语句数随隧道数变化: 1 条隧道 {expected} 条, 其他 {mismatched}')
+
+    print('通过：语句数与隧道数无关')
+
+
+if __name__ == '__main__':
+    main()
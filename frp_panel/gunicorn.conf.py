@@ -0,0 +1,29 @@
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# 工作模式：gthread（默认，线程池）或 gevent（协程，适合大量慢速的节点面板请求）
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # 必须在导入应用之前打补丁：socket、threading、time 等被替换为协作式实现，
+    # requests（节点面板）和 PyMySQL（数据库）的网络IO在等待时让出执行权，后台线程也运行为协程
+    from gevent import monkey
+    monkey.patch_all()
+
+    # 每个工作进程可同时处理的连接数
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# 预加载应用：主进程只导入一次代码并执行一次数据库迁移，工作进程fork后共享已导入的模块
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes', 'on')
+
+
+def post_fork(server, worker):
+    """工作进程fork后丢弃继承自主进程的数据库连接，后台线程在首个请求时启动"""
+    from src.models.user import db
+    from src.wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
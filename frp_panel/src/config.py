@@ -0,0 +1,111 @@
+import os
+
+
+def env_bool(name, default):
+    """读取布尔型环境变量"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class Config:
+    """应用配置，所有配置项均可通过同名环境变量覆盖"""
+
+    SECRET_KEY = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string-change-me')
+
+    # 数据库配置，默认使用MySQL
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI', 'mysql+pymysql://root:password@db:3306/frp_panel')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 数据库连接池配置（每个工作进程一个连接池，SQLite 不生效）
+    # 连接数上限为 DB_POOL_SIZE + DB_MAX_OVERFLOW，应不小于工作线程数加后台线程数
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '10'))
+
+    # 启动时的数据库结构处理：upgrade 执行未执行的迁移；check 只检查并提示；off 不访问数据库
+    SCHEMA_MODE = os.getenv('SCHEMA_MODE', 'upgrade').lower()
+
+    # 是否在首个请求时启动后台线程（流量刷新、汇总、节点探测、日志写入）
+    BACKGROUND_SERVICES = env_bool('BACKGROUND_SERVICES', True)
+
+    # 流量写后缓冲配置
+    TRAFFIC_WRITE_BEHIND = env_bool('TRAFFIC_WRITE_BEHIND', False)
+    TRAFFIC_FLUSH_INTERVAL = float(os.getenv('TRAFFIC_FLUSH_INTERVAL', '5'))
+    TRAFFIC_FLUSH_MAX_KEYS = int(os.getenv('TRAFFIC_FLUSH_MAX_KEYS', '10000'))
+
+    # 流量分时汇总与数据保留配置
+    TRAFFIC_ROLLUP_INTERVAL = float(os.getenv('TRAFFIC_ROLLUP_INTERVAL', '60'))
+    # 新日志至少经过该稳定期（秒）才会被汇总，避免晚提交的较小自增ID被跳过；应大于上报事务的最长耗时
+    TRAFFIC_ROLLUP_SETTLE_SECONDS = float(os.getenv('TRAFFIC_ROLLUP_SETTLE_SECONDS', '30'))
+    TRAFFIC_RAW_RETENTION_DAYS = int(os.getenv('TRAFFIC_RAW_RETENTION_DAYS', '3'))
+    TRAFFIC_MINUTE_RETENTION_DAYS = int(os.getenv('TRAFFIC_MINUTE_RETENTION_DAYS', '7'))
+    TRAFFIC_HOUR_RETENTION_DAYS = int(os.getenv('TRAFFIC_HOUR_RETENTION_DAYS', '90'))
+
+    # 节点状态探测配置
+    NODE_HEALTH_INTERVAL = float(os.getenv('NODE_HEALTH_INTERVAL', '30'))
+    NODE_HEALTH_TIMEOUT = float(os.getenv('NODE_HEALTH_TIMEOUT', '5'))
+    NODE_HEALTH_CONCURRENCY = int(os.getenv('NODE_HEALTH_CONCURRENCY', '16'))
+    # 节点详细状态查询的线程数，与后台探测分开；每次查询并发请求9个面板接口
+    NODE_STATUS_CONCURRENCY = int(os.getenv('NODE_STATUS_CONCURRENCY', '18'))
+    NODE_STATUS_CACHE_TTL = float(os.getenv('NODE_STATUS_CACHE_TTL', '5'))
+
+    # 操作日志异步写入配置
+    AUDIT_LOG_ASYNC = env_bool('AUDIT_LOG_ASYNC', True)
+    AUDIT_LOG_QUEUE_SIZE = int(os.getenv('AUDIT_LOG_QUEUE_SIZE', '10000'))
+    AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', '500'))
+    AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv('AUDIT_LOG_FLUSH_INTERVAL', '1'))
+
+    # 请求指标采集与 /metrics 输出；设置 METRICS_TOKEN 后采集端需携带 Authorization: Bearer <token>
+    METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # SQL性能分析：按比例抽样请求（0 关闭，0.01 即1%），超过阈值或疑似 N+1 查询时写入 SystemLog 或日志文件
+    SQL_PROFILER_SAMPLE_RATE = float(os.getenv('SQL_PROFILER_SAMPLE_RATE', '0'))
+    SQL_PROFILER_SLOW_REQUEST_MS = float(os.getenv('SQL_PROFILER_SLOW_REQUEST_MS', '500'))
+    SQL_PROFILER_SLOW_QUERY_MS = float(os.getenv('SQL_PROFILER_SLOW_QUERY_MS', '100'))
+    SQL_PROFILER_MAX_QUERIES = int(os.getenv('SQL_PROFILER_MAX_QUERIES', '50'))
+    SQL_PROFILER_REPEAT_THRESHOLD = int(os.getenv('SQL_PROFILER_REPEAT_THRESHOLD', '10'))
+    SQL_PROFILER_SINK = os.getenv('SQL_PROFILER_SINK', 'systemlog')  # systemlog 或 file
+    SQL_PROFILER_LOG_FILE = os.getenv('SQL_PROFILER_LOG_FILE', 'sql_profile.log')
+    # 报告默认只记录慢查询的参数类型；开启后记录参数值（可能包含密码哈希、令牌、邮箱，管理员可通过接口查看）
+    SQL_PROFILER_LOG_PARAMETERS = env_bool('SQL_PROFILER_LOG_PARAMETERS', False)
+
+    # 读多写少接口（套餐、用户组、节点列表）的响应缓存，TTL 为 0 时关闭
+    # 默认进程内LRU缓存；多个工作进程需要写操作后立即一致时可设为 redis（需安装 redis 包）
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '30'))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'local')  # local 或 redis
+    RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # 实时流量推送（/api/traffic/stream）：推送间隔、心跳间隔、每个用户保留的重连补发样本数及断开后的保留时间（秒）
+    # 多个工作进程时设置 TRAFFIC_STREAM_POLL_INTERVAL（秒）由后台线程读取新增流量日志，否则只推送本进程收到的上报；
+    # 轮询只读取已超过 TRAFFIC_STREAM_SETTLE_SECONDS 秒稳定期的日志，避免跳过晚提交的较小ID，应大于上报事务的耗时
+    TRAFFIC_STREAM_INTERVAL = float(os.getenv('TRAFFIC_STREAM_INTERVAL', '1'))
+    TRAFFIC_STREAM_HEARTBEAT = float(os.getenv('TRAFFIC_STREAM_HEARTBEAT', '15'))
+    TRAFFIC_STREAM_BUFFER = int(os.getenv('TRAFFIC_STREAM_BUFFER', '1000'))
+    TRAFFIC_STREAM_RETAIN = float(os.getenv('TRAFFIC_STREAM_RETAIN', '60'))
+    TRAFFIC_STREAM_POLL_INTERVAL = float(os.getenv('TRAFFIC_STREAM_POLL_INTERVAL', '0'))
+    TRAFFIC_STREAM_SETTLE_SECONDS = float(os.getenv('TRAFFIC_STREAM_SETTLE_SECONDS', '2'))
+
+    # 配额：QUOTA_ENFORCE 关闭时只计数不拒绝；周期流量达到 QUOTA_THRESHOLDS 中的百分比时写入 SystemLog
+    QUOTA_ENFORCE = env_bool('QUOTA_ENFORCE', True)
+    QUOTA_THRESHOLDS = os.getenv('QUOTA_THRESHOLDS', '80,100')
+
+    # 有效限制（用户组与生效中的套餐合并）的进程内缓存时间（秒），套餐到期时提前失效，0 表示不缓存
+    EFFECTIVE_LIMITS_CACHE_TTL = float(os.getenv('EFFECTIVE_LIMITS_CACHE_TTL', '60'))
+
+    # 套餐到期与用量周期任务的执行间隔（秒），0 表示不启用；多个工作进程通过数据库租约只由一个执行
+    PACKAGE_EXPIRY_INTERVAL = float(os.getenv('PACKAGE_EXPIRY_INTERVAL', '60'))
+    PACKAGE_EXPIRY_BATCH_SIZE = int(os.getenv('PACKAGE_EXPIRY_BATCH_SIZE', '1000'))
+
+    # 当前用户信息缓存时间（秒）
+    PRINCIPAL_CACHE_TTL = float(os.getenv('PRINCIPAL_CACHE_TTL', '30'))
+    # 缓存中 is_admin、is_active 和用户组的核对间隔（秒）；变更只立即作用于本进程，
+    # 其他工作进程中降权或停用的用户最多在该时间内保留原有权限
+    PRINCIPAL_AUTH_TTL = float(os.getenv('PRINCIPAL_AUTH_TTL', '5'))
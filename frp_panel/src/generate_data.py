@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.main import create_app
+from src.services.data_generator import generate_dataset
+from src.services.traffic_rollup import rollup_pending
+
+# 创建Flask应用
+app = create_app({'BACKGROUND_SERVICES': False})
+
+def main():
+    """生成压测用的测试数据"""
+    parser = argparse.ArgumentParser(description='生成压测用的测试数据（用户、用户组、套餐、节点、隧道和流量历史）')
+    parser.add_argument('--users', type=int, default=1000, help='用户数')
+    parser.add_argument('--groups', type=int, default=3, help='用户组数，用户按组轮流分配')
+    parser.add_argument('--packages', type=int, default=3, help='套餐数')
+    parser.add_argument('--package-ratio', type=float, default=0.3, help='购买套餐的用户比例')
+    parser.add_argument('--nodes', type=int, default=20, help='节点数')
+    parser.add_argument('--tunnels-per-user', type=int, default=5, help='每个用户的隧道数')
+    parser.add_argument('--days', type=int, default=30, help='流量历史覆盖的天数')
+    parser.add_argument('--traffic-rows', type=int, default=1000000, help='流量日志总行数')
+    parser.add_argument('--prefix', default='gen', help='用户名、节点名等的前缀，重复生成时需更换')
+    parser.add_argument('--password', default='password123', help='所有生成用户的密码')
+    parser.add_argument('--seed', type=int, help='随机数种子，指定后生成结果可复现')
+    parser.add_argument('--rollup', action='store_true', help='生成后立即执行分钟/小时/天汇总')
+    args = parser.parse_args()
+
+    def progress(done, total):
+        elapsed = time.perf_counter() - started
+        print(f"\r流量日志: {done:,}/{total:,}  {done / elapsed:,.0f} 行/秒", end='', flush=True)
+
+    with app.app_context():
+        started = time.perf_counter()
+        result = generate_dataset(
+            users=args.users, groups=args.groups, packages=args.packages, package_ratio=args.package_ratio,
+            nodes=args.nodes, tunnels_per_user=args.tunnels_per_user, days=args.days,
+            traffic_rows=args.traffic_rows, prefix=args.prefix, password=args.password, seed=args.seed,
+            progress=progress
+        )
+        print()
+        print(f"用户组 {len(result['group_ids'])}，套餐 {len(result['package_ids'])}，用户 {len(result['user_ids'])}，"
+              f"已购套餐 {result['user_packages']}，节点 {len(result['node_ids'])}，隧道 {len(result['tunnels'])}，"
+              f"流量日志 {result['traffic_logs']:,}，耗时 {time.perf_counter() - started:.1f}s")
+
+        if args.rollup:
+            rollup_started = time.perf_counter()
+            processed = rollup_pending(batch_size=50000, max_batches=sys.maxsize, settle_seconds=0)
+            print(f"已汇总流量日志 {processed:,} 条，耗时 {time.perf_counter() - rollup_started:.1f}s")
+
+if __name__ == '__main__':
+    main()
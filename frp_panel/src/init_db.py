@@ -14,7 +14,8 @@ from src.models.verification import EmailVerification
 from src.models.log import OperationLog, SystemLog
 from src.models.user_group import UserGroup
 from src.models.package import Package, UserPackage
-from src.models.traffic import TrafficLog, TrafficSummary
+from src.models.traffic import TrafficLog, TrafficSummary, TrafficRollup, TrafficRollupCheckpoint
+from src.services.migrations import upgrade
 
 # 创建Flask应用
 from flask import Flask
@@ -30,8 +31,8 @@ db.init_app(app)
 def init_db():
     """初始化数据库"""
     with app.app_context():
-        # 创建所有表
-        db.create_all()
+        # 执行数据库迁移（创建所有表和索引）
+        upgrade()
         
         # 检查是否已有管理员用户
         admin = User.query.filter_by(username='admin').first()
@@ -1,69 +1,175 @@
 import os
 import sys
+import threading
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager
-from src.models.user import db
-from src.models.node import Node
-from src.models.tunnel import Tunnel
-from src.models.verification import EmailVerification
-from src.models.log import OperationLog, SystemLog
-from src.models.user_group import UserGroup
-from src.models.package import Package, UserPackage
-from src.models.traffic import TrafficLog, TrafficSummary
-from src.routes.user import user_bp
-from src.routes.auth import auth_bp
-from src.routes.nodes import nodes_bp
-from src.routes.tunnels import tunnels_bp
-from src.routes.packages import packages_bp
-from src.routes.user_groups import user_groups_bp
-from src.routes.traffic import traffic_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
-app.config['JWT_SECRET_KEY'] = 'jwt-secret-string-change-me'
-
-# 启用CORS支持
-CORS(app)
-
-# 初始化JWT
-jwt = JWTManager(app)
-
-# 注册蓝图
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api')
-app.register_blueprint(nodes_bp, url_prefix='/api')
-app.register_blueprint(tunnels_bp, url_prefix='/api')
-app.register_blueprint(packages_bp, url_prefix='/api')
-app.register_blueprint(user_groups_bp, url_prefix='/api')
-app.register_blueprint(traffic_bp, url_prefix='/api')
-
-# 数据库配置
-app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI", "mysql+pymysql://root:password@db:3306/frp_panel") # 默认使用MySQL，如果未设置环境变量则使用此默认值
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+from src.config import Config
+
+# 后台线程的启动锁，保证每个进程只启动一次
+_services_lock = threading.Lock()
+
+
+def register_blueprints(app):
+    """注册蓝图（在工厂内导入，导入 src.main 本身不会加载全部路由和模型）"""
+    from src.routes.user import user_bp
+    from src.routes.auth import auth_bp
+    from src.routes.nodes import nodes_bp
+    from src.routes.tunnels import tunnels_bp
+    from src.routes.packages import packages_bp
+    from src.routes.user_groups import user_groups_bp
+    from src.routes.traffic import traffic_bp
+    from src.routes.system import system_bp
+    from src.routes.quota import quota_bp
+
+    for blueprint in (user_bp, auth_bp, nodes_bp, tunnels_bp, packages_bp, user_groups_bp, traffic_bp, system_bp,
+                      quota_bp):
+        app.register_blueprint(blueprint, url_prefix='/api')
+
+
+def prepare_schema(app):
+    """按 SCHEMA_MODE 处理数据库结构
+
+    upgrade：执行未执行的迁移；check：只检查并提示未执行的迁移；off：启动时不访问数据库。
+    处理完成后释放连接池，避免 --preload 时主进程的连接被fork出的工作进程共用
+    （SQLite 除外，内存数据库释放连接后数据会丢失）。
+    """
+    mode = app.config['SCHEMA_MODE']
+    if mode == 'off':
+        return
+
+    from src.models.user import db
+    from src.services.migrations import upgrade, pending_migrations
+
+    with app.app_context():
+        if mode == 'upgrade':
+            upgrade()
+        elif mode == 'check':
+            pending = pending_migrations()
+            if pending:
+                app.logger.warning('存在未执行的数据库迁移: %s，请运行 python src/migrate.py', ', '.join(pending))
+        else:
+            raise ValueError(f'未知的 SCHEMA_MODE: {mode}')
+        if db.engine.url.get_backend_name() != 'sqlite':
+            db.engine.dispose()
+
+
+def start_background_services(app):
+    """在当前进程中启动后台线程
+
+    线程不会随fork复制到子进程，因此记录启动时的进程ID，
+    gunicorn --preload 时由各工作进程在首个请求时各自启动。
+    """
+    if app.extensions.get('background_services_pid') == os.getpid():
+        return
+
+    from src.services.traffic_aggregator import traffic_aggregator
+    from src.services.traffic_rollup import traffic_rollup_scheduler
+    from src.services.node_monitor import node_monitor
+    from src.services.audit_log import audit_log_writer
+    from src.services.traffic_stream import traffic_broker
+    from src.services.package_expiry import package_expiry_scheduler
+
+    with _services_lock:
+        if app.extensions.get('background_services_pid') == os.getpid():
+            return
+        if traffic_aggregator.enabled:
+            traffic_aggregator.start()
+        if traffic_rollup_scheduler.interval > 0:
+            traffic_rollup_scheduler.start()
+        if node_monitor.interval > 0:
+            node_monitor.start()
+        if audit_log_writer.enabled:
+            audit_log_writer.start()
+        if traffic_broker.polling:
+            traffic_broker.start()
+        if package_expiry_scheduler.interval > 0:
+            package_expiry_scheduler.start()
+        app.extensions['background_services_pid'] = os.getpid()
+
+
+def create_app(config=None):
+    """创建Flask应用
+
+    config 可为字典或配置类，覆盖 Config 中从环境变量读取的默认值。
+    """
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+    from src.models.user import db
+    from src.services.traffic_aggregator import traffic_aggregator
+    from src.services.traffic_rollup import traffic_rollup_scheduler
+    from src.services.node_monitor import node_monitor
+    from src.services.audit_log import audit_log_writer
+    from src.services.principal import principal_cache
+    from src.services.db_pool import build_engine_options
+    from src.services.metrics import metrics
+    from src.services.sql_profiler import sql_profiler
+    from src.services.response_cache import response_cache
+    from src.services.traffic_stream import traffic_broker
+    from src.services.quota import quota_engine
+    from src.services.limits import limits_resolver
+    from src.services.package_expiry import package_expiry_scheduler
+
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+
+    # 启用CORS支持
+    CORS(app)
+
+    # 初始化JWT
+    JWTManager(app)
+
+    # 注册蓝图
+    register_blueprints(app)
+
+    # 初始化数据库和各项服务
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(app.config)
+    db.init_app(app)
+    traffic_aggregator.init_app(app)
+    traffic_rollup_scheduler.init_app(app)
+    node_monitor.init_app(app)
+    audit_log_writer.init_app(app)
+    principal_cache.init_app(app)
+    metrics.init_app(app)
+    sql_profiler.init_app(app)
+    response_cache.init_app(app)
+    traffic_broker.init_app(app)
+    quota_engine.init_app(app)
+    limits_resolver.init_app(app)
+    package_expiry_scheduler.init_app(app)
+
+    prepare_schema(app)
+
+    if app.config['BACKGROUND_SERVICES']:
+        @app.before_request
+        def ensure_background_services():
+            start_background_services(app)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+                return "Static folder not configured", 404
+
+        if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
+            return send_from_directory(static_folder_path, path)
         else:
-            return "index.html not found", 404
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                return send_from_directory(static_folder_path, 'index.html')
+            else:
+                return "index.html not found", 404
+
+    return app
 
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,46 @@
+import os
+import sys
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.main import create_app
+from src.services.migrations import upgrade, pending_migrations, check_hot_query_indexes
+
+# 创建Flask应用（启动时不处理数据库结构，由命令决定）
+app = create_app({'SCHEMA_MODE': 'off', 'BACKGROUND_SERVICES': False})
+
+def main():
+    """数据库迁移工具"""
+    parser = argparse.ArgumentParser(description='数据库迁移工具')
+    parser.add_argument('command', nargs='?', default='upgrade', choices=['upgrade', 'status', 'check-indexes'],
+                        help='upgrade: 执行未执行的迁移；status: 查看未执行的迁移；check-indexes: 检查高频查询是否命中索引')
+    args = parser.parse_args()
+    
+    with app.app_context():
+        if args.command == 'upgrade':
+            executed = upgrade()
+            if not executed:
+                print("数据库已是最新版本，无需迁移。")
+        elif args.command == 'status':
+            pending = pending_migrations()
+            if pending:
+                print(f"未执行的迁移: {', '.join(pending)}")
+            else:
+                print("数据库已是最新版本。")
+        else:
+            failed = 0
+            for result in check_hot_query_indexes():
+                mark = '通过' if result['ok'] else '失败'
+                print(f"[{mark}] {result['name']}: 期望 {', '.join(result['expected'])}，"
+                      f"实际 {', '.join(result['used']) or '未使用索引'}")
+                if not result['ok']:
+                    failed += 1
+                    print(f"    执行计划: {result['plan']}")
+            if failed:
+                print(f"{failed} 个查询未命中索引")
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""创建基础数据表"""
+from src.models.user import User
+from src.models.user_group import UserGroup
+from src.models.node import Node
+from src.models.tunnel import Tunnel
+from src.models.verification import EmailVerification
+from src.models.log import OperationLog, SystemLog
+from src.models.package import Package, UserPackage
+from src.models.traffic import TrafficLog, TrafficSummary, TrafficRollup, TrafficRollupCheckpoint
+from src.services.migrations import create_tables
+
+
+def upgrade(conn):
+    create_tables(
+        conn,
+        UserGroup, User, Node, Tunnel, EmailVerification, OperationLog, SystemLog,
+        Package, UserPackage, TrafficLog, TrafficSummary, TrafficRollup, TrafficRollupCheckpoint
+    )
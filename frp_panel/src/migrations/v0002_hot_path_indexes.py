@@ -0,0 +1,23 @@
+"""为高频查询添加复合索引"""
+from src.services.migrations import create_index_if_missing
+
+INDEXES = (
+    ('traffic_log', 'ix_traffic_log_user_tunnel_ts', ('user_id', 'tunnel_id', 'timestamp')),
+    ('traffic_log', 'ix_traffic_log_user_ts', ('user_id', 'timestamp')),
+    ('traffic_log', 'ix_traffic_log_timestamp', ('timestamp',)),
+    ('traffic_summary', 'ix_traffic_summary_user_date', ('user_id', 'date')),
+    ('traffic_rollup', 'ix_traffic_rollup_user_bucket', ('resolution', 'user_id', 'bucket_start')),
+    ('traffic_rollup', 'ix_traffic_rollup_bucket', ('resolution', 'bucket_start')),
+    ('tunnel', 'ix_tunnel_user_created', ('user_id', 'created_at', 'id')),
+    ('tunnel', 'ix_tunnel_user_name', ('user_id', 'name')),
+    ('tunnel', 'ix_tunnel_node_status', ('node_id', 'status', 'type')),
+    ('tunnel', 'ix_tunnel_created', ('created_at', 'id')),
+    ('email_verification', 'ix_email_verification_lookup', ('email', 'purpose', 'created_at')),
+    ('operation_log', 'ix_operation_log_user_created', ('user_id', 'created_at')),
+    ('operation_log', 'ix_operation_log_created', ('created_at',)),
+)
+
+
+def upgrade(conn):
+    for table_name, index_name, columns in INDEXES:
+        create_index_if_missing(conn, table_name, index_name, columns)
@@ -0,0 +1,9 @@
+"""创建用户配额用量表并按现有隧道和流量回填"""
+from src.models.quota import UserQuotaUsage
+from src.services.migrations import create_tables
+from src.services.quota import rebuild_usage
+
+
+def upgrade(conn):
+    create_tables(conn, UserQuotaUsage)
+    rebuild_usage(conn)
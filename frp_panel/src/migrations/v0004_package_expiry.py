@@ -0,0 +1,8 @@
+"""为套餐到期扫描添加索引并创建后台任务租约表"""
+from src.models.lease import SchedulerLease
+from src.services.migrations import create_index_if_missing, create_tables
+
+
+def upgrade(conn):
+    create_index_if_missing(conn, 'user_package', 'ix_user_package_active_end', ('is_active', 'end_date'))
+    create_tables(conn, SchedulerLease)
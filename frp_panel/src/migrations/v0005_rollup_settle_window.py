@@ -0,0 +1,10 @@
+"""为流量汇总检查点添加稳定期字段"""
+from src.models.traffic import TrafficRollupCheckpoint
+from src.services.migrations import add_column_if_missing
+
+COLUMNS = ('settled_log_id', 'observed_log_id', 'observed_at')
+
+
+def upgrade(conn):
+    for name in COLUMNS:
+        add_column_if_missing(conn, 'traffic_rollup_checkpoint', TrafficRollupCheckpoint.__table__.c[name])
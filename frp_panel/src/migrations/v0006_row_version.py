@@ -0,0 +1,12 @@
+"""为隧道、节点、套餐和用户套餐添加行版本号"""
+from src.models.node import Node
+from src.models.package import Package, UserPackage
+from src.models.tunnel import Tunnel
+from src.services.migrations import add_column_if_missing
+
+MODELS = (Tunnel, Node, Package, UserPackage)
+
+
+def upgrade(conn):
+    for model in MODELS:
+        add_column_if_missing(conn, model.__tablename__, model.__table__.c.row_version)
@@ -0,0 +1,12 @@
+from datetime import datetime
+from src.models.user import db
+
+class SchedulerLease(db.Model):
+    """后台任务租约，多个工作进程中同一时间只有持有者执行该任务"""
+    name = db.Column(db.String(50), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)  # 主机名:进程ID
+    expires_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchedulerLease {self.name}:{self.owner}>'
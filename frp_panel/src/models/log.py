@@ -17,6 +17,11 @@ class OperationLog(db.Model):
     error_message = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_operation_log_user_created', 'user_id', 'created_at'),
+        db.Index('ix_operation_log_created', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<OperationLog {self.action} {self.resource_type}>'
 
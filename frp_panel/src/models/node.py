@@ -17,6 +17,8 @@ class Node(db.Model):
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 每次修改加一，与 updated_at 一起作为列表 ETag 的版本（updated_at 只精确到秒）
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # 关联用户
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -2,6 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from src.models.user import db
 
+# 套餐支付状态
+PAYMENT_PENDING = 'pending'
+PAYMENT_SUCCESS = 'success'
+
 class Package(db.Model):
     """套餐模型"""
     id = db.Column(db.Integer, primary_key=True)
@@ -20,6 +24,8 @@ class Package(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 每次修改加一，与 updated_at 一起作为列表 ETag 的版本（updated_at 只精确到秒）
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # 反向关联
     user_packages = db.relationship('UserPackage', backref='package', lazy=True)
@@ -61,11 +67,17 @@ class UserPackage(db.Model):
     # 支付信息
     payment_id = db.Column(db.String(100), nullable=True)  # 支付ID
     payment_method = db.Column(db.String(50), nullable=True)  # 支付方式
-    payment_status = db.Column(db.String(20), default='pending')  # 支付状态
+    payment_status = db.Column(db.String(20), default=PAYMENT_PENDING)  # 支付状态：pending, success
     
     # 时间戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 每次修改加一，与 updated_at 一起作为列表 ETag 的版本（updated_at 只精确到秒）
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_user_package_active_end', 'is_active', 'end_date'),
+    )
     
     def __repr__(self):
         return f'<UserPackage {self.user_id}:{self.package_id}>'
@@ -0,0 +1,31 @@
+from datetime import datetime
+from src.models.user import db
+
+class UserQuotaUsage(db.Model):
+    """用户配额用量计数（每个用户一行，随隧道增删和流量上报增量更新）"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+
+    # 当前隧道数
+    tunnel_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # 当前计费周期（自然月，UTC）及周期内已用流量（字节）
+    period_start = db.Column(db.Date, nullable=False)
+    period_traffic = db.Column(db.BigInteger, nullable=False, default=0)
+
+    # 本周期内已通知过的最高用量阈值（百分比）
+    notified_level = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserQuotaUsage {self.user_id}>'
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'tunnel_count': self.tunnel_count,
+            'period_start': self.period_start.isoformat() if self.period_start else None,
+            'period_traffic': self.period_traffic,
+            'notified_level': self.notified_level,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -15,6 +15,12 @@ class TrafficLog(db.Model):
     # 时间信息
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_traffic_log_user_tunnel_ts', 'user_id', 'tunnel_id', 'timestamp'),
+        db.Index('ix_traffic_log_user_ts', 'user_id', 'timestamp'),
+        db.Index('ix_traffic_log_timestamp', 'timestamp'),
+    )
+    
     def __repr__(self):
         return f'<TrafficLog {self.user_id}:{self.tunnel_id}>'
     
@@ -45,6 +51,7 @@ class TrafficSummary(db.Model):
     # 创建唯一索引
     __table_args__ = (
         db.UniqueConstraint('user_id', 'tunnel_id', 'date', name='uix_traffic_summary'),
+        db.Index('ix_traffic_summary_user_date', 'user_id', 'date'),
     )
     
     def __repr__(self):
@@ -60,3 +67,58 @@ class TrafficSummary(db.Model):
             'date': self.date.isoformat() if self.date else None
         }
 
+
+
+class TrafficRollup(db.Model):
+    """流量分时汇总模型（按分钟/小时/天）"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    tunnel_id = db.Column(db.Integer, db.ForeignKey('tunnel.id'), nullable=False)
+    
+    # 汇总粒度：minute, hour, day
+    resolution = db.Column(db.String(10), nullable=False)
+    
+    # 时间桶起始时间（UTC）
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    
+    # 流量数据
+    upload = db.Column(db.BigInteger, default=0)  # 上传流量（字节）
+    download = db.Column(db.BigInteger, default=0)  # 下载流量（字节）
+    
+    # 创建唯一索引
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'user_id', 'tunnel_id', 'bucket_start', name='uix_traffic_rollup'),
+        db.Index('ix_traffic_rollup_user_bucket', 'resolution', 'user_id', 'bucket_start'),
+        db.Index('ix_traffic_rollup_bucket', 'resolution', 'bucket_start'),
+    )
+    
+    def __repr__(self):
+        return f'<TrafficRollup {self.resolution}:{self.tunnel_id}:{self.bucket_start}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'tunnel_id': self.tunnel_id,
+            'resolution': self.resolution,
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'upload': self.upload,
+            'download': self.download
+        }
+
+
+class TrafficRollupCheckpoint(db.Model):
+    """流量汇总任务进度（已汇总的最大流量日志ID）"""
+    name = db.Column(db.String(50), primary_key=True)
+    last_log_id = db.Column(db.Integer, nullable=False, default=0)
+    
+    # 自增ID在插入时分配、提交后才可见，较小的ID可能晚于较大的ID提交。
+    # observed_log_id 为 observed_at 时可见的最大ID，经过稳定期后其之前的事务都已结束，
+    # 此时把它记为 settled_log_id，汇总和清理只处理不超过 settled_log_id 的日志
+    settled_log_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    observed_log_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    observed_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TrafficRollupCheckpoint {self.name}:{self.last_log_id}>'
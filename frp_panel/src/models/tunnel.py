@@ -16,6 +16,8 @@ class Tunnel(db.Model):
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 每次修改加一，与 updated_at 一起作为列表 ETag 的版本（updated_at 只精确到秒）
+    row_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # 流量统计
     bytes_in = db.Column(db.BigInteger, default=0)
@@ -24,6 +26,13 @@ class Tunnel(db.Model):
     # 关联节点和用户
     node_id = db.Column(db.Integer, db.ForeignKey('node.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_tunnel_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_tunnel_user_name', 'user_id', 'name'),
+        db.Index('ix_tunnel_node_status', 'node_id', 'status', 'type'),
+        db.Index('ix_tunnel_created', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return f'<Tunnel {self.name}>'
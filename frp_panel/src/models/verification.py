@@ -14,6 +14,10 @@ class EmailVerification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_email_verification_lookup', 'email', 'purpose', 'created_at'),
+    )
+
     def __init__(self, email, purpose, expires_in_minutes=10):
         self.email = email
         self.purpose = purpose
@@ -5,7 +5,7 @@ from datetime import datetime, timedelta
 import re
 from src.models.user import db, User
 from src.models.verification import EmailVerification
-from src.models.log import OperationLog
+from src.services.audit_log import log_operation
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -24,27 +24,6 @@ def is_valid_password(password):
         return False, "密码必须包含数字"
     return True, ""
 
-def log_operation(user_id, action, resource_type, resource_id=None, resource_name=None, 
-                 details=None, status='success', error_message=None):
-    """记录操作日志"""
-    try:
-        log = OperationLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            resource_name=resource_name,
-            details=details,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            status=status,
-            error_message=error_message
-        )
-        db.session.add(log)
-        db.session.commit()
-    except Exception as e:
-        print(f"记录日志失败: {e}")
-
 @auth_bp.route('/send-verification-code', methods=['POST'])
 def send_verification_code():
     """发送邮箱验证码"""
@@ -169,7 +148,7 @@ def login():
         
         if not user or not user.check_password(password):
             log_operation(None, 'login', 'user', None, username_or_email, 
-                         status='failed', error_message='用户名或密码错误')
+                         status='failed', error_message='用户名或密码错误', critical=True)
             return jsonify({'error': '用户名或密码错误'}), 401
         
         if not user.is_active:
@@ -1,58 +1,29 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import requests
 from datetime import datetime
-from src.models.user import db, User
+from sqlalchemy import update
+from src.models.user import db
 from src.models.node import Node
-from src.models.log import OperationLog
+from src.services.audit_log import log_operation
+from src.services.node_monitor import node_monitor, node_snapshot
+from src.services.principal import current_principal
+from src.services.conditional import conditional_get
+from src.services.response_cache import response_cache
 
 nodes_bp = Blueprint('nodes', __name__)
 
-def log_operation(user_id, action, resource_type, resource_id=None, resource_name=None, 
-                 details=None, status='success', error_message=None):
-    """记录操作日志"""
-    try:
-        log = OperationLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            resource_name=resource_name,
-            details=details,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            status=status,
-            error_message=error_message
-        )
-        db.session.add(log)
-        db.session.commit()
-    except Exception as e:
-        print(f"记录日志失败: {e}")
+def node_to_dict(node):
+    """节点信息，状态取自后台探测缓存"""
+    return with_health(node.to_dict())
 
-def check_node_status(node):
-    """检查节点状态"""
-    try:
-        if not node.dashboard_port:
-            return 'unknown'
-            
-        url = f"http://{node.host}:{node.dashboard_port}/api/serverinfo"
-        
-        # 如果有认证信息，添加基础认证
-        auth = None
-        if node.dashboard_user and node.dashboard_password:
-            auth = (node.dashboard_user, node.dashboard_password)
-            
-        response = requests.get(url, auth=auth, timeout=5)
-        
-        if response.status_code == 200:
-            return 'online'
-        else:
-            return 'error'
-            
-    except requests.exceptions.RequestException:
-        return 'offline'
-    except Exception:
-        return 'error'
+def with_health(data):
+    """在节点信息上叠加后台探测的状态"""
+    data = dict(data)
+    health = node_monitor.get(data['id'])
+    if health:
+        data['status'] = health['status']
+    data['health'] = health
+    return data
 
 @nodes_bp.route('/nodes', methods=['GET'])
 @jwt_required()
@@ -60,27 +31,30 @@ def get_nodes():
     """获取节点列表"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
-        # 所有用户都可以查看节点列表
-        nodes = Node.query.all()
+        # 所有用户都可以查看节点列表，节点信息（含隧道数）走响应缓存，状态每次取自探测缓存
+        nodes = response_cache.get_or_build('nodes', 'list', lambda: [node.to_dict() for node in Node.query.all()])
         
-        # 更新节点状态（异步处理，这里简化为同步）
-        for node in nodes:
-            old_status = node.status
-            new_status = check_node_status(node)
-            if old_status != new_status:
-                node.status = new_status
-                node.updated_at = datetime.utcnow()
+        # 节点状态由后台并发探测，缓存缺失时触发一次异步探测
+        if any(node_monitor.get(node['id']) is None for node in nodes):
+            node_monitor.refresh_async()
         
-        db.session.commit()
+        # ETag 由返回的节点信息和各节点的状态、延迟档位计算，不额外查询数据库；
+        # 状态和延迟档位未变化时返回304，客户端保留的 checked_at 和精确延迟可能是上一次探测的
+        validator = conditional_get(
+            extra=(nodes, node_monitor.health_signature(node['id'] for node in nodes)),
+            last_modified=False
+        )
+        if validator.not_modified():
+            return validator.response_304()
         
-        return jsonify({
-            'nodes': [node.to_dict() for node in nodes]
-        }), 200
+        return validator.apply(jsonify({
+            'nodes': [with_health(node) for node in nodes]
+        })), 200
         
     except Exception as e:
         return jsonify({'error': f'获取节点列表失败: {str(e)}'}), 500
@@ -91,7 +65,7 @@ def create_node():
     """创建节点"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -129,10 +103,13 @@ def create_node():
         )
         
         # 检查节点状态
-        node.status = check_node_status(node)
+        health = node_monitor.probe(node_snapshot(node))
+        node.status = health['status']
         
         db.session.add(node)
         db.session.commit()
+        response_cache.invalidate('nodes')
+        node_monitor.store(node.id, health)
         
         # 记录日志
         log_operation(user_id, 'create', 'node', node.id, node.name)
@@ -152,7 +129,7 @@ def get_node(node_id):
     """获取单个节点信息"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -163,13 +140,12 @@ def get_node(node_id):
         if not node:
             return jsonify({'error': '节点不存在'}), 404
         
-        # 更新节点状态
-        node.status = check_node_status(node)
-        node.updated_at = datetime.utcnow()
-        db.session.commit()
+        # 节点状态由后台并发探测，缓存缺失时触发一次异步探测
+        if node_monitor.get(node.id) is None:
+            node_monitor.refresh_async()
         
         return jsonify({
-            'node': node.to_dict()
+            'node': node_to_dict(node)
         }), 200
         
     except Exception as e:
@@ -181,7 +157,7 @@ def update_node(node_id):
     """更新节点"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -225,10 +201,11 @@ def update_node(node_id):
             node.description = data['description']
         
         # 更新状态
-        node.status = check_node_status(node)
+        node.status = node_monitor.check_node(node)
         node.updated_at = datetime.utcnow()
         
         db.session.commit()
+        response_cache.invalidate('nodes')
         
         # 记录日志
         log_operation(user_id, 'update', 'node', node.id, node.name)
@@ -248,7 +225,7 @@ def delete_node(node_id):
     """删除节点"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -270,6 +247,8 @@ def delete_node(node_id):
         
         db.session.delete(node)
         db.session.commit()
+        response_cache.invalidate('nodes')
+        node_monitor.forget(node_id)
         
         # 记录日志
         log_operation(user_id, 'delete', 'node', node_id, node_name)
@@ -288,7 +267,7 @@ def get_node_status(node_id):
     """获取节点详细状态信息"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -299,45 +278,24 @@ def get_node_status(node_id):
         if not node:
             return jsonify({'error': '节点不存在'}), 404
         
-        # 获取详细状态信息
-        status_info = {
-            'status': 'offline',
-            'server_info': None,
-            'proxies': [],
-            'error': None
-        }
-        
-        try:
-            if node.dashboard_port:
-                base_url = f"http://{node.host}:{node.dashboard_port}"
-                auth = None
-                if node.dashboard_user and node.dashboard_password:
-                    auth = (node.dashboard_user, node.dashboard_password)
-                
-                # 获取服务器信息
-                response = requests.get(f"{base_url}/api/serverinfo", auth=auth, timeout=5)
-                if response.status_code == 200:
-                    status_info['status'] = 'online'
-                    status_info['server_info'] = response.json()
-                
-                # 获取代理信息
-                response = requests.get(f"{base_url}/api/proxy/tcp", auth=auth, timeout=5)
-                if response.status_code == 200:
-                    status_info['proxies'].extend(response.json().get('proxies', []))
-                
-                response = requests.get(f"{base_url}/api/proxy/http", auth=auth, timeout=5)
-                if response.status_code == 200:
-                    status_info['proxies'].extend(response.json().get('proxies', []))
-                    
-        except requests.exceptions.RequestException as e:
-            status_info['error'] = str(e)
-        except Exception as e:
-            status_info['error'] = str(e)
+        snapshot = node_snapshot(node)
+        previous_status = node.status
+        
+        # 请求节点面板前归还数据库连接，面板无响应时不占用连接池
+        db.session.close()
+        
+        # 并发获取详细状态信息（短时缓存，多个请求共享同一次拉取）
+        status_info = node_monitor.get_dashboard_status(snapshot)
         
         # 更新节点状态
-        node.status = status_info['status']
-        node.updated_at = datetime.utcnow()
-        db.session.commit()
+        if previous_status != status_info['status']:
+            db.session.execute(
+                update(Node).where(Node.id == node_id).values(
+                    status=status_info['status'], updated_at=datetime.utcnow(), row_version=Node.row_version + 1
+                )
+            )
+            db.session.commit()
+            response_cache.invalidate('nodes')
         
         return jsonify(status_info), 200
         
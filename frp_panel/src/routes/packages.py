@@ -1,51 +1,31 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-from src.models.user import db, User
-from src.models.package import Package, UserPackage
-from src.models.user_group import UserGroup
-from src.models.log import OperationLog
+from src.models.user import db
+from src.models.package import Package, UserPackage, PAYMENT_PENDING, PAYMENT_SUCCESS
+from src.services.audit_log import log_operation
+from src.services.conditional import conditional_get, collection_state
+from src.services.limits import limits_resolver
+from src.services.principal import current_principal
+from src.services.response_cache import response_cache
 
 packages_bp = Blueprint('packages', __name__)
 
-def log_operation(user_id, action, resource_type, resource_id=None, resource_name=None, 
-                 details=None, status='success', error_message=None):
-    """记录操作日志"""
-    try:
-        log = OperationLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            resource_name=resource_name,
-            details=details,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            status=status,
-            error_message=error_message
-        )
-        db.session.add(log)
-        db.session.commit()
-    except Exception as e:
-        print(f"记录日志失败: {e}")
-
 @packages_bp.route('/packages', methods=['GET'])
 @jwt_required()
 def get_packages():
     """获取套餐列表"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
-        # 获取所有激活的套餐
-        packages = Package.query.filter_by(is_active=True).all()
-        
-        return jsonify({
-            'packages': [package.to_dict() for package in packages]
-        }), 200
+        # 获取所有激活的套餐，套餐变更时缓存失效
+        return response_cache.json_response('packages', 'list', lambda: {
+            'packages': [package.to_dict() for package in Package.query.filter_by(is_active=True).all()]
+        })
         
     except Exception as e:
         return jsonify({'error': f'获取套餐列表失败: {str(e)}'}), 500
@@ -56,19 +36,21 @@ def get_package(package_id):
     """获取单个套餐详情"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
-        package = Package.query.get(package_id)
+        def load():
+            package = Package.query.get(package_id)
+            return {'package': package.to_dict()} if package else None
         
-        if not package:
+        response = response_cache.json_response('packages', package_id, load)
+        
+        if response is None:
             return jsonify({'error': '套餐不存在'}), 404
         
-        return jsonify({
-            'package': package.to_dict()
-        }), 200
+        return response
         
     except Exception as e:
         return jsonify({'error': f'获取套餐详情失败: {str(e)}'}), 500
@@ -79,7 +61,7 @@ def create_package():
     """创建套餐（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -115,6 +97,7 @@ def create_package():
         
         db.session.add(package)
         db.session.commit()
+        response_cache.invalidate('packages')
         
         # 记录日志
         log_operation(user_id, 'create', 'package', package.id, package.name)
@@ -134,7 +117,7 @@ def update_package(package_id):
     """更新套餐（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -178,6 +161,7 @@ def update_package(package_id):
         
         package.updated_at = datetime.utcnow()
         db.session.commit()
+        response_cache.invalidate('packages')
         
         # 记录日志
         log_operation(user_id, 'update', 'package', package.id, package.name)
@@ -197,7 +181,7 @@ def delete_package(package_id):
     """删除套餐（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -224,6 +208,7 @@ def delete_package(package_id):
         
         db.session.delete(package)
         db.session.commit()
+        response_cache.invalidate('packages')
         
         # 记录日志
         log_operation(user_id, 'delete', 'package', package_id, package_name)
@@ -242,26 +227,32 @@ def get_user_packages():
     """获取当前用户的套餐"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
-        # 获取用户的套餐
-        user_packages = UserPackage.query.filter_by(user_id=user_id).all()
+        # 用户的套餐和套餐目录均未变化时返回304
+        validator = conditional_get(
+            *collection_state(UserPackage, UserPackage.user_id == user_id), *collection_state(Package)
+        )
+        if validator.not_modified():
+            return validator.response_304()
+        
+        # 获取用户的套餐及套餐详情（一次联表查询）
+        rows = db.session.query(UserPackage, Package).join(
+            Package, Package.id == UserPackage.package_id
+        ).filter(UserPackage.user_id == user_id).order_by(UserPackage.id).all()
         
-        # 获取套餐详情
         result = []
-        for user_package in user_packages:
-            package = Package.query.get(user_package.package_id)
-            if package:
-                data = user_package.to_dict()
-                data['package'] = package.to_dict()
-                result.append(data)
+        for user_package, package in rows:
+            data = user_package.to_dict()
+            data['package'] = package.to_dict()
+            result.append(data)
         
-        return jsonify({
+        return validator.apply(jsonify({
             'user_packages': result
-        }), 200
+        })), 200
         
     except Exception as e:
         return jsonify({'error': f'获取用户套餐失败: {str(e)}'}), 500
@@ -272,7 +263,7 @@ def purchase_package(package_id):
     """购买套餐"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -299,7 +290,7 @@ def purchase_package(package_id):
             start_date=start_date,
             end_date=end_date,
             payment_method=payment_method,
-            payment_status='pending'  # 初始状态为待支付
+            payment_status=PAYMENT_PENDING  # 初始状态为待支付
         )
         
         db.session.add(user_package)
@@ -309,30 +300,14 @@ def purchase_package(package_id):
         log_operation(user_id, 'purchase', 'package', package.id, package.name)
         
         # TODO: 集成支付系统，这里简化为直接支付成功
-        user_package.payment_status = 'success'
-        db.session.commit()
-        
-        # 查找或创建对应的用户组
-        user_group = UserGroup.query.filter_by(name=f"{package.name}组").first()
-        if not user_group:
-            user_group = UserGroup(
-                name=f"{package.name}组",
-                max_tunnels=package.max_tunnels,
-                max_traffic=package.max_traffic,
-                upload_speed_limit=package.upload_speed_limit,
-                download_speed_limit=package.download_speed_limit,
-                description=f"购买{package.name}套餐的用户组"
-            )
-            db.session.add(user_group)
-            db.session.commit()
-        
-        # 更新用户组
-        user.user_group_id = user_group.id
+        # 支付成功后套餐在有效期内自动生效，有效限制由用户组和生效中的套餐合并得出，不再修改用户组
+        user_package.payment_status = PAYMENT_SUCCESS
         db.session.commit()
         
         return jsonify({
             'message': '套餐购买成功',
-            'user_package': user_package.to_dict()
+            'user_package': user_package.to_dict(),
+            'limits': limits_resolver.get(user_id).to_dict()
         }), 201
         
     except Exception as e:
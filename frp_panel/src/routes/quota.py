@@ -0,0 +1,91 @@
+from flask import Blueprint, jsonify
+from flask_jwt_extended import jwt_required
+from src.services.limits import limits_resolver
+from src.services.principal import current_principal, load_principal
+from src.services.quota import quota_engine
+
+quota_bp = Blueprint('quota', __name__)
+
+@quota_bp.route('/user/quota', methods=['GET'])
+@jwt_required()
+def get_my_quota():
+    """获取当前用户本周期的配额用量"""
+    try:
+        user = current_principal()
+
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        return jsonify({
+            'quota': quota_engine.report(user)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取配额用量失败: {str(e)}'}), 500
+
+@quota_bp.route('/users/<int:user_id>/quota', methods=['GET'])
+@jwt_required()
+def get_user_quota(user_id):
+    """获取指定用户本周期的配额用量（仅管理员）"""
+    try:
+        user = current_principal()
+
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        # 检查权限
+        if not user.is_admin:
+            return jsonify({'error': '权限不足，只有管理员可以查看用户配额'}), 403
+
+        target = load_principal(user_id)
+        if not target:
+            return jsonify({'error': '目标用户不存在'}), 404
+
+        return jsonify({
+            'quota': quota_engine.report(target)
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取配额用量失败: {str(e)}'}), 500
+
+@quota_bp.route('/user/limits', methods=['GET'])
+@jwt_required()
+def get_my_limits():
+    """获取当前用户的有效限制（用户组与生效中的套餐合并）"""
+    try:
+        user = current_principal()
+
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        return jsonify({
+            'limits': limits_resolver.get(user.id).to_dict()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取有效限制失败: {str(e)}'}), 500
+
+@quota_bp.route('/users/<int:user_id>/limits', methods=['GET'])
+@jwt_required()
+def get_user_limits(user_id):
+    """获取指定用户的有效限制（仅管理员）"""
+    try:
+        user = current_principal()
+
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        # 检查权限
+        if not user.is_admin:
+            return jsonify({'error': '权限不足，只有管理员可以查看用户限制'}), 403
+
+        limits = limits_resolver.get(user_id)
+        if not limits:
+            return jsonify({'error': '目标用户不存在'}), 404
+
+        return jsonify({
+            'limits': limits.to_dict()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取有效限制失败: {str(e)}'}), 500
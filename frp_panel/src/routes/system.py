@@ -0,0 +1,68 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required
+from src.models.user import db
+from src.models.log import SystemLog
+from src.services.audit_log import audit_log_writer
+from src.services.db_pool import pool_stats
+from src.services.package_expiry import package_expiry_scheduler
+from src.services.principal import current_principal
+from src.services.traffic_aggregator import traffic_aggregator
+from src.services.traffic_stream import traffic_broker
+
+system_bp = Blueprint('system', __name__)
+
+@system_bp.route('/system/metrics', methods=['GET'])
+@jwt_required()
+def get_system_metrics():
+    """获取当前工作进程的运行指标（仅管理员），包括数据库连接池和后台写入队列"""
+    try:
+        user = current_principal()
+
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        # 检查权限
+        if not user.is_admin:
+            return jsonify({'error': '权限不足，只有管理员可以查看系统指标'}), 403
+
+        return jsonify({
+            'db_pool': pool_stats(db.engine),
+            'audit_log': audit_log_writer.stats(),
+            'traffic_aggregator': {
+                'enabled': traffic_aggregator.enabled,
+                'flush_count': traffic_aggregator.flush_count,
+                'dropped': traffic_aggregator.dropped
+            },
+            'traffic_stream': traffic_broker.stats(),
+            'package_expiry': package_expiry_scheduler.stats()
+        }), 200
+
+    except Exception:
+        # 异常信息可能包含数据库驱动和SQL细节，只记录到日志
+        current_app.logger.exception('获取系统指标失败')
+        return jsonify({'error': '获取系统指标失败'}), 500
+
+@system_bp.route('/system/sql-profiles', methods=['GET'])
+@jwt_required()
+def get_sql_profiles():
+    """获取最近的SQL性能分析报告（仅管理员）"""
+    try:
+        user = current_principal()
+
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        # 检查权限
+        if not user.is_admin:
+            return jsonify({'error': '权限不足，只有管理员可以查看SQL性能报告'}), 403
+
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        logs = SystemLog.query.filter_by(module='sql_profiler').order_by(SystemLog.id.desc()).limit(limit).all()
+
+        return jsonify({
+            'profiles': [log.to_dict() for log in logs]
+        }), 200
+
+    except Exception:
+        current_app.logger.exception('获取SQL性能报告失败')
+        return jsonify({'error': '获取SQL性能报告失败'}), 500
@@ -1,20 +1,41 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from datetime import datetime, timedelta, date
-from sqlalchemy import func
+from sqlalchemy import func, and_, select
 from src.models.user import db, User
 from src.models.tunnel import Tunnel
 from src.models.traffic import TrafficLog, TrafficSummary
+from src.services.traffic_ingest import MAX_BATCH_SIZE, normalize_sample, ingest_samples, parse_timestamp, \
+    record_ingest_metrics
+from src.services.traffic_rollup import RESOLUTION_SECONDS, MAX_POINTS, choose_resolution, query_history, \
+    traffic_rollup_scheduler
+from src.services.traffic_stream import traffic_broker, stream_traffic
+from src.services.traffic_export import EXPORT_FORMATS, build_export_query, stream_export
+from src.services.conditional import conditional_get, collection_state
+from src.services.principal import current_principal
 
 traffic_bp = Blueprint('traffic', __name__)
 
+def traffic_validator(user_id, extra=()):
+    """流量统计的协商缓存版本
+
+    每日汇总没有 updated_at，改用用户总流量作为版本：总流量与每日汇总在同一事务
+    （或写后缓冲的同一次刷新）中累加，总流量不变即汇总不变。隧道增删改名也会改变结果。
+    """
+    return conditional_get(
+        select(User.total_traffic).where(User.id == user_id).scalar_subquery(),
+        *collection_state(Tunnel, Tunnel.user_id == user_id),
+        extra=extra,
+        last_modified=False
+    )
+
 @traffic_bp.route('/traffic/realtime', methods=['GET'])
 @jwt_required()
 def get_realtime_traffic():
     """获取实时流量数据"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -39,13 +60,44 @@ def get_realtime_traffic():
     except Exception as e:
         return jsonify({'error': f'获取实时流量数据失败: {str(e)}'}), 500
 
+@traffic_bp.route('/traffic/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_realtime_traffic():
+    """实时流量推送（Server-Sent Events），替代轮询 /traffic/realtime
+
+    EventSource 不能设置请求头，访问令牌可通过 ?jwt=<token> 传递；断线重连时浏览器自动携带 Last-Event-ID，
+    只补发该事件之后的增量。每个连接在整个推送期间占用一个工作线程，建议使用 gevent 工作模式。
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = current_principal()
+        
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        expires_at = get_jwt().get('exp')
+        
+        # 推送期间不访问数据库，先归还连接
+        db.session.close()
+        
+        response = Response(stream_traffic(traffic_broker, user_id, last_event_id, expires_at),
+                            mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # 禁止反向代理缓冲事件
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': f'订阅实时流量失败: {str(e)}'}), 500
+
 @traffic_bp.route('/traffic/daily', methods=['GET'])
 @jwt_required()
 def get_daily_traffic():
     """获取每日流量统计"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -61,6 +113,11 @@ def get_daily_traffic():
         # 计算开始日期
         start_date = date.today() - timedelta(days=days-1)
         
+        # 没有新的流量、隧道也未变化时返回304（结果随日期变化，日期计入 ETag）
+        validator = traffic_validator(user_id, extra=(start_date,))
+        if validator.not_modified():
+            return validator.response_304()
+        
         # 构建查询条件
         query = TrafficSummary.query.filter_by(user_id=user_id)
         
@@ -70,120 +127,243 @@ def get_daily_traffic():
         # 获取日期范围内的数据
         summaries = query.filter(TrafficSummary.date >= start_date).order_by(TrafficSummary.date).all()
         
-        return jsonify({
+        return validator.apply(jsonify({
             'traffic_summaries': [summary.to_dict() for summary in summaries]
-        }), 200
+        })), 200
         
     except Exception as e:
         return jsonify({'error': f'获取每日流量统计失败: {str(e)}'}), 500
 
+@traffic_bp.route('/traffic/history', methods=['GET'])
+@jwt_required()
+def get_traffic_history():
+    """获取流量时间序列（自动选择分钟/小时/天汇总粒度）"""
+    try:
+        user_id = get_jwt_identity()
+        user = current_principal()
+        
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+        
+        # 获取参数
+        tunnel_id = request.args.get('tunnel_id', type=int)
+        resolution = request.args.get('resolution', 'auto')
+        
+        try:
+            end = parse_timestamp(request.args.get('end'))
+            start = parse_timestamp(request.args.get('start')) if request.args.get('start') \
+                else end - timedelta(days=1)
+        except (TypeError, ValueError, OverflowError, OSError):
+            return jsonify({'error': '时间格式错误'}), 400
+        
+        if start >= end:
+            return jsonify({'error': '开始时间必须早于结束时间'}), 400
+        
+        if resolution == 'auto':
+            resolution = choose_resolution(start, end, traffic_rollup_scheduler.retention_days)
+        elif resolution not in RESOLUTION_SECONDS:
+            return jsonify({'error': f'汇总粒度必须是: auto, {", ".join(RESOLUTION_SECONDS)}'}), 400
+        
+        # 限制最大时间桶数量
+        if (end - start).total_seconds() / RESOLUTION_SECONDS[resolution] > MAX_POINTS:
+            return jsonify({'error': f'查询范围过大，单次最多返回 {MAX_POINTS} 个时间点'}), 400
+        
+        series = query_history(user_id, start, end, resolution, tunnel_id)
+        
+        return jsonify({
+            'resolution': resolution,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'series': series
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取流量历史数据失败: {str(e)}'}), 500
+
 @traffic_bp.route('/traffic/summary', methods=['GET'])
 @jwt_required()
 def get_traffic_summary():
     """获取流量汇总统计"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
+        # 获取参数
+        top_n = request.args.get('top_n', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        
+        try:
+            start_date = date.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+            end_date = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+        except ValueError:
+            return jsonify({'error': '日期格式错误，应为 YYYY-MM-DD'}), 400
+        
+        if (top_n is not None and top_n <= 0) or offset < 0:
+            return jsonify({'error': 'top_n 和 offset 参数无效'}), 400
+        
+        # 没有新的流量、隧道也未变化时返回304
+        validator = traffic_validator(user_id)
+        if validator.not_modified():
+            return validator.response_304()
+        
+        # 构建汇总过滤条件
+        summary_filters = [TrafficSummary.user_id == user_id]
+        if start_date:
+            summary_filters.append(TrafficSummary.date >= start_date)
+        if end_date:
+            summary_filters.append(TrafficSummary.date <= end_date)
+        
         # 获取用户所有隧道的总流量
-        total_upload = db.session.query(func.sum(TrafficSummary.upload)).filter_by(user_id=user_id).scalar() or 0
-        total_download = db.session.query(func.sum(TrafficSummary.download)).filter_by(user_id=user_id).scalar() or 0
-        
-        # 获取用户所有隧道
-        tunnels = Tunnel.query.filter_by(user_id=user_id).all()
-        
-        # 获取每个隧道的流量统计
-        tunnel_stats = []
-        for tunnel in tunnels:
-            tunnel_upload = db.session.query(func.sum(TrafficSummary.upload)).filter_by(
-                user_id=user_id, tunnel_id=tunnel.id).scalar() or 0
-            tunnel_download = db.session.query(func.sum(TrafficSummary.download)).filter_by(
-                user_id=user_id, tunnel_id=tunnel.id).scalar() or 0
-            
-            tunnel_stats.append({
-                'tunnel_id': tunnel.id,
-                'tunnel_name': tunnel.name,
-                'upload': tunnel_upload,
-                'download': tunnel_download,
-                'total': tunnel_upload + tunnel_download
-            })
-        
-        # 按总流量排序
-        tunnel_stats.sort(key=lambda x: x['total'], reverse=True)
+        total_upload, total_download = db.session.query(
+            func.coalesce(func.sum(TrafficSummary.upload), 0),
+            func.coalesce(func.sum(TrafficSummary.download), 0)
+        ).filter(*summary_filters).one()
+        total_upload = int(total_upload)
+        total_download = int(total_download)
+        
+        # 一次分组聚合获取每个隧道的流量统计，并在数据库中按总流量排序
+        tunnel_upload = func.coalesce(func.sum(TrafficSummary.upload), 0)
+        tunnel_download = func.coalesce(func.sum(TrafficSummary.download), 0)
+        query = db.session.query(
+            Tunnel.id,
+            Tunnel.name,
+            tunnel_upload,
+            tunnel_download
+        ).outerjoin(
+            TrafficSummary,
+            and_(TrafficSummary.tunnel_id == Tunnel.id, *summary_filters)
+        ).filter(
+            Tunnel.user_id == user_id
+        ).group_by(
+            Tunnel.id, Tunnel.name
+        ).order_by(
+            (tunnel_upload + tunnel_download).desc(), Tunnel.id
+        )
         
-        return jsonify({
+        if top_n:
+            query = query.limit(top_n).offset(offset)
+        
+        tunnel_stats = [{
+            'tunnel_id': tunnel_id,
+            'tunnel_name': tunnel_name,
+            'upload': int(upload),
+            'download': int(download),
+            'total': int(upload) + int(download)
+        } for tunnel_id, tunnel_name, upload, download in query]
+        
+        result = {
             'total_upload': total_upload,
             'total_download': total_download,
             'total': total_upload + total_download,
             'tunnel_stats': tunnel_stats
-        }), 200
+        }
+        
+        # 分页时返回隧道总数
+        if top_n:
+            result['tunnel_count'] = db.session.query(func.count(Tunnel.id)).filter(
+                Tunnel.user_id == user_id).scalar()
+        
+        return validator.apply(jsonify(result)), 200
         
     except Exception as e:
         return jsonify({'error': f'获取流量汇总统计失败: {str(e)}'}), 500
 
+@traffic_bp.route('/traffic/export', methods=['GET'])
+@jwt_required()
+def export_traffic():
+    """流式导出流量数据（NDJSON 或 CSV），用于计费对账
+
+    参数：type=logs|summary，format=ndjson|csv，tunnel_id，start_date/end_date（YYYY-MM-DD，包含当天），
+    管理员可用 user_id 导出指定用户，不指定时导出所有用户。
+    原始日志超过 TRAFFIC_RAW_RETENTION_DAYS 后会被清理，type=logs 的 start_date 早于完整保留的最早日期时返回400，
+    更早的范围请使用 type=summary；不指定 start_date 时只包含仍保留的原始日志。
+    """
+    try:
+        user_id = get_jwt_identity()
+        user = current_principal()
+        
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+        
+        # 获取参数
+        kind = request.args.get('type', 'summary')
+        fmt = request.args.get('format', 'ndjson')
+        tunnel_id = request.args.get('tunnel_id', type=int)
+        
+        if kind not in ('logs', 'summary'):
+            return jsonify({'error': 'type 必须是: logs, summary'}), 400
+        
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': f'format 必须是: {", ".join(EXPORT_FORMATS)}'}), 400
+        
+        try:
+            start_date = date.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+            end_date = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+        except ValueError:
+            return jsonify({'error': '日期格式错误，应为 YYYY-MM-DD'}), 400
+        
+        # 已清理的原始日志无法导出，避免对账时得到不完整的文件
+        if kind == 'logs' and start_date:
+            earliest = traffic_rollup_scheduler.raw_log_start_date()
+            if earliest and start_date < earliest:
+                return jsonify({
+                    'error': f'原始流量日志只保留 {earliest.isoformat()} 及之后的数据，更早的范围请使用 type=summary 导出每日汇总',
+                    'earliest_date': earliest.isoformat()
+                }), 400
+        
+        # 管理员可以导出任意用户，普通用户只能导出自己的流量
+        export_user_id = user_id
+        if user.is_admin:
+            export_user_id = request.args.get('user_id', type=int)
+        
+        stmt, columns = build_export_query(kind, export_user_id, tunnel_id, start_date, end_date)
+        
+        # 导出使用独立连接，先归还请求会话占用的连接
+        engine = db.engine
+        db.session.close()
+        
+        filename = f"traffic_{kind}_{start_date or 'all'}_{end_date or datetime.utcnow().date()}.{fmt}"
+        response = Response(stream_export(engine, stmt, columns, fmt), content_type=EXPORT_FORMATS[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # 禁止反向代理缓冲整个响应
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': f'导出流量数据失败: {str(e)}'}), 500
+
 @traffic_bp.route('/traffic/log', methods=['POST'])
 @jwt_required()
 def log_traffic():
     """记录流量数据（内部API，由frpc客户端调用）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
         data = request.get_json()
         
-        # 验证必需字段
-        required_fields = ['tunnel_id', 'upload', 'download']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'{field} 不能为空'}), 400
-        
-        # 验证隧道是否存在且属于当前用户
-        tunnel = Tunnel.query.filter_by(id=data['tunnel_id'], user_id=user_id).first()
-        if not tunnel:
+        # 验证字段
+        sample, error = normalize_sample(data)
+        if error:
+            record_ingest_metrics('log', rejected=1)
+            return jsonify({'error': error}), 400
+        
+        # 验证隧道归属并写入流量数据
+        accepted, _ = ingest_samples(user_id, [sample])
+        if not accepted:
+            db.session.rollback()
+            record_ingest_metrics('log', denied=1)
             return jsonify({'error': '隧道不存在或无权限'}), 404
         
-        # 创建流量日志
-        traffic_log = TrafficLog(
-            user_id=user_id,
-            tunnel_id=data['tunnel_id'],
-            upload=data['upload'],
-            download=data['download'],
-            timestamp=datetime.utcnow()
-        )
-        
-        db.session.add(traffic_log)
-        
-        # 更新用户总流量
-        user.total_traffic += data['upload'] + data['download']
-        
-        # 更新或创建每日流量汇总
-        today = date.today()
-        summary = TrafficSummary.query.filter_by(
-            user_id=user_id,
-            tunnel_id=data['tunnel_id'],
-            date=today
-        ).first()
-        
-        if summary:
-            summary.upload += data['upload']
-            summary.download += data['download']
-        else:
-            summary = TrafficSummary(
-                user_id=user_id,
-                tunnel_id=data['tunnel_id'],
-                upload=data['upload'],
-                download=data['download'],
-                date=today
-            )
-            db.session.add(summary)
-        
         db.session.commit()
+        record_ingest_metrics('log', accepted=1)
+        traffic_broker.publish(user_id, accepted)
         
         return jsonify({
             'message': '流量数据记录成功'
@@ -193,3 +373,61 @@ def log_traffic():
         db.session.rollback()
         return jsonify({'error': f'记录流量数据失败: {str(e)}'}), 500
 
+@traffic_bp.route('/traffic/log/batch', methods=['POST'])
+@jwt_required()
+def log_traffic_batch():
+    """批量记录流量数据（内部API，由frpc客户端调用）"""
+    try:
+        user_id = get_jwt_identity()
+        user = current_principal()
+        
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+        
+        data = request.get_json() or {}
+        records = data.get('samples')
+        
+        if not isinstance(records, list) or not records:
+            return jsonify({'error': 'samples 不能为空'}), 400
+        
+        if len(records) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'单次最多上报 {MAX_BATCH_SIZE} 条流量数据'}), 400
+        
+        # 逐条校验格式，记录无效样本
+        samples = []
+        indexes = []
+        rejected = []
+        for index, record in enumerate(records):
+            sample, error = normalize_sample(record)
+            if error:
+                rejected.append({'index': index, 'error': error})
+            else:
+                samples.append(sample)
+                indexes.append(index)
+        
+        # 在同一事务内校验归属并写入
+        accepted, denied = ingest_samples(user_id, samples)
+        db.session.commit()
+        record_ingest_metrics('batch', accepted=len(accepted), rejected=len(rejected),
+                              denied=len(samples) - len(accepted))
+        traffic_broker.publish(user_id, accepted)
+        
+        for index, sample in zip(indexes, samples):
+            if sample['tunnel_id'] in denied:
+                rejected.append({
+                    'index': index,
+                    'tunnel_id': sample['tunnel_id'],
+                    'error': '隧道不存在或无权限'
+                })
+        rejected.sort(key=lambda x: x['index'])
+        
+        return jsonify({
+            'message': f'流量数据批量记录完成，成功: {len(accepted)}，失败: {len(rejected)}',
+            'accepted_count': len(accepted),
+            'rejected_count': len(rejected),
+            'rejected': rejected
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'批量记录流量数据失败: {str(e)}'}), 500
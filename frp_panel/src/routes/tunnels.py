@@ -2,33 +2,26 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import json
 from datetime import datetime
-from src.models.user import db, User
+from sqlalchemy import func, update, delete
+from src.models.user import db
 from src.models.node import Node
 from src.models.tunnel import Tunnel
-from src.models.log import OperationLog
+from src.services.audit_log import log_operation, log_operations, build_log_entry
+from src.services.batching import chunked
+from src.services.conditional import conditional_get, collection_state
+from src.services.pagination import MAX_PAGE_SIZE, encode_cursor, decode_cursor, keyset_after, estimate_table_rows
+from src.services.principal import current_principal
+from src.services.quota import quota_engine, QuotaExceeded
+from src.services.response_cache import response_cache
 
 tunnels_bp = Blueprint('tunnels', __name__)
 
-def log_operation(user_id, action, resource_type, resource_id=None, resource_name=None, 
-                 details=None, status='success', error_message=None):
-    """记录操作日志"""
-    try:
-        log = OperationLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            resource_name=resource_name,
-            details=details,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            status=status,
-            error_message=error_message
-        )
-        db.session.add(log)
-        db.session.commit()
-    except Exception as e:
-        print(f"记录日志失败: {e}")
+# 隧道列表可投影的字段（与 Tunnel.to_dict 一致）
+TUNNEL_FIELDS = (
+    'id', 'name', 'type', 'local_ip', 'local_port', 'remote_port', 'custom_domains',
+    'subdomain', 'status', 'description', 'bytes_in', 'bytes_out', 'created_at',
+    'updated_at', 'node_id', 'user_id'
+)
 
 @tunnels_bp.route('/tunnels', methods=['GET'])
 @jwt_required()
@@ -36,53 +29,131 @@ def get_tunnels():
     """获取隧道列表"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
+        # 普通用户的隧道及节点均未变化时返回304；管理员查看全部隧道时聚合代价较高，不做协商缓存
+        validator = None
+        if not user.is_admin:
+            validator = conditional_get(*collection_state(Tunnel, Tunnel.user_id == user_id), *collection_state(Node))
+            if validator.not_modified():
+                return validator.response_304()
+        
         # 获取查询参数
         node_id = request.args.get('node_id', type=int)
         tunnel_type = request.args.get('type')
         status = request.args.get('status')
-        
-        # 构建查询
-        query = Tunnel.query
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        fields = request.args.get('fields')
+        
+        # 字段投影，只查询需要的列
+        if fields:
+            selected = [f.strip() for f in fields.split(',') if f.strip()]
+            invalid = [f for f in selected if f not in TUNNEL_FIELDS]
+            if invalid:
+                return jsonify({'error': f'无效的字段: {", ".join(invalid)}'}), 400
+        else:
+            selected = list(TUNNEL_FIELDS)
+        
+        columns = [getattr(Tunnel, f) for f in selected]
+        if 'node_id' not in selected:
+            columns.append(Tunnel.node_id)
+        
+        # 连接查询节点列，避免逐行加载节点
+        query = db.session.query(
+            Tunnel.id.label('_id'),
+            Tunnel.created_at.label('_created_at'),
+            *columns,
+            Node.name.label('_node_name'),
+            Node.host.label('_node_host'),
+            Node.status.label('_node_status')
+        ).outerjoin(Node, Node.id == Tunnel.node_id)
         
         # 管理员可以查看所有隧道，普通用户只能查看自己的隧道
+        filters = []
         if not user.is_admin:
-            query = query.filter_by(user_id=user_id)
+            filters.append(Tunnel.user_id == user_id)
         
         # 按节点过滤
         if node_id:
-            query = query.filter_by(node_id=node_id)
+            filters.append(Tunnel.node_id == node_id)
         
         # 按类型过滤
         if tunnel_type:
-            query = query.filter_by(type=tunnel_type)
+            filters.append(Tunnel.type == tunnel_type)
         
         # 按状态过滤
         if status:
-            query = query.filter_by(status=status)
+            filters.append(Tunnel.status == status)
         
-        tunnels = query.order_by(Tunnel.created_at.desc()).all()
+        query = query.filter(*filters)
         
-        # 包含节点信息
+        # 游标分页（按 created_at, id 倒序）
+        paginate = limit is not None or cursor is not None
+        total = None
+        total_is_estimate = False
+        if paginate:
+            limit = min(max(limit or 50, 1), MAX_PAGE_SIZE)
+            
+            if cursor:
+                try:
+                    cursor_created_at, cursor_id, total = decode_cursor(cursor)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                query = query.filter(keyset_after(Tunnel.created_at, Tunnel.id, cursor_created_at, cursor_id))
+            
+            # 总数只在首页计算一次，随游标传递到后续页面
+            if total is None:
+                if not filters:
+                    total = estimate_table_rows(Tunnel.__tablename__)
+                    total_is_estimate = total is not None
+                if total is None:
+                    total = db.session.query(func.count(Tunnel.id)).filter(*filters).scalar()
+        
+        query = query.order_by(Tunnel.created_at.desc(), Tunnel.id.desc())
+        rows = query.limit(limit + 1).all() if paginate else query.all()
+        
+        has_more = paginate and len(rows) > limit
+        if has_more:
+            rows = rows[:limit]
+        
+        # 组装结果
         result = []
-        for tunnel in tunnels:
-            tunnel_dict = tunnel.to_dict()
-            if tunnel.node:
+        for row in rows:
+            tunnel_dict = {}
+            for field in selected:
+                value = getattr(row, field)
+                tunnel_dict[field] = value.isoformat() if isinstance(value, datetime) else value
+            if row._node_name is not None:
                 tunnel_dict['node'] = {
-                    'id': tunnel.node.id,
-                    'name': tunnel.node.name,
-                    'host': tunnel.node.host,
-                    'status': tunnel.node.status
+                    'id': row.node_id,
+                    'name': row._node_name,
+                    'host': row._node_host,
+                    'status': row._node_status
                 }
             result.append(tunnel_dict)
         
-        return jsonify({
-            'tunnels': result
-        }), 200
+        if not paginate:
+            response = jsonify({
+                'tunnels': result
+            })
+        else:
+            next_cursor = None
+            if has_more:
+                next_cursor = encode_cursor(rows[-1]._created_at, rows[-1]._id, total)
+            
+            response = jsonify({
+                'tunnels': result,
+                'next_cursor': next_cursor,
+                'has_more': has_more,
+                'total': total,
+                'total_is_estimate': total_is_estimate
+            })
+        
+        return (validator.apply(response) if validator else response), 200
         
     except Exception as e:
         return jsonify({'error': f'获取隧道列表失败: {str(e)}'}), 500
@@ -93,6 +164,11 @@ def create_tunnel():
     """创建隧道"""
     try:
         user_id = get_jwt_identity()
+        user = current_principal()
+        
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+        
         data = request.get_json()
         
         # 验证必需字段
@@ -142,8 +218,16 @@ def create_tunnel():
             user_id=user_id
         )
         
+        # 占用隧道名额，与创建在同一事务内，创建失败回滚时名额一并归还
+        try:
+            quota_engine.acquire_tunnels(user_id, quota_engine.limit_for(user, 'tunnels'))
+        except QuotaExceeded as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 403
+        
         db.session.add(tunnel)
         db.session.commit()
+        response_cache.invalidate('nodes')
         
         # 记录日志
         log_operation(user_id, 'create', 'tunnel', tunnel.id, tunnel.name)
@@ -163,7 +247,7 @@ def get_tunnel(tunnel_id):
     """获取单个隧道信息"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -194,7 +278,7 @@ def update_tunnel(tunnel_id):
     """更新隧道"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -271,7 +355,7 @@ def delete_tunnel(tunnel_id):
     """删除隧道"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -287,8 +371,10 @@ def delete_tunnel(tunnel_id):
         
         tunnel_name = tunnel.name
         
+        quota_engine.release_tunnels({tunnel.user_id: 1})
         db.session.delete(tunnel)
         db.session.commit()
+        response_cache.invalidate('nodes')
         
         # 记录日志
         log_operation(user_id, 'delete', 'tunnel', tunnel_id, tunnel_name)
@@ -307,7 +393,7 @@ def start_tunnel(tunnel_id):
     """启动隧道"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -321,6 +407,12 @@ def start_tunnel(tunnel_id):
         if not tunnel:
             return jsonify({'error': '隧道不存在'}), 404
         
+        # 本周期流量用完时不允许启动
+        try:
+            quota_engine.check_traffic(user_id, quota_engine.limit_for(user, 'traffic'))
+        except QuotaExceeded as e:
+            return jsonify({'error': str(e)}), 403
+        
         # TODO: 实现实际的隧道启动逻辑
         # 这里需要与frpc进行交互，启动对应的代理
         
@@ -346,7 +438,7 @@ def stop_tunnel(tunnel_id):
     """停止隧道"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -385,7 +477,7 @@ def batch_operation():
     """批量操作隧道"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -400,47 +492,72 @@ def batch_operation():
         if operation not in ['start', 'stop', 'delete']:
             return jsonify({'error': '无效的操作类型'}), 400
         
-        # 查找隧道
-        if user.is_admin:
-            tunnels = Tunnel.query.filter(Tunnel.id.in_(tunnel_ids)).all()
-        else:
-            tunnels = Tunnel.query.filter(
-                Tunnel.id.in_(tunnel_ids),
-                Tunnel.user_id == user_id
-            ).all()
+        try:
+            # 去重并保持顺序
+            tunnel_ids = list(dict.fromkeys(int(tunnel_id) for tunnel_id in tunnel_ids))
+        except (TypeError, ValueError):
+            return jsonify({'error': '隧道ID格式错误'}), 400
         
-        if not tunnels:
-            return jsonify({'error': '未找到可操作的隧道'}), 404
+        if operation == 'start':
+            try:
+                quota_engine.check_traffic(user_id, quota_engine.limit_for(user, 'traffic'))
+            except QuotaExceeded as e:
+                return jsonify({'error': str(e)}), 403
+        
+        now = datetime.utcnow()
+        outcomes = {tunnel_id: 'not_found' for tunnel_id in tunnel_ids}
+        log_entries = []
+        released = {}
+        
+        # 分批执行集合操作，所有批次在同一事务内完成
+        for chunk in chunked(tunnel_ids):
+            # 管理员可以操作所有隧道，普通用户只能操作自己的隧道
+            scope = [Tunnel.id.in_(chunk)]
+            if not user.is_admin:
+                scope.append(Tunnel.user_id == user_id)
+            
+            found = db.session.query(Tunnel.id, Tunnel.name, Tunnel.user_id).filter(*scope).all()
+            if not found:
+                continue
+            
+            found_ids = [row.id for row in found]
+            scope.append(Tunnel.id.in_(found_ids))
+            if operation == 'delete':
+                for row in found:
+                    released[row.user_id] = released.get(row.user_id, 0) + 1
+                stmt = delete(Tunnel).where(*scope)
+            else:
+                stmt = update(Tunnel).where(*scope).values(
+                    status='running' if operation == 'start' else 'stopped',
+                    updated_at=now,
+                    row_version=Tunnel.row_version + 1
+                )
+            db.session.execute(stmt.execution_options(synchronize_session=False))
+            
+            for row in found:
+                outcomes[row.id] = 'success'
+                log_entries.append(build_log_entry(user_id, operation, 'tunnel', row.id, row.name))
         
-        success_count = 0
-        failed_count = 0
+        success_count = sum(1 for outcome in outcomes.values() if outcome == 'success')
+        failed_count = len(outcomes) - success_count
         
-        for tunnel in tunnels:
-            try:
-                if operation == 'start':
-                    tunnel.status = 'running'
-                elif operation == 'stop':
-                    tunnel.status = 'stopped'
-                elif operation == 'delete':
-                    db.session.delete(tunnel)
-                
-                tunnel.updated_at = datetime.utcnow()
-                
-                # 记录日志
-                log_operation(user_id, operation, 'tunnel', tunnel.id, tunnel.name)
-                
-                success_count += 1
-                
-            except Exception as e:
-                failed_count += 1
-                print(f"批量操作失败: {e}")
+        if not success_count:
+            db.session.rollback()
+            return jsonify({'error': '未找到可操作的隧道'}), 404
         
+        quota_engine.release_tunnels(released)
         db.session.commit()
+        if operation == 'delete':
+            response_cache.invalidate('nodes')
+        
+        # 批量记录日志
+        log_operations(log_entries)
         
         return jsonify({
             'message': f'批量操作完成，成功: {success_count}，失败: {failed_count}',
             'success_count': success_count,
-            'failed_count': failed_count
+            'failed_count': failed_count,
+            'results': [{'tunnel_id': tunnel_id, 'status': outcome} for tunnel_id, outcome in outcomes.items()]
         }), 200
         
     except Exception as e:
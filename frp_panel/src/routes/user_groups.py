@@ -3,38 +3,19 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from src.models.user import db, User
 from src.models.user_group import UserGroup
-from src.models.log import OperationLog
+from src.services.audit_log import log_operation
+from src.services.principal import current_principal
+from src.services.response_cache import response_cache
 
 user_groups_bp = Blueprint('user_groups', __name__)
 
-def log_operation(user_id, action, resource_type, resource_id=None, resource_name=None, 
-                 details=None, status='success', error_message=None):
-    """记录操作日志"""
-    try:
-        log = OperationLog(
-            user_id=user_id,
-            action=action,
-            resource_type=resource_type,
-            resource_id=resource_id,
-            resource_name=resource_name,
-            details=details,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent'),
-            status=status,
-            error_message=error_message
-        )
-        db.session.add(log)
-        db.session.commit()
-    except Exception as e:
-        print(f"记录日志失败: {e}")
-
 @user_groups_bp.route('/user-groups', methods=['GET'])
 @jwt_required()
 def get_user_groups():
     """获取用户组列表（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -43,11 +24,10 @@ def get_user_groups():
         if not user.is_admin:
             return jsonify({'error': '权限不足，只有管理员可以查看所有用户组'}), 403
         
-        user_groups = UserGroup.query.all()
-        
-        return jsonify({
-            'user_groups': [group.to_dict() for group in user_groups]
-        }), 200
+        # 用户组变更时缓存失效
+        return response_cache.json_response('user_groups', 'list', lambda: {
+            'user_groups': [group.to_dict() for group in UserGroup.query.all()]
+        })
         
     except Exception as e:
         return jsonify({'error': f'获取用户组列表失败: {str(e)}'}), 500
@@ -58,7 +38,7 @@ def get_user_group(group_id):
     """获取单个用户组详情（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -85,7 +65,7 @@ def create_user_group():
     """创建用户组（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -124,6 +104,7 @@ def create_user_group():
         
         db.session.add(user_group)
         db.session.commit()
+        response_cache.invalidate('user_groups')
         
         # 记录日志
         log_operation(user_id, 'create', 'user_group', user_group.id, user_group.name)
@@ -143,7 +124,7 @@ def update_user_group(group_id):
     """更新用户组（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -191,6 +172,7 @@ def update_user_group(group_id):
         
         user_group.updated_at = datetime.utcnow()
         db.session.commit()
+        response_cache.invalidate('user_groups')
         
         # 记录日志
         log_operation(user_id, 'update', 'user_group', user_group.id, user_group.name)
@@ -210,7 +192,7 @@ def delete_user_group(group_id):
     """删除用户组（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -238,6 +220,7 @@ def delete_user_group(group_id):
         
         db.session.delete(user_group)
         db.session.commit()
+        response_cache.invalidate('user_groups')
         
         # 记录日志
         log_operation(user_id, 'delete', 'user_group', group_id, group_name)
@@ -256,7 +239,7 @@ def get_users_in_group(group_id):
     """获取用户组中的用户列表（仅管理员）"""
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_principal()
         
         if not user:
             return jsonify({'error': '用户不存在'}), 404
@@ -286,7 +269,7 @@ def assign_user_to_group(user_id):
     """将用户分配到用户组（仅管理员）"""
     try:
         admin_id = get_jwt_identity()
-        admin = User.query.get(admin_id)
+        admin = current_principal()
         
         if not admin:
             return jsonify({'error': '用户不存在'}), 404
@@ -0,0 +1,175 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import request, has_request_context
+from sqlalchemy import insert
+from src.models.user import db
+from src.models.log import OperationLog
+
+
+def build_log_entry(user_id, action, resource_type, resource_id=None, resource_name=None,
+                    details=None, status='success', error_message=None):
+    """构造操作日志记录，请求信息在调用时采集"""
+    entry = {
+        'user_id': user_id,
+        'action': action,
+        'resource_type': resource_type,
+        'resource_id': resource_id,
+        'resource_name': resource_name,
+        'details': details,
+        'ip_address': None,
+        'user_agent': None,
+        'status': status,
+        'error_message': error_message,
+        'created_at': datetime.utcnow()
+    }
+    if has_request_context():
+        entry['ip_address'] = request.remote_addr
+        entry['user_agent'] = request.headers.get('User-Agent')
+    return entry
+
+
+class AuditLogWriter:
+    """操作日志异步批量写入
+
+    日志先进入有界队列，由后台线程批量插入数据库，请求无需为审计日志额外提交事务。
+    队列满时短暂等待（背压，每次提交合计最多 put_timeout 秒），仍无法入队的日志丢弃并计数；
+    关键事件同步写入。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.put_timeout = 0.05
+        self.dropped = 0
+        self.written = 0
+        self._app = None
+        # 计数在请求线程和写入线程中都会更新
+        self._counter_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=10000)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_LOG_ASYNC', True)
+        app.config.setdefault('AUDIT_LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('AUDIT_LOG_BATCH_SIZE', 500)
+        app.config.setdefault('AUDIT_LOG_FLUSH_INTERVAL', 1.0)
+
+        self._app = app
+        self.enabled = bool(app.config['AUDIT_LOG_ASYNC'])
+        self.batch_size = max(1, int(app.config['AUDIT_LOG_BATCH_SIZE']))
+        self.flush_interval = float(app.config['AUDIT_LOG_FLUSH_INTERVAL'])
+        self._queue = queue.Queue(maxsize=max(1, int(app.config['AUDIT_LOG_QUEUE_SIZE'])))
+        app.extensions['audit_log'] = self
+
+    def start(self):
+        """启动后台写入线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """停止后台线程并写入队列中剩余的日志"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._drain()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    def submit(self, entries, critical=False):
+        """提交日志记录，关键事件或后台线程未运行时同步写入"""
+        if critical or not self.running:
+            self.write(entries)
+            return
+
+        # 整批共用一个等待期限，批量操作不会按条数成倍阻塞请求
+        deadline = time.monotonic() + self.put_timeout
+        for index, entry in enumerate(entries):
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._queue.put(entry, timeout=remaining)
+                else:
+                    self._queue.put_nowait(entry)
+            except queue.Full:
+                self._count(dropped=len(entries) - index)
+                return
+
+    def _count(self, written=0, dropped=0):
+        with self._counter_lock:
+            self.written += written
+            self.dropped += dropped
+
+    def write(self, entries):
+        """使用独立连接批量写入，不影响调用方会话中的事务"""
+        if not entries:
+            return
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(OperationLog.__table__), entries)
+            self._count(written=len(entries))
+        except Exception:
+            self._count(dropped=len(entries))
+            self._app.logger.exception('记录日志失败')
+
+    def _take_batch(self, timeout):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._take_batch(self.flush_interval)
+            if batch:
+                with self._app.app_context():
+                    self.write(batch)
+
+    def _drain(self):
+        while True:
+            batch = self._take_batch(0)
+            if not batch:
+                break
+            with self._app.app_context():
+                self.write(batch)
+
+    def stats(self):
+        with self._counter_lock:
+            written, dropped = self.written, self.dropped
+        return {
+            'queued': self._queue.qsize(),
+            'capacity': self._queue.maxsize,
+            'written': written,
+            'dropped': dropped
+        }
+
+
+audit_log_writer = AuditLogWriter()
+
+
+def log_operation(user_id, action, resource_type, resource_id=None, resource_name=None,
+                  details=None, status='success', error_message=None, critical=False):
+    """记录操作日志"""
+    audit_log_writer.submit([build_log_entry(
+        user_id, action, resource_type, resource_id, resource_name,
+        details, status, error_message
+    )], critical=critical)
+
+
+def log_operations(entries, critical=False):
+    """批量记录操作日志，entries 由 build_log_entry 构造"""
+    audit_log_writer.submit(entries, critical=critical)
@@ -0,0 +1,8 @@
+# IN 子句中的最大ID数量，避免超出数据库的参数数量限制
+IN_CLAUSE_CHUNK_SIZE = 500
+
+
+def chunked(items, size=IN_CLAUSE_CHUNK_SIZE):
+    """将列表按固定大小切分"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
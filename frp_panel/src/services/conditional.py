@@ -0,0 +1,107 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from flask import Response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import object_session
+from src.models.user import db
+
+
+def collection_state(model, *criteria):
+    """集合的版本列：(行数, 最大ID, row_version 之和, 最大 updated_at)，以一个标量子查询各自返回，
+    多个集合可在一次查询中取得；model 需要有 row_version 列
+
+    updated_at 只精确到秒，同一秒内的多次修改不会改变它，因此另外比较：行数和最大ID发现新增和删除，
+    row_version 之和在每次修改时严格递增。最大 updated_at 用于 Last-Modified。
+    """
+    return (
+        select(func.count()).select_from(model).where(*criteria).scalar_subquery(),
+        select(func.max(model.id)).where(*criteria).scalar_subquery(),
+        select(func.coalesce(func.sum(model.row_version), 0)).where(*criteria).scalar_subquery(),
+        select(func.max(model.updated_at)).where(*criteria).scalar_subquery()
+    )
+
+
+@event.listens_for(db.Model, 'before_update', propagate=True)
+def _bump_row_version(mapper, connection, target):
+    """通过ORM修改带 row_version 列的行时版本号加一；集合更新语句需要自行设置 row_version"""
+    if 'row_version' not in mapper.columns:
+        return
+    session = object_session(target)
+    if session is not None and not session.is_modified(target, include_collections=False):
+        return
+    target.row_version = mapper.columns['row_version'] + 1
+
+
+def cache_headers(response, etag=None, last_modified=None):
+    """设置协商缓存相关的响应头；需要登录的接口不允许共享缓存，客户端每次都要重新验证"""
+    if etag:
+        response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def is_not_modified(etag=None, last_modified=None):
+    """请求的 If-None-Match / If-Modified-Since 是否与当前版本一致
+
+    同时携带两者时只比较 If-None-Match（ETag 包含行数，比 Last-Modified 更准确）。
+    """
+    if request.if_none_match:
+        return bool(etag) and request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+class Validator:
+    """列表接口的 ETag / Last-Modified
+
+    用法::
+
+        validator = conditional_get(*collection_state(Tunnel, Tunnel.user_id == user_id))
+        if validator.not_modified():
+            return validator.response_304()
+        ...
+        return validator.apply(jsonify(result)), 200
+    """
+
+    def __init__(self, etag, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def not_modified(self):
+        return is_not_modified(self.etag, self.last_modified)
+
+    def response_304(self):
+        return cache_headers(Response(status=304), self.etag, self.last_modified)
+
+    def apply(self, response):
+        return cache_headers(response, self.etag, self.last_modified)
+
+
+def conditional_get(*columns, extra=(), last_modified=True):
+    """用一次聚合查询取得 columns（如 collection_state 的返回值）的当前值，生成 Validator
+
+    ETag 由请求路径、查询参数、当前用户、查询结果和 extra（不在数据库中的版本，如日期、探测结果版本）计算；
+    last_modified 为True时取结果中最大的时间作为 Last-Modified，结果中的时间与响应内容无直接关系时应传False。
+    """
+    values = tuple(db.session.execute(select(*columns)).one()) if columns else ()
+
+    parts = (request.path, sorted(request.args.items(multi=True)), get_jwt_identity(), values, tuple(extra))
+    etag = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    modified = None
+    if last_modified:
+        times = [value for value in values if isinstance(value, datetime)]
+        if times:
+            # 数据库中保存的是UTC时间，HTTP 日期精度为秒
+            modified = max(times).replace(microsecond=0)
+            # 最近一秒内有修改时同一秒内还可能再次修改，此时不返回 Last-Modified，客户端只能用 ETag 验证
+            if modified >= datetime.utcnow().replace(microsecond=0) - timedelta(seconds=1):
+                modified = None
+            else:
+                modified = modified.replace(tzinfo=timezone.utc)
+    return Validator(etag, modified)
@@ -0,0 +1,324 @@
+import math
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import func, select, update
+from werkzeug.security import generate_password_hash
+from src.models.user import db, User
+from src.models.user_group import UserGroup
+from src.models.package import Package, UserPackage, PAYMENT_SUCCESS
+from src.models.node import Node
+from src.models.tunnel import Tunnel
+from src.models.traffic import TrafficLog, TrafficSummary
+from src.services.quota import rebuild_usage
+
+# 单次批量插入的行数
+INSERT_BATCH_SIZE = 20000
+
+TUNNEL_TYPES = ('tcp', 'tcp', 'tcp', 'udp', 'http', 'https')
+
+
+def bulk_insert(model, rows, batch_size=INSERT_BATCH_SIZE):
+    """按批插入并提交，rows 可为任意可迭代对象，返回插入行数"""
+    table = model.__table__
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.connection().execute(table.insert(), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.connection().execute(table.insert(), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+class RawInserter:
+    """绕过SQLAlchemy的逐行参数处理，直接用数据库驱动的 executemany 批量插入元组
+
+    仅做类型的绑定转换（如SQLite的日期时间），比 Core insert 快数倍，用于插入大量流量日志。
+    驱动参数风格不是 qmark/format/pyformat 时退回 Core insert。
+    """
+
+    def __init__(self, model, columns):
+        dialect = db.engine.dialect
+        table = model.__table__
+        self.table = table
+        self.columns = columns
+        self.processors = [table.c[name].type.dialect_impl(dialect).bind_processor(dialect) for name in columns]
+        if dialect.paramstyle == 'qmark':
+            placeholder = '?'
+        elif dialect.paramstyle in ('format', 'pyformat'):
+            placeholder = '%s'
+        else:
+            placeholder = None
+        if placeholder:
+            quote = dialect.identifier_preparer.quote
+            self.sql = (f"INSERT INTO {quote(table.name)} ({', '.join(quote(c) for c in columns)}) "
+                        f"VALUES ({', '.join([placeholder] * len(columns))})")
+        else:
+            self.sql = None
+
+    def insert(self, rows):
+        if not rows:
+            return
+        conn = db.session.connection()
+        if self.sql is None:
+            conn.execute(self.table.insert(), [dict(zip(self.columns, row)) for row in rows])
+            return
+        processors = [(i, p) for i, p in enumerate(self.processors) if p]
+        if processors:
+            converted = []
+            for row in rows:
+                row = list(row)
+                for i, p in processors:
+                    row[i] = p(row[i])
+                converted.append(tuple(row))
+            rows = converted
+        conn.exec_driver_sql(self.sql, rows)
+
+
+def _new_ids(model, before_id):
+    return list(db.session.scalars(select(model.id).where(model.id > before_id).order_by(model.id)))
+
+
+def _max_id(model):
+    return db.session.scalar(select(func.max(model.id))) or 0
+
+
+def hourly_weights(peak_hour=21, floor=0.15):
+    """一天内各小时的相对流量：夜间低谷、晚间高峰的余弦曲线"""
+    return [floor + (1 - floor) * (1 + math.cos(2 * math.pi * (hour - peak_hour) / 24)) / 2
+            for hour in range(24)]
+
+
+def create_groups(prefix, count, now):
+    """创建用户组，额度随序号递增；库中没有默认组时第一个组设为默认组"""
+    has_default = db.session.scalar(select(func.count(UserGroup.id)).where(UserGroup.is_default == True))
+    before = _max_id(UserGroup)
+    bulk_insert(UserGroup, ({
+        'name': f'{prefix}-group-{i}',
+        'max_tunnels': 3 * (i + 1),
+        'max_traffic': (1 << 30) * 10 ** i,
+        'description': '测试数据',
+        'is_default': i == 0 and not has_default,
+        'created_at': now,
+        'updated_at': now
+    } for i in range(count)))
+    return _new_ids(UserGroup, before)
+
+
+def create_packages(prefix, count, now):
+    before = _max_id(Package)
+    bulk_insert(Package, ({
+        'name': f'{prefix}-package-{i}',
+        'price': round(9.9 * (i + 1), 2),
+        'duration': 30,
+        'max_tunnels': 5 * (i + 1),
+        'max_traffic': (5 << 30) * (i + 1),
+        'description': '测试数据',
+        'is_active': True,
+        'created_at': now,
+        'updated_at': now
+    } for i in range(count)))
+    return _new_ids(Package, before)
+
+
+def create_users(prefix, count, group_ids, password, now, rng):
+    """创建用户并按组轮流分配，所有用户共用同一个密码哈希"""
+    password_hash = generate_password_hash(password)
+    before = _max_id(User)
+    bulk_insert(User, ({
+        'username': f'{prefix}{i}',
+        'email': f'{prefix}{i}@example.com',
+        'password_hash': password_hash,
+        'is_active': rng.random() > 0.02,
+        'is_admin': False,
+        'email_verified': True,
+        'user_group_id': group_ids[i % len(group_ids)] if group_ids else None,
+        'total_traffic': 0,
+        'created_at': now - timedelta(seconds=rng.randint(0, 365 * 86400)),
+        'updated_at': now
+    } for i in range(count)))
+    return _new_ids(User, before)
+
+
+def create_user_packages(user_ids, package_ids, ratio, now, rng):
+    """为一部分用户购买套餐，约三分之一已过期"""
+    if not package_ids or ratio <= 0:
+        return 0
+
+    def rows():
+        for user_id in user_ids:
+            if rng.random() >= ratio:
+                continue
+            start = now - timedelta(days=rng.uniform(0, 45))
+            end = start + timedelta(days=30)
+            yield {
+                'user_id': user_id,
+                'package_id': rng.choice(package_ids),
+                'start_date': start,
+                'end_date': end,
+                'is_active': end > now,
+                'used_traffic': 0,
+                'payment_status': PAYMENT_SUCCESS,
+                'created_at': start,
+                'updated_at': start
+            }
+
+    return bulk_insert(UserPackage, rows())
+
+
+def create_nodes(prefix, count, owner_id, now):
+    before = _max_id(Node)
+    bulk_insert(Node, ({
+        'name': f'{prefix}-node-{i}',
+        'host': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+        'port': 7000,
+        'status': 'online',
+        'region': f'region-{i % 5}',
+        'user_id': owner_id,
+        'created_at': now,
+        'updated_at': now
+    } for i in range(count)))
+    return _new_ids(Node, before)
+
+
+def create_tunnels(user_ids, node_ids, per_user, now, rng):
+    """每个用户创建 per_user 条隧道，返回 [(隧道ID, 用户ID), ...]"""
+    before = _max_id(Tunnel)
+
+    def rows():
+        for user_id in user_ids:
+            for t in range(per_user):
+                tunnel_type = rng.choice(TUNNEL_TYPES)
+                created = now - timedelta(seconds=rng.randint(0, 180 * 86400))
+                yield {
+                    'name': f'tunnel-{user_id}-{t}',
+                    'type': tunnel_type,
+                    'local_ip': '127.0.0.1',
+                    'local_port': 1024 + rng.randint(0, 60000),
+                    'remote_port': 10000 + rng.randint(0, 50000) if tunnel_type in ('tcp', 'udp') else None,
+                    'subdomain': f'u{user_id}t{t}' if tunnel_type in ('http', 'https') else None,
+                    'status': 'running' if rng.random() < 0.7 else 'stopped',
+                    'node_id': rng.choice(node_ids),
+                    'user_id': user_id,
+                    'bytes_in': 0,
+                    'bytes_out': 0,
+                    'created_at': created,
+                    'updated_at': created
+                }
+
+    bulk_insert(Tunnel, rows())
+    return [tuple(row) for row in db.session.execute(
+        select(Tunnel.id, Tunnel.user_id).where(Tunnel.id > before).order_by(Tunnel.id)
+    )]
+
+
+def generate_traffic(tunnels, days, rows, rng, end=None, peak_hour=21, progress=None):
+    """生成流量日志及对应的每日汇总和用户总流量
+
+    各隧道的活跃度服从长尾分布，单日内按 hourly_weights 分布，周末流量略高；
+    日志按时间顺序插入，ID随时间递增。返回插入的日志条数。
+    """
+    if not tunnels or rows <= 0:
+        return 0
+
+    end = end or datetime.utcnow()
+    first_day = (end - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    cum_tunnels = list(accumulate(rng.paretovariate(1.2) for _ in tunnels))
+    cum_hours = list(accumulate(hourly_weights(peak_hour)))
+    day_weights = [1.25 if (first_day + timedelta(days=d)).weekday() >= 5 else 1.0 for d in range(days)]
+    weight_sum = sum(day_weights)
+
+    log_inserter = RawInserter(TrafficLog, ('user_id', 'tunnel_id', 'upload', 'download', 'timestamp'))
+    inserted = 0
+    user_totals = {}
+    for day in range(days):
+        day_start = first_day + timedelta(days=day)
+        count = round(rows * day_weights[day] / weight_sum)
+        if day == days - 1:
+            count = rows - inserted
+        if count <= 0:
+            continue
+
+        picks = rng.choices(tunnels, cum_weights=cum_tunnels, k=count)
+        hours = rng.choices(range(24), cum_weights=cum_hours, k=count)
+        offsets = sorted(zip((h * 3600 + rng.randrange(3600) for h in hours), picks))
+        # 最后一天只到当前时刻，按比例压缩到已经过去的时间内
+        elapsed = min(86400, int((end - day_start).total_seconds()))
+        if elapsed < 86400:
+            offsets = [(offset * elapsed // 86400, pick) for offset, pick in offsets]
+
+        summaries = {}
+        batch = []
+        for offset, (tunnel_id, user_id) in offsets:
+            timestamp = day_start + timedelta(seconds=offset)
+            download = int(rng.lognormvariate(12, 1.5))
+            upload = int(download * rng.uniform(0.05, 0.4))
+            batch.append((user_id, tunnel_id, upload, download, timestamp))
+            total = summaries.get(tunnel_id)
+            if total is None:
+                summaries[tunnel_id] = [user_id, upload, download]
+            else:
+                total[1] += upload
+                total[2] += download
+            user_totals[user_id] = user_totals.get(user_id, 0) + upload + download
+            if len(batch) >= INSERT_BATCH_SIZE:
+                log_inserter.insert(batch)
+                db.session.commit()
+                inserted += len(batch)
+                batch = []
+                if progress:
+                    progress(inserted, rows)
+        if batch:
+            log_inserter.insert(batch)
+            inserted += len(batch)
+
+        bulk_insert(TrafficSummary, ({
+            'user_id': user_id, 'tunnel_id': tunnel_id, 'date': day_start.date(),
+            'upload': upload, 'download': download
+        } for tunnel_id, (user_id, upload, download) in summaries.items()))
+        if progress:
+            progress(inserted, rows)
+
+    # 用户总流量按主键批量更新
+    totals = [{'id': user_id, 'total_traffic': total} for user_id, total in user_totals.items()]
+    for start in range(0, len(totals), INSERT_BATCH_SIZE):
+        db.session.execute(update(User), totals[start:start + INSERT_BATCH_SIZE])
+    db.session.commit()
+    return inserted
+
+
+def generate_dataset(users=100, groups=3, packages=3, package_ratio=0.3, nodes=10, tunnels_per_user=5,
+                     days=30, traffic_rows=100000, prefix='gen', password='password123', seed=None,
+                     progress=None):
+    """生成完整的测试数据集，返回各类数据的数量和ID"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    group_ids = create_groups(prefix, groups, now)
+    package_ids = create_packages(prefix, packages, now)
+    user_ids = create_users(prefix, users, group_ids, password, now, rng)
+    user_package_count = create_user_packages(user_ids, package_ids, package_ratio, now, rng)
+    node_ids = create_nodes(prefix, nodes, user_ids[0], now) if user_ids else []
+    tunnels = create_tunnels(user_ids, node_ids, tunnels_per_user, now, rng) if node_ids else []
+    traffic_count = generate_traffic(tunnels, days, traffic_rows, rng, end=now, progress=progress)
+
+    # 批量插入绕过了配额计数，按生成结果重建
+    rebuild_usage(db.session.connection(), user_ids)
+    db.session.commit()
+
+    return {
+        'group_ids': group_ids,
+        'package_ids': package_ids,
+        'user_ids': user_ids,
+        'node_ids': node_ids,
+        'tunnels': tunnels,
+        'user_packages': user_package_count,
+        'traffic_logs': traffic_count
+    }
@@ -0,0 +1,105 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class PoolWaitStats:
+    """连接池取连接的等待耗时统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, elapsed, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += elapsed
+            self.max_wait = max(self.max_wait, elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'total_wait_ms': round(self.total_wait * 1000, 3),
+                'avg_wait_ms': round(self.total_wait * 1000 / attempts, 3) if attempts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3)
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """记录取连接等待时间的 QueuePool
+
+    等待时间包括池满时排队和新建连接的耗时，engine.dispose() 重建连接池后统计继续累计。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return entry
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+def build_engine_options(config):
+    """根据配置生成 SQLALCHEMY_ENGINE_OPTIONS
+
+    SQLite 使用 Flask-SQLAlchemy 的默认连接池设置，不做调整。
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': max(1, int(config['DB_POOL_SIZE'])),
+        'max_overflow': int(config['DB_MAX_OVERFLOW']),
+        'pool_recycle': int(config['DB_POOL_RECYCLE']),
+        'pool_pre_ping': bool(config['DB_POOL_PRE_PING']),
+        'pool_timeout': float(config['DB_POOL_TIMEOUT'])
+    }
+    if url.get_backend_name() == 'mysql' and config.get('DB_CONNECT_TIMEOUT'):
+        options['connect_args'] = {'connect_timeout': int(config['DB_CONNECT_TIMEOUT'])}
+    return options
+
+
+def pool_stats(engine):
+    """返回连接池的实时状态"""
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(0, pool.overflow()),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+            'recycle': pool._recycle,
+            'pre_ping': pool._pre_ping
+        })
+    wait_stats = getattr(pool, 'wait_stats', None)
+    if wait_stats is not None:
+        stats['wait'] = wait_stats.snapshot()
+    return stats
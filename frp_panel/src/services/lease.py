@@ -0,0 +1,52 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.lease import SchedulerLease
+
+
+def lease_owner():
+    """当前进程的租约持有者标识"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def acquire_lease(name, owner, ttl):
+    """获取或续期租约，成功返回True
+
+    租约无人持有、已过期或由 owner 持有时获取成功，并把到期时间设为 ttl 秒之后。
+    使用独立连接和短事务，与调用方的会话无关；持有者异常退出后租约在到期后由其他进程接管。
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    table = SchedulerLease.__table__
+
+    with db.engine.begin() as conn:
+        claimed = conn.execute(
+            update(table).where(
+                table.c.name == name,
+                or_(table.c.owner == owner, table.c.expires_at <= now)
+            ).values(owner=owner, expires_at=expires_at, updated_at=now)
+        ).rowcount
+    if claimed:
+        return True
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(table).values(name=name, owner=owner, expires_at=expires_at, updated_at=now))
+        return True
+    except IntegrityError:
+        # 租约由其他进程持有且未过期
+        return False
+
+
+def release_lease(name, owner):
+    """释放自己持有的租约，其他进程可以立即获取"""
+    now = datetime.utcnow()
+    table = SchedulerLease.__table__
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(table).where(table.c.name == name, table.c.owner == owner)
+            .values(expires_at=now, updated_at=now)
+        )
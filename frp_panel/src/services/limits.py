@@ -0,0 +1,252 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, object_session
+from src.models.user import db, User
+from src.models.user_group import UserGroup
+from src.models.package import Package, UserPackage, PAYMENT_SUCCESS
+from src.services.batching import chunked
+
+LIMIT_FIELDS = ('max_tunnels', 'max_traffic', 'upload_speed_limit', 'download_speed_limit')
+
+# 速率限制为空表示不限速，合并时视为最大
+_UNLIMITED_WHEN_NULL = ('upload_speed_limit', 'download_speed_limit')
+
+# 会话中暂存的待失效条目，事务提交后才使缓存失效
+_SESSION_INVALIDATE_KEY = 'limits_resolver_invalidate'
+
+
+class EffectiveLimits:
+    """用户的有效限制（用户组与生效中的套餐合并后的结果）"""
+
+    __slots__ = ('user_id', 'user_group_id', 'package_ids', 'expires_at') + LIMIT_FIELDS
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def __repr__(self):
+        return f'<EffectiveLimits {self.user_id}>'
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'max_tunnels': self.max_tunnels,
+            'max_traffic': self.max_traffic,
+            'upload_speed_limit': self.upload_speed_limit,
+            'download_speed_limit': self.download_speed_limit,
+            'user_group_id': self.user_group_id,
+            'package_ids': list(self.package_ids),
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+
+def merge_limits(sources):
+    """逐项取最宽松的限制；sources 为带有 LIMIT_FIELDS 属性的行，为空时不限制"""
+    merged = {}
+    for field in LIMIT_FIELDS:
+        values = [getattr(source, field) for source in sources]
+        if not values or (field in _UNLIMITED_WHEN_NULL and None in values):
+            merged[field] = None
+        else:
+            present = [value for value in values if value is not None]
+            merged[field] = max(present) if present else None
+    return merged
+
+
+def active_package_filter(now):
+    """生效中的套餐：已启用、已支付且在有效期内"""
+    return (
+        UserPackage.is_active == True,
+        UserPackage.payment_status == PAYMENT_SUCCESS,
+        UserPackage.start_date <= now,
+        UserPackage.end_date > now
+    )
+
+
+def resolve_limits(user_ids, now=None):
+    """批量计算有效限制，返回 {用户ID: EffectiveLimits}，不存在的用户不在结果中
+
+    用户组为空的用户按默认用户组计算；每批用户两条查询（用户及其用户组、生效中的套餐），
+    另外最多一条查询默认用户组。
+    """
+    now = now or datetime.utcnow()
+    group_columns = [getattr(UserGroup, field) for field in LIMIT_FIELDS]
+    results = {}
+    default_group = None
+
+    for chunk in chunked(sorted(set(user_ids))):
+        users = db.session.execute(
+            select(User.id, UserGroup.id.label('group_id'), *group_columns)
+            .outerjoin(UserGroup, UserGroup.id == User.user_group_id)
+            .where(User.id.in_(chunk))
+        ).all()
+        packages = {}
+        for row in db.session.execute(
+            select(UserPackage.user_id, UserPackage.package_id, UserPackage.end_date,
+                   *(getattr(Package, field) for field in LIMIT_FIELDS))
+            .join(Package, Package.id == UserPackage.package_id)
+            .where(UserPackage.user_id.in_(chunk), *active_package_filter(now))
+        ):
+            packages.setdefault(row.user_id, []).append(row)
+
+        for user in users:
+            group = user
+            if user.group_id is None:
+                if default_group is None:
+                    default_group = db.session.execute(
+                        select(UserGroup.id.label('group_id'), *group_columns)
+                        .where(UserGroup.is_default == True).order_by(UserGroup.id).limit(1)
+                    ).first() or False
+                group = default_group or None
+
+            user_packages = packages.get(user.id, [])
+            sources = ([group] if group is not None else []) + user_packages
+            results[user.id] = EffectiveLimits(
+                user_id=user.id,
+                user_group_id=group.group_id if group is not None else None,
+                package_ids=sorted({row.package_id for row in user_packages}),
+                expires_at=min((row.end_date for row in user_packages), default=None),
+                **merge_limits(sources)
+            )
+    return results
+
+
+class LimitsResolver:
+    """有效限制的进程内缓存
+
+    条目在 EFFECTIVE_LIMITS_CACHE_TTL 秒或最早到期的套餐到期时失效（以先到者为准），
+    购买或变更套餐、分配用户组、修改用户组或套餐的事务提交后通过会话事件失效（回滚时不失效）。
+    事件只能使本进程的缓存失效，其他工作进程最多延迟 TTL 秒。
+    """
+
+    def __init__(self):
+        self.ttl = 60.0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('EFFECTIVE_LIMITS_CACHE_TTL', 60.0)
+        self.ttl = float(app.config['EFFECTIVE_LIMITS_CACHE_TTL'])
+        app.extensions['limits_resolver'] = self
+
+    def get(self, user_id):
+        """返回用户的有效限制，用户不存在时返回None"""
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        """批量返回有效限制，未命中的用户一起计算"""
+        now = time.monotonic()
+        results = {}
+        missing = []
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry and entry[0] > now:
+                    results[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+        if missing:
+            resolved = resolve_limits(missing)
+            results.update(resolved)
+            self._put(resolved.values())
+        return results
+
+    def _put(self, limits_list):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        wall_now = datetime.utcnow()
+        with self._lock:
+            for limits in limits_list:
+                ttl = self.ttl
+                if limits.expires_at is not None:
+                    ttl = min(ttl, max(0.0, (limits.expires_at - wall_now).total_seconds()))
+                self._entries[limits.user_id] = (now + ttl, limits)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for user_id, (_, limits) in list(self._entries.items()):
+                if predicate(limits):
+                    del self._entries[user_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+limits_resolver = LimitsResolver()
+
+
+def _apply(kind, target_id):
+    if kind == 'user':
+        limits_resolver.invalidate(target_id)
+    elif kind == 'group':
+        limits_resolver.invalidate_where(lambda limits: limits.user_group_id == target_id)
+    elif kind == 'package':
+        limits_resolver.invalidate_where(lambda limits: target_id in limits.package_ids)
+    else:
+        limits_resolver.clear()
+
+
+def _stage_invalidation(target, kind, target_id):
+    """刷新时记录待失效的条目，事务提交后才使缓存失效；不在会话中时立即失效"""
+    session = object_session(target)
+    if session is None:
+        _apply(kind, target_id)
+        return
+    session.info.setdefault(_SESSION_INVALIDATE_KEY, set()).add((kind, target_id))
+
+
+@event.listens_for(UserPackage, 'after_insert')
+@event.listens_for(UserPackage, 'after_update')
+@event.listens_for(UserPackage, 'after_delete')
+def _invalidate_user_package(mapper, connection, target):
+    _stage_invalidation(target, 'user', target.user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    _stage_invalidation(target, 'user', target.id)
+
+
+@event.listens_for(UserGroup, 'after_update')
+@event.listens_for(UserGroup, 'after_delete')
+def _invalidate_group(mapper, connection, target):
+    # 默认用户组还作用于未分组的用户，直接清空；是否为默认用户组需在刷新时根据修改历史判断
+    if target.is_default or inspect(target).attrs.is_default.history.has_changes():
+        _stage_invalidation(target, 'all', None)
+    else:
+        _stage_invalidation(target, 'group', target.id)
+
+
+@event.listens_for(UserGroup, 'after_insert')
+def _invalidate_default_group(mapper, connection, target):
+    if target.is_default:
+        _stage_invalidation(target, 'all', None)
+
+
+@event.listens_for(Package, 'after_update')
+@event.listens_for(Package, 'after_delete')
+def _invalidate_package(mapper, connection, target):
+    _stage_invalidation(target, 'package', target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    staged = session.info.pop(_SESSION_INVALIDATE_KEY, None)
+    if staged:
+        for kind, target_id in staged:
+            _apply(kind, target_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    session.info.pop(_SESSION_INVALIDATE_KEY, None)
@@ -0,0 +1,347 @@
+import bisect
+import hmac
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 默认的耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 单个请求的SQL条数分桶
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}']
+
+
+class _GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """瞬时值，通常在采集时由回调设置"""
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _render_child(self, key, child):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}']
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    """分桶直方图，输出累计桶计数、总和与总数"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, key, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表
+
+    各工作进程分别统计，/metrics 返回的是处理该次采集请求的工作进程的数据。
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """注册采集回调，每次输出指标前调用，用于设置连接池、队列长度等瞬时值"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception:
+                pass
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    'frp_panel_http_request_duration_seconds', '请求处理耗时',
+    ('blueprint', 'endpoint', 'method', 'status'))
+db_query_duration = registry.histogram(
+    'frp_panel_db_query_duration_seconds', '单条SQL执行耗时')
+db_request_queries = registry.histogram(
+    'frp_panel_db_queries_per_request', '单个请求执行的SQL条数',
+    ('blueprint', 'endpoint'), buckets=QUERY_COUNT_BUCKETS)
+db_request_time = registry.histogram(
+    'frp_panel_db_time_per_request_seconds', '单个请求的SQL总耗时',
+    ('blueprint', 'endpoint'))
+frps_request_duration = registry.histogram(
+    'frp_panel_frps_request_duration_seconds', '请求节点面板的耗时',
+    ('api', 'outcome'))
+traffic_samples = registry.counter(
+    'frp_panel_traffic_samples_total', '流量上报样本数（accepted 已写入，rejected 校验失败，denied 无权限）',
+    ('result',))
+traffic_batches = registry.counter(
+    'frp_panel_traffic_ingest_requests_total', '流量上报请求数', ('endpoint',))
+db_pool_connections = registry.gauge(
+    'frp_panel_db_pool_connections', '数据库连接池连接数', ('state',))
+db_pool_wait = registry.gauge(
+    'frp_panel_db_pool_wait_seconds_total', '从连接池取连接的累计等待时间')
+db_pool_timeouts = registry.gauge(
+    'frp_panel_db_pool_timeouts_total', '从连接池取连接超时的次数')
+audit_log_queue = registry.gauge(
+    'frp_panel_audit_log_queue', '操作日志队列状态', ('state',))
+traffic_aggregator_pending = registry.gauge(
+    'frp_panel_traffic_aggregator_pending_keys', '写后缓冲中尚未刷新的键数')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    db_query_duration.observe(elapsed)
+    if has_request_context():
+        stats = g.get('_metrics_db')
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None:
+        starts = conn.info.get('metrics_query_start')
+        if starts:
+            starts.pop()
+
+
+_engine_listeners_installed = False
+
+
+def install_engine_listeners():
+    """在所有 Engine 上记录SQL耗时（进程内只安装一次）"""
+    global _engine_listeners_installed
+    if _engine_listeners_installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _engine_listeners_installed = True
+
+
+class Metrics:
+    """请求指标采集，并在 /metrics 输出 Prometheus 文本格式"""
+
+    def __init__(self):
+        self.enabled = False
+        self.token = None
+        self._app = None
+        self._collector_installed = False
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+
+        self.enabled = bool(app.config['METRICS_ENABLED'])
+        self.token = app.config['METRICS_TOKEN'] or None
+        app.extensions['metrics'] = self
+        if not self.enabled:
+            return
+
+        self._app = app
+        install_engine_listeners()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+        if not self._collector_installed:
+            registry.add_collector(self._collect_runtime)
+            self._collector_installed = True
+
+    def _collect_runtime(self):
+        """采集连接池、日志队列和写后缓冲的瞬时状态"""
+        from src.models.user import db
+        from src.services.audit_log import audit_log_writer
+        from src.services.db_pool import pool_stats
+        from src.services.traffic_aggregator import traffic_aggregator
+
+        with self._app.app_context():
+            stats = pool_stats(db.engine)
+        for state in ('size', 'checked_in', 'checked_out', 'overflow'):
+            if state in stats:
+                db_pool_connections.labels(state).set(stats[state])
+        if 'wait' in stats:
+            db_pool_wait.set(stats['wait']['total_wait_ms'] / 1000)
+            db_pool_timeouts.set(stats['wait']['timeouts'])
+
+        audit_stats = audit_log_writer.stats()
+        for state in ('queued', 'written', 'dropped'):
+            audit_log_queue.labels(state).set(audit_stats[state])
+        traffic_aggregator_pending.set(traffic_aggregator.pending_keys())
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_db = [0, 0.0]
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None or request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        blueprint = request.blueprint or ''
+        http_request_duration.labels(blueprint, endpoint, request.method, response.status_code).observe(elapsed)
+        queries, query_time = g.pop('_metrics_db', (0, 0.0))
+        db_request_queries.labels(blueprint, endpoint).observe(queries)
+        db_request_time.labels(blueprint, endpoint).observe(query_time)
+        return response
+
+    def render(self):
+        if self.token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied, f'Bearer {self.token}'):
+                return Response('unauthorized\n', status=401, mimetype='text/plain')
+        return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics = Metrics()
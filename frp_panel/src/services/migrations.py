@@ -0,0 +1,165 @@
+import importlib
+import os
+import re
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+from src.models.user import db
+
+# 迁移脚本目录，文件名格式为 v0001_说明.py
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_PATTERN = re.compile(r'^(v\d{4})_\w+\.py$')
+
+# 多进程同时启动时用于串行执行迁移的MySQL命名锁
+MIGRATION_LOCK_NAME = 'frp_panel_schema_migration'
+
+schema_migration = Table(
+    'schema_migration',
+    MetaData(),
+    Column('version', String(50), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def discover_migrations():
+    """按版本号顺序返回全部迁移模块"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_PATTERN.match(filename)
+        if match:
+            module = importlib.import_module(f'src.migrations.{filename[:-3]}')
+            migrations.append((match.group(1), module))
+    return migrations
+
+
+def applied_versions(conn):
+    """返回已执行的迁移版本集合"""
+    schema_migration.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migration.c.version)).scalars())
+
+
+def pending_migrations():
+    """返回尚未执行的迁移版本列表"""
+    with db.engine.connect() as conn:
+        applied = applied_versions(conn)
+        conn.commit()
+    return [version for version, _ in discover_migrations() if version not in applied]
+
+
+def upgrade():
+    """执行全部未执行的迁移，返回本次执行的版本列表"""
+    executed = []
+    with db.engine.connect() as conn:
+        is_mysql = conn.dialect.name == 'mysql'
+        if is_mysql:
+            conn.execute(text('SELECT GET_LOCK(:name, 600)'), {'name': MIGRATION_LOCK_NAME})
+        try:
+            applied = applied_versions(conn)
+            conn.commit()
+            for version, module in discover_migrations():
+                if version in applied:
+                    continue
+                module.upgrade(conn)
+                conn.execute(schema_migration.insert().values(version=version, applied_at=datetime.utcnow()))
+                conn.commit()
+                executed.append(version)
+                print(f"已执行数据库迁移: {version} {module.__doc__ or ''}".rstrip())
+        finally:
+            if is_mysql:
+                conn.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': MIGRATION_LOCK_NAME})
+    return executed
+
+
+def create_tables(conn, *models):
+    """创建尚不存在的表（含模型中声明的索引）"""
+    db.metadata.create_all(bind=conn, tables=[model.__table__ for model in models], checkfirst=True)
+
+
+def create_index_if_missing(conn, table_name, index_name, columns, unique=False):
+    """创建尚不存在的索引"""
+    existing = {index['name'] for index in inspect(conn).get_indexes(table_name)}
+    if index_name in existing:
+        return False
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {quote(index_name)} "
+        f"ON {quote(table_name)} ({', '.join(quote(column) for column in columns)})"
+    ))
+    return True
+
+
+def add_column_if_missing(conn, table_name, column):
+    """为已存在的表添加尚不存在的列"""
+    existing = {col['name'] for col in inspect(conn).get_columns(table_name)}
+    if column.name in existing:
+        return False
+    quote = conn.dialect.identifier_preparer.quote
+    column_type = column.type.compile(dialect=conn.dialect)
+    default = ''
+    if column.server_default is not None:
+        default = f' DEFAULT {column.server_default.arg}'
+    nullable = '' if column.nullable else ' NOT NULL'
+    conn.execute(text(
+        f'ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column.name)} {column_type}{default}{nullable}'
+    ))
+    return True
+
+
+# 高频查询及其应使用的索引：(名称, 可接受的索引, SQL)
+HOT_QUERIES = (
+    ('实时流量（指定隧道）', ('ix_traffic_log_user_tunnel_ts',),
+     "SELECT id, upload, download FROM traffic_log "
+     "WHERE user_id = 1 AND tunnel_id = 1 AND timestamp >= '2000-01-01 00:00:00' ORDER BY timestamp"),
+    ('实时流量（全部隧道）', ('ix_traffic_log_user_ts', 'ix_traffic_log_user_tunnel_ts'),
+     "SELECT id, upload, download FROM traffic_log "
+     "WHERE user_id = 1 AND timestamp >= '2000-01-01 00:00:00' ORDER BY timestamp"),
+    ('原始流量日志清理', ('ix_traffic_log_timestamp',),
+     "SELECT id FROM traffic_log WHERE timestamp < '2000-01-01 00:00:00' AND id <= 1000"),
+    ('每日流量统计', ('ix_traffic_summary_user_date', 'uix_traffic_summary'),
+     "SELECT id, upload, download FROM traffic_summary WHERE user_id = 1 AND date >= '2000-01-01'"),
+    ('流量历史曲线', ('ix_traffic_rollup_user_bucket', 'uix_traffic_rollup'),
+     "SELECT bucket_start, upload, download FROM traffic_rollup "
+     "WHERE resolution = 'hour' AND user_id = 1 AND bucket_start >= '2000-01-01 00:00:00'"),
+    ('用户隧道列表', ('ix_tunnel_user_created',),
+     "SELECT id, name FROM tunnel WHERE user_id = 1 ORDER BY created_at DESC, id DESC"),
+    ('隧道重名检查', ('ix_tunnel_user_name',),
+     "SELECT id FROM tunnel WHERE name = 'x' AND user_id = 1"),
+    ('按节点筛选隧道', ('ix_tunnel_node_status',),
+     "SELECT id FROM tunnel WHERE node_id = 1 AND status = 'running'"),
+    ('验证码查询', ('ix_email_verification_lookup',),
+     "SELECT id FROM email_verification WHERE email = 'a@example.com' AND purpose = 'register' "
+     "AND created_at > '2000-01-01 00:00:00'"),
+    ('用户操作日志', ('ix_operation_log_user_created',),
+     "SELECT id FROM operation_log WHERE user_id = 1 ORDER BY created_at DESC"),
+    ('到期套餐扫描', ('ix_user_package_active_end',),
+     "SELECT id, user_id FROM user_package WHERE is_active = 1 AND end_date <= '2000-01-01 00:00:00' "
+     "ORDER BY end_date"),
+)
+
+
+def explain_index(conn, sql):
+    """返回查询计划中使用的索引名集合及原始计划文本"""
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}').all()
+        plan = '; '.join(row[-1] for row in rows)
+        used = set(re.findall(r'USING (?:COVERING )?INDEX (\w+)', plan))
+    else:
+        rows = conn.exec_driver_sql(f'EXPLAIN {sql}').mappings().all()
+        plan = '; '.join(str(dict(row)) for row in rows)
+        used = {row['key'] for row in rows if row.get('key')}
+    return used, plan
+
+
+def check_hot_query_indexes():
+    """用 EXPLAIN 检查高频查询是否命中索引，返回检查结果列表"""
+    results = []
+    with db.engine.connect() as conn:
+        for name, expected, sql in HOT_QUERIES:
+            used, plan = explain_index(conn, sql)
+            results.append({
+                'name': name,
+                'expected': expected,
+                'used': sorted(used),
+                'ok': bool(used & set(expected)),
+                'plan': plan
+            })
+    return results
@@ -0,0 +1,344 @@
+import atexit
+import bisect
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select, update
+from src.models.user import db
+from src.models.node import Node
+from src.services.metrics import frps_request_duration
+
+
+# frps面板提供代理列表的代理类型
+PROXY_TYPES = ('tcp', 'udp', 'http', 'https', 'tcpmux', 'stcp', 'sudp', 'xtcp')
+
+# 节点列表 ETag 使用的延迟分档（毫秒），延迟在同一档内波动不改变 ETag
+LATENCY_BUCKETS_MS = (50, 200, 1000)
+
+
+def node_snapshot(node):
+    """提取探测所需的节点字段，避免在线程池中访问ORM对象"""
+    return {
+        'id': node.id,
+        'host': node.host,
+        'dashboard_port': node.dashboard_port,
+        'dashboard_user': node.dashboard_user,
+        'dashboard_password': node.dashboard_password
+    }
+
+
+class NodeMonitor:
+    """节点状态监控
+
+    后台线程按固定间隔并发探测所有节点的frps面板，探测结果（状态、延迟、时间）
+    保存在进程内缓存中，节点列表和详情接口直接读取缓存而不再同步探测。
+    后台探测和节点详细状态查询使用各自的线程池，多个节点无响应、探测占满线程时
+    详细状态查询不会排在其后等待。
+    """
+
+    def __init__(self):
+        self.interval = 30.0
+        self.timeout = 5.0
+        self.concurrency = 16
+        self.status_concurrency = 2 * (len(PROXY_TYPES) + 1)
+        self.status_ttl = 5.0
+        self._app = None
+        self._cache = {}
+        self._status_cache = {}
+        self._status_inflight = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._executor = None
+        self._status_executor = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('NODE_HEALTH_INTERVAL', 30.0)
+        app.config.setdefault('NODE_HEALTH_TIMEOUT', 5.0)
+        app.config.setdefault('NODE_HEALTH_CONCURRENCY', 16)
+        app.config.setdefault('NODE_STATUS_CONCURRENCY', 2 * (len(PROXY_TYPES) + 1))
+        app.config.setdefault('NODE_STATUS_CACHE_TTL', 5.0)
+
+        self._app = app
+        self.interval = float(app.config['NODE_HEALTH_INTERVAL'])
+        self.timeout = float(app.config['NODE_HEALTH_TIMEOUT'])
+        self.concurrency = max(1, int(app.config['NODE_HEALTH_CONCURRENCY']))
+        self.status_concurrency = max(1, int(app.config['NODE_STATUS_CONCURRENCY']))
+        self.status_ttl = float(app.config['NODE_STATUS_CACHE_TTL'])
+        app.extensions['node_monitor'] = self
+
+    def start(self):
+        """启动后台探测线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='node-monitor', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """停止后台线程并关闭连接池"""
+        self._stop_event.set()
+        for executor in (self._executor, self._status_executor):
+            if executor:
+                executor.shutdown(wait=False)
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop_event.wait(self.interval):
+                break
+
+    def _get_executor(self):
+        """后台探测使用的线程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix='node-probe')
+            return self._executor
+
+    def _get_status_executor(self):
+        """节点详细状态查询使用的线程池，与后台探测分开"""
+        with self._lock:
+            if self._status_executor is None:
+                self._status_executor = ThreadPoolExecutor(
+                    max_workers=self.status_concurrency, thread_name_prefix='node-status')
+            return self._status_executor
+
+    def get_session(self, snapshot):
+        """获取节点面板的长连接会话，同一节点复用连接池"""
+        key = (snapshot['host'], snapshot['dashboard_port'])
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.concurrency, self.status_concurrency))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[key] = session
+        if snapshot['dashboard_user'] and snapshot['dashboard_password']:
+            auth = (snapshot['dashboard_user'], snapshot['dashboard_password'])
+        else:
+            auth = None
+        return session, auth
+
+    def probe(self, snapshot):
+        """探测单个节点，返回状态、延迟和探测时间"""
+        result = {
+            'status': 'unknown',
+            'latency_ms': None,
+            'checked_at': datetime.utcnow().isoformat(),
+            'error': None
+        }
+
+        if not snapshot['dashboard_port']:
+            return result
+
+        url = f"http://{snapshot['host']}:{snapshot['dashboard_port']}/api/serverinfo"
+        start = time.perf_counter()
+        try:
+            session, auth = self.get_session(snapshot)
+            response = session.get(url, auth=auth, timeout=self.timeout)
+            result['status'] = 'online' if response.status_code == 200 else 'error'
+            if response.status_code != 200:
+                result['error'] = f'HTTP {response.status_code}'
+        except requests.exceptions.RequestException as e:
+            result['status'] = 'offline'
+            result['error'] = str(e)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        elapsed = time.perf_counter() - start
+        result['latency_ms'] = round(elapsed * 1000, 2)
+        frps_request_duration.labels('serverinfo', result['status']).observe(elapsed)
+        return result
+
+    def check_node(self, node):
+        """同步探测单个节点（用于创建、更新节点），返回状态"""
+        result = self.probe(node_snapshot(node))
+        if node.id is not None:
+            self.store(node.id, result)
+        return result['status']
+
+    def store(self, node_id, result):
+        with self._lock:
+            self._cache[node_id] = result
+
+    def get(self, node_id):
+        """读取节点的缓存探测结果，未探测过时返回None"""
+        with self._lock:
+            return self._cache.get(node_id)
+
+    def health_signature(self, node_ids):
+        """节点的探测状态和延迟档位，用于节点列表的 ETag
+
+        由缓存的探测结果本身计算而不是进程内计数，状态和延迟档位不变时 ETag 不变，
+        各工作进程探测结果一致时 ETag 也一致。
+        """
+        with self._lock:
+            results = [(node_id, self._cache.get(node_id)) for node_id in node_ids]
+        signature = []
+        for node_id, result in results:
+            if result is None:
+                signature.append((node_id, None, None))
+                continue
+            latency = result['latency_ms']
+            bucket = bisect.bisect(LATENCY_BUCKETS_MS, latency) if latency is not None else None
+            signature.append((node_id, result['status'], bucket))
+        return tuple(signature)
+
+    def forget(self, node_id):
+        with self._lock:
+            self._cache.pop(node_id, None)
+            self._status_cache.pop(node_id, None)
+
+    def get_dashboard_status(self, snapshot):
+        """获取节点面板的详细状态（服务器信息和全部代理列表）
+
+        结果按节点缓存 NODE_STATUS_CACHE_TTL 秒，缓存失效时同一节点的并发请求
+        只会触发一次上游拉取，其余请求等待并共享该结果。
+        """
+        node_id = snapshot['id']
+        with self._lock:
+            cached = self._status_cache.get(node_id)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+            future = self._status_inflight.get(node_id)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._status_inflight[node_id] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            status_info = self._fetch_dashboard_status(snapshot)
+            with self._lock:
+                self._status_cache[node_id] = (time.monotonic() + self.status_ttl, status_info)
+            future.set_result(status_info)
+            return status_info
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._status_inflight.pop(node_id, None)
+
+    def _fetch_dashboard_status(self, snapshot):
+        """并发请求服务器信息和各类型代理列表，耗时取决于最慢的单个请求"""
+        status_info = {
+            'status': 'offline',
+            'server_info': None,
+            'proxies': [],
+            'error': None
+        }
+
+        if not snapshot['dashboard_port']:
+            return status_info
+
+        base_url = f"http://{snapshot['host']}:{snapshot['dashboard_port']}"
+        session, auth = self.get_session(snapshot)
+
+        def fetch(api, path):
+            start = time.perf_counter()
+            outcome = 'offline'
+            try:
+                response = session.get(f"{base_url}{path}", auth=auth, timeout=self.timeout)
+                outcome = 'online' if response.status_code == 200 else 'error'
+                return response, round((time.perf_counter() - start) * 1000, 2)
+            finally:
+                frps_request_duration.labels(api, outcome).observe(time.perf_counter() - start)
+
+        executor = self._get_status_executor()
+        server_future = executor.submit(fetch, 'serverinfo', '/api/serverinfo')
+        proxy_futures = [executor.submit(fetch, 'proxy', f'/api/proxy/{proxy_type}') for proxy_type in PROXY_TYPES]
+
+        health = {
+            'status': 'offline',
+            'latency_ms': None,
+            'checked_at': datetime.utcnow().isoformat(),
+            'error': None
+        }
+        try:
+            response, latency_ms = server_future.result()
+            health['latency_ms'] = latency_ms
+            if response.status_code == 200:
+                status_info['status'] = 'online'
+                status_info['server_info'] = response.json()
+            else:
+                status_info['status'] = 'error'
+                status_info['error'] = f'HTTP {response.status_code}'
+        except Exception as e:
+            status_info['error'] = str(e)
+            if not isinstance(e, requests.exceptions.RequestException):
+                status_info['status'] = 'error'
+
+        for future in proxy_futures:
+            try:
+                response, _ = future.result()
+                if response.status_code == 200:
+                    status_info['proxies'].extend(response.json().get('proxies') or [])
+            except Exception as e:
+                if status_info['error'] is None:
+                    status_info['error'] = str(e)
+
+        health['status'] = status_info['status']
+        health['error'] = status_info['error']
+        self.store(snapshot['id'], health)
+        return status_info
+
+    def refresh(self):
+        """并发探测所有节点，并把状态变化写回数据库"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            with self._app.app_context():
+                nodes = db.session.execute(select(Node)).scalars().all()
+                snapshots = [node_snapshot(node) for node in nodes]
+                old_status = {node.id: node.status for node in nodes}
+                db.session.rollback()
+
+                results = self._get_executor().map(self.probe, snapshots)
+
+                # 清理已删除节点的缓存
+                with self._lock:
+                    live_ids = {snapshot['id'] for snapshot in snapshots}
+                    for node_id in list(self._cache):
+                        if node_id not in live_ids:
+                            del self._cache[node_id]
+
+                changed = False
+                for snapshot, result in zip(snapshots, results):
+                    self.store(snapshot['id'], result)
+                    if old_status[snapshot['id']] != result['status']:
+                        db.session.execute(
+                            update(Node).where(Node.id == snapshot['id']).values(
+                                status=result['status'], updated_at=datetime.utcnow(), row_version=Node.row_version + 1
+                            ).execution_options(synchronize_session=False)
+                        )
+                        changed = True
+                if changed:
+                    db.session.commit()
+        except Exception:
+            self._app.logger.exception('节点状态探测失败')
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_async(self):
+        """在后台触发一次探测，不阻塞当前请求"""
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self.refresh, name='node-monitor-refresh', daemon=True).start()
+
+
+node_monitor = NodeMonitor()
@@ -0,0 +1,185 @@
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import select, update
+from src.models.user import db, User
+from src.models.user_group import UserGroup
+from src.models.package import Package, UserPackage
+from src.models.quota import UserQuotaUsage
+from src.services.lease import acquire_lease, lease_owner, release_lease
+from src.services.limits import active_package_filter, limits_resolver
+from src.services.principal import principal_cache
+from src.services.quota import current_period
+
+# 任务在租约表中的名称
+LEASE_NAME = 'package_expiry'
+
+
+def expire_packages(now=None, batch_size=1000):
+    """停用已到期的套餐，返回 (停用的套餐数, 回到默认用户组的用户数)
+
+    按 (is_active, end_date) 索引分批读取到期套餐，每批一条更新语句停用，条件中重复检查
+    is_active，重复执行或多个进程同时执行时不会重复处理。
+    旧版本购买套餐时会把用户移入 "{套餐名}组"，这类用户在没有其他生效中的套餐时移回默认用户组；
+    管理员分配的其他用户组保持不变。
+    """
+    now = now or datetime.utcnow()
+    default_group_id = db.session.scalar(
+        select(UserGroup.id).where(UserGroup.is_default == True).order_by(UserGroup.id).limit(1)
+    )
+    expired = moved = 0
+
+    while True:
+        rows = db.session.execute(
+            select(UserPackage.id, UserPackage.user_id)
+            .where(UserPackage.is_active == True, UserPackage.end_date <= now)
+            .order_by(UserPackage.end_date)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        ids = [row.id for row in rows]
+        user_ids = sorted({row.user_id for row in rows})
+        try:
+            expired += db.session.execute(
+                update(UserPackage).where(
+                    UserPackage.id.in_(ids), UserPackage.is_active == True, UserPackage.end_date <= now
+                ).values(is_active=False, updated_at=now, row_version=UserPackage.row_version + 1).execution_options(synchronize_session=False)
+            ).rowcount
+
+            purchase_groups = select(UserGroup.id).join(Package, UserGroup.name == Package.name + '组')
+            still_active = select(UserPackage.user_id).where(
+                UserPackage.user_id.in_(user_ids), *active_package_filter(now)
+            )
+            moved += db.session.execute(
+                update(User).where(
+                    User.id.in_(user_ids),
+                    User.user_group_id.in_(purchase_groups),
+                    User.id.not_in(still_active)
+                ).values(user_group_id=default_group_id).execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # 集合更新不触发映射器事件，手动使本进程的缓存失效
+        limits_resolver.invalidate(*user_ids)
+        for user_id in user_ids:
+            principal_cache.invalidate(user_id)
+
+        if len(rows) < batch_size:
+            break
+    return expired, moved
+
+
+def roll_usage_periods(now=None):
+    """把仍停留在上个计费周期的配额用量行重置到当前周期，返回重置的行数
+
+    配额引擎在周期切换后第一次累加时也会重置，这里统一处理本周期内还没有流量的用户，
+    使用量接口和阈值状态在周期开始时即归零。条件为 period_start 早于当前周期，可重复执行。
+    """
+    period = current_period((now or datetime.utcnow()).date())
+    try:
+        rolled = db.session.execute(
+            update(UserQuotaUsage).where(UserQuotaUsage.period_start < period).values(
+                period_traffic=0, notified_level=0, period_start=period
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rolled
+
+
+class PackageExpiryScheduler:
+    """后台套餐到期与用量周期任务
+
+    每 PACKAGE_EXPIRY_INTERVAL 秒执行一轮；多个工作进程通过数据库租约选出一个执行者，
+    持有者每轮续期，异常退出后租约到期由其他进程接管。
+    """
+
+    def __init__(self):
+        self.interval = 60.0
+        self.batch_size = 1000
+        self.owner = None
+        self.last_run = None
+        self._app = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('PACKAGE_EXPIRY_INTERVAL', 60.0)
+        app.config.setdefault('PACKAGE_EXPIRY_BATCH_SIZE', 1000)
+
+        self._app = app
+        self.interval = float(app.config['PACKAGE_EXPIRY_INTERVAL'])
+        self.batch_size = int(app.config['PACKAGE_EXPIRY_BATCH_SIZE'])
+        app.extensions['package_expiry'] = self
+
+    @property
+    def lease_ttl(self):
+        # 持有者错过一轮续期不会失去租约
+        return max(self.interval * 3, 30.0)
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.owner = lease_owner()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='package-expiry', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """停止后台线程并释放租约"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        if self.owner:
+            try:
+                with self._app.app_context():
+                    release_lease(LEASE_NAME, self.owner)
+            except Exception:
+                pass
+
+    def _run(self):
+        self.run_once()
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def run_once(self, now=None):
+        """执行一轮：取得租约后停用到期套餐并重置上个周期的用量，未取得租约时返回None"""
+        owner = self.owner or lease_owner()
+        try:
+            with self._app.app_context():
+                if not acquire_lease(LEASE_NAME, owner, self.lease_ttl):
+                    return None
+                try:
+                    expired, moved = expire_packages(now, self.batch_size)
+                    rolled = roll_usage_periods(now)
+                finally:
+                    db.session.remove()
+            self.last_run = {
+                'at': datetime.utcnow().isoformat(),
+                'expired_packages': expired,
+                'moved_users': moved,
+                'rolled_usage': rolled
+            }
+            return self.last_run
+        except Exception:
+            self._app.logger.exception('套餐到期任务失败')
+            return None
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'owner': self.owner,
+            'last_run': self.last_run
+        }
+
+
+package_expiry_scheduler = PackageExpiryScheduler()
@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, text
+from src.models.user import db
+
+# 单页最大条数
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(created_at, row_id, total=None):
+    """将最后一行的 (created_at, id) 及总数编码为游标"""
+    payload = {'c': created_at.isoformat() if created_at else None, 'i': row_id}
+    if total is not None:
+        payload['t'] = total
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id, total)，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        created_at = datetime.fromisoformat(payload['c']) if payload.get('c') else None
+        return created_at, int(payload['i']), payload.get('t')
+    except (TypeError, KeyError, ValueError) as e:
+        raise ValueError('游标格式错误') from e
+
+
+def keyset_after(created_at_column, id_column, created_at, row_id):
+    """按 (created_at, id) 倒序分页时，位于游标之后的行的过滤条件"""
+    if created_at is None:
+        return and_(created_at_column.is_(None), id_column < row_id)
+    return or_(
+        created_at_column < created_at,
+        and_(created_at_column == created_at, id_column < row_id),
+        created_at_column.is_(None)
+    )
+
+
+def estimate_table_rows(table_name):
+    """读取MySQL统计信息中的估算行数，其他数据库返回None"""
+    if db.session.get_bind().dialect.name != 'mysql':
+        return None
+    return db.session.execute(
+        text('SELECT TABLE_ROWS FROM information_schema.TABLES '
+             'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name'),
+        {'name': table_name}
+    ).scalar()
@@ -0,0 +1,173 @@
+import threading
+import time
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from src.models.user import db, User
+from src.models.user_group import UserGroup
+
+# 会话中暂存的待失效用户和用户组，事务提交后才使缓存失效
+_SESSION_INVALIDATE_KEY = 'principal_cache_invalidate'
+
+
+class UserPrincipal:
+    """当前登录用户的轻量信息（权限、状态和用户组限制）"""
+
+    __slots__ = (
+        'id', 'username', 'is_admin', 'is_active', 'user_group_id',
+        'max_tunnels', 'max_traffic', 'upload_speed_limit', 'download_speed_limit'
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.username}>'
+
+
+class PrincipalCache:
+    """进程内的用户信息缓存，用户或用户组变更的事务提交后自动失效
+
+    条目最多保留 PRINCIPAL_CACHE_TTL 秒；is_admin、is_active 和所属用户组每 PRINCIPAL_AUTH_TTL 秒
+    按主键核对一次，与缓存不一致时重新加载。失效只作用于本进程，其他工作进程中降权或停用的用户
+    最多在 PRINCIPAL_AUTH_TTL 秒内保留原有权限。
+    """
+
+    def __init__(self):
+        self.ttl = 30.0
+        self.auth_ttl = 5.0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('PRINCIPAL_CACHE_TTL', 30.0)
+        app.config.setdefault('PRINCIPAL_AUTH_TTL', 5.0)
+        self.ttl = float(app.config['PRINCIPAL_CACHE_TTL'])
+        self.auth_ttl = min(float(app.config['PRINCIPAL_AUTH_TTL']), self.ttl)
+        app.extensions['principal_cache'] = self
+
+    def get(self, user_id):
+        """返回缓存的用户信息，未命中、已过期或权限字段已变化时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= now:
+            return None
+        expires_at, verified_until, principal = entry
+        if verified_until > now:
+            return principal
+
+        # 权限字段超过 auth_ttl 未核对，按主键读取一次
+        row = db.session.execute(
+            select(User.is_admin, User.is_active, User.user_group_id).where(User.id == user_id)
+        ).first()
+        if row is None or tuple(row) != (principal.is_admin, principal.is_active, principal.user_group_id):
+            self.invalidate(user_id)
+            return None
+        with self._lock:
+            if self._entries.get(user_id) is entry:
+                self._entries[user_id] = (expires_at, now + self.auth_ttl, principal)
+        return principal
+
+    def put(self, principal):
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[principal.id] = (now + self.ttl, now + self.auth_ttl, principal)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def invalidate_group(self, group_id):
+        with self._lock:
+            for user_id, (_, _, principal) in list(self._entries.items()):
+                if principal.user_group_id == group_id:
+                    del self._entries[user_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+def load_principal(user_id):
+    """一次查询加载用户及其用户组限制"""
+    row = db.session.execute(
+        select(
+            User.id, User.username, User.is_admin, User.is_active, User.user_group_id,
+            UserGroup.max_tunnels, UserGroup.max_traffic,
+            UserGroup.upload_speed_limit, UserGroup.download_speed_limit
+        ).outerjoin(UserGroup, UserGroup.id == User.user_group_id).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    return UserPrincipal(**row._asdict())
+
+
+def current_principal():
+    """返回当前JWT身份对应的用户信息，同一请求内只解析一次，不存在时返回None"""
+    if 'principal' in g:
+        return g.principal
+
+    user_id = get_jwt_identity()
+    principal = None
+    if user_id is not None:
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            user_id = None
+    if user_id is not None:
+        principal = principal_cache.get(user_id)
+        if principal is None:
+            principal = load_principal(user_id)
+            if principal is not None:
+                principal_cache.put(principal)
+
+    g.principal = principal
+    return principal
+
+
+def _stage_invalidation(target, kind):
+    """刷新时记录待失效的用户或用户组，不在会话中时立即失效"""
+    session = object_session(target)
+    if session is None:
+        if kind == 'user':
+            principal_cache.invalidate(target.id)
+        else:
+            principal_cache.invalidate_group(target.id)
+        return
+    session.info.setdefault(_SESSION_INVALIDATE_KEY, set()).add((kind, target.id))
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    _stage_invalidation(target, 'user')
+
+
+@event.listens_for(UserGroup, 'after_update')
+@event.listens_for(UserGroup, 'after_delete')
+def _invalidate_group(mapper, connection, target):
+    _stage_invalidation(target, 'group')
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session):
+    staged = session.info.pop(_SESSION_INVALIDATE_KEY, None)
+    if staged:
+        for kind, target_id in staged:
+            if kind == 'user':
+                principal_cache.invalidate(target_id)
+            else:
+                principal_cache.invalidate_group(target_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    session.info.pop(_SESSION_INVALIDATE_KEY, None)
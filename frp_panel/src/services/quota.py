@@ -0,0 +1,304 @@
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import case, event, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+from src.models.user import db, User
+from src.models.tunnel import Tunnel
+from src.models.traffic import TrafficSummary
+from src.models.quota import UserQuotaUsage
+from src.services.batching import chunked
+from src.services.limits import limits_resolver
+from src.services.upsert import upsert_increment
+
+# 会话中暂存的阈值事件，事务提交后才发出
+_SESSION_EVENTS_KEY = 'quota_threshold_events'
+
+
+class QuotaExceeded(Exception):
+    """操作会超出用户配额"""
+
+    def __init__(self, resource, limit, used):
+        self.resource = resource
+        self.limit = limit
+        self.used = used
+        if resource == 'tunnels':
+            message = f'隧道数量已达上限（{limit}）'
+        else:
+            message = '本月流量已用完，请升级套餐或等待下个周期'
+        super().__init__(message)
+
+
+def current_period(today=None):
+    """当前计费周期的起始日期（自然月，UTC）"""
+    today = today or datetime.utcnow().date()
+    return today.replace(day=1)
+
+
+def traffic_limits(user_ids):
+    """返回 {用户ID: 有效流量上限}"""
+    return {user_id: limits.max_traffic for user_id, limits in limits_resolver.get_many(user_ids).items()}
+
+
+class QuotaEngine:
+    """配额检查与用量计数
+
+    每个用户一行 UserQuotaUsage，隧道增删和流量上报时在同一事务内原子增减，
+    检查配额只需按主键做一次带条件的更新或读取，与隧道和流量日志的总量无关。
+    计费周期切换时，第一次累加会把周期流量重置（批量重置由到期任务完成）。
+    用量越过 QUOTA_THRESHOLDS 中的百分比时，每个周期每个阈值只发出一次事件。
+    """
+
+    def __init__(self):
+        self.enforce = True
+        self.thresholds = (80, 100)
+        self.listeners = []
+        self.logger = logging.getLogger('frp_panel.quota')
+
+    def init_app(self, app):
+        app.config.setdefault('QUOTA_ENFORCE', True)
+        app.config.setdefault('QUOTA_THRESHOLDS', '80,100')
+
+        self.enforce = bool(app.config['QUOTA_ENFORCE'])
+        thresholds = app.config['QUOTA_THRESHOLDS']
+        if isinstance(thresholds, str):
+            thresholds = [value for value in thresholds.split(',') if value.strip()]
+        self.thresholds = tuple(sorted(int(value) for value in thresholds))
+        app.extensions['quota_engine'] = self
+
+    def on_threshold(self, callback):
+        """注册阈值事件回调，callback(event) 在事务提交后调用"""
+        self.listeners.append(callback)
+        return callback
+
+    def limit_for(self, principal, resource):
+        """返回需要执行的有效配额上限；管理员、未启用配额或不限制时返回None"""
+        if not self.enforce or principal is None or principal.is_admin:
+            return None
+        limits = limits_resolver.get(principal.id)
+        if limits is None:
+            return None
+        return limits.max_tunnels if resource == 'tunnels' else limits.max_traffic
+
+    def _ensure_rows(self, user_ids):
+        """为尚无计数行的用户插入空行（已存在时不变）"""
+        upsert_increment(
+            UserQuotaUsage,
+            [{'user_id': user_id, 'tunnel_count': 0, 'period_traffic': 0, 'notified_level': 0,
+              'period_start': current_period()} for user_id in sorted(set(user_ids))],
+            key_columns=('user_id',),
+            increment_columns=('tunnel_count',)
+        )
+
+    def acquire_tunnels(self, user_id, limit=None, count=1):
+        """占用隧道名额，超出 limit 时抛出 QuotaExceeded；在创建隧道的同一事务内调用
+
+        带条件的原子更新会锁住该用户的计数行直到事务结束，并发创建不会超出上限。
+        """
+        stmt = update(UserQuotaUsage).where(UserQuotaUsage.user_id == user_id).values(
+            tunnel_count=UserQuotaUsage.tunnel_count + count
+        )
+        if limit is not None:
+            stmt = stmt.where(UserQuotaUsage.tunnel_count + count <= limit)
+        stmt = stmt.execution_options(synchronize_session=False)
+
+        if db.session.execute(stmt).rowcount:
+            return
+        self._ensure_rows([user_id])
+        if not db.session.execute(stmt).rowcount:
+            used = db.session.scalar(
+                select(UserQuotaUsage.tunnel_count).where(UserQuotaUsage.user_id == user_id))
+            raise QuotaExceeded('tunnels', limit, used)
+
+    def release_tunnels(self, user_counts):
+        """归还隧道名额，user_counts 为 {用户ID: 删除的隧道数}"""
+        for user_id, count in sorted(user_counts.items()):
+            db.session.execute(
+                update(UserQuotaUsage).where(UserQuotaUsage.user_id == user_id).values(
+                    tunnel_count=case(
+                        (UserQuotaUsage.tunnel_count > count, UserQuotaUsage.tunnel_count - count), else_=0
+                    )
+                ).execution_options(synchronize_session=False)
+            )
+
+    def add_traffic(self, user_totals):
+        """累加周期流量并检查阈值，user_totals 为 {用户ID: 字节数}；在写入流量的同一事务内调用"""
+        user_totals = {user_id: total for user_id, total in user_totals.items() if total}
+        if not user_totals:
+            return
+
+        period = current_period()
+        same_period = UserQuotaUsage.period_start == period
+        missing = []
+        for user_id, total in sorted(user_totals.items()):
+            # MySQL 按顺序执行赋值，period_start 必须最后更新
+            stmt = update(UserQuotaUsage).where(UserQuotaUsage.user_id == user_id).ordered_values(
+                (UserQuotaUsage.period_traffic,
+                 case((same_period, UserQuotaUsage.period_traffic + total), else_=total)),
+                (UserQuotaUsage.notified_level, case((same_period, UserQuotaUsage.notified_level), else_=0)),
+                (UserQuotaUsage.period_start, period)
+            ).execution_options(synchronize_session=False)
+            if not db.session.execute(stmt).rowcount:
+                missing.append((user_id, stmt))
+        if missing:
+            self._ensure_rows([user_id for user_id, _ in missing])
+            for _, stmt in missing:
+                db.session.execute(stmt)
+
+        self.check_thresholds(user_totals.keys())
+
+    def check_thresholds(self, user_ids):
+        """检查用户的周期流量是否越过新的阈值，事件在事务提交后发出"""
+        if not self.thresholds:
+            return
+        limits = traffic_limits(user_ids)
+        candidates = [user_id for user_id in user_ids if limits.get(user_id)]
+        if not candidates:
+            return
+
+        events = []
+        for chunk in chunked(candidates):
+            rows = db.session.execute(
+                select(UserQuotaUsage.user_id, UserQuotaUsage.period_traffic, UserQuotaUsage.notified_level,
+                       UserQuotaUsage.period_start)
+                .where(UserQuotaUsage.user_id.in_(chunk))
+            ).all()
+            for row in rows:
+                limit = limits[row.user_id]
+                level = max((t for t in self.thresholds if row.period_traffic * 100 >= t * limit), default=0)
+                if level <= row.notified_level:
+                    continue
+                # 条件更新保证多个进程同时越过阈值时只有一个发出事件
+                claimed = db.session.execute(
+                    update(UserQuotaUsage).where(
+                        UserQuotaUsage.user_id == row.user_id, UserQuotaUsage.notified_level < level
+                    ).values(notified_level=level).execution_options(synchronize_session=False)
+                ).rowcount
+                if claimed:
+                    events.append({
+                        'user_id': row.user_id,
+                        'level': level,
+                        'period_traffic': row.period_traffic,
+                        'max_traffic': limit,
+                        'period_start': row.period_start.isoformat()
+                    })
+        if events:
+            db.session.info.setdefault(_SESSION_EVENTS_KEY, []).extend(events)
+
+    def emit(self, events):
+        for quota_event in events:
+            for listener in self.listeners:
+                try:
+                    listener(quota_event)
+                except Exception as e:
+                    self.logger.warning('配额事件处理失败: %s', e)
+
+    def traffic_used(self, user_id):
+        """本周期已用流量（含写后缓冲中尚未刷新的部分）"""
+        row = db.session.execute(
+            select(UserQuotaUsage.period_traffic, UserQuotaUsage.period_start)
+            .where(UserQuotaUsage.user_id == user_id)
+        ).first()
+        used = row.period_traffic if row and row.period_start == current_period() else 0
+        return used + self._pending_traffic(user_id)
+
+    def check_traffic(self, user_id, limit):
+        """本周期流量已用完时抛出 QuotaExceeded"""
+        if limit is None:
+            return
+        used = self.traffic_used(user_id)
+        if used >= limit:
+            raise QuotaExceeded('traffic', limit, used)
+
+    def usage(self, user_id):
+        """返回用户的用量计数，尚无计数行时返回空用量"""
+        usage = db.session.get(UserQuotaUsage, user_id)
+        period = current_period()
+        if usage is None:
+            return {'tunnel_count': 0, 'period_start': period.isoformat(), 'period_traffic': 0}
+        return {
+            'tunnel_count': usage.tunnel_count,
+            'period_start': period.isoformat(),
+            'period_traffic': usage.period_traffic if usage.period_start == period else 0
+        }
+
+    def report(self, principal):
+        """用户的用量与有效上限，供接口展示"""
+        usage = self.usage(principal.id)
+        usage['period_traffic'] += self._pending_traffic(principal.id)
+        limits = limits_resolver.get(principal.id)
+        max_tunnels = limits.max_tunnels if limits else None
+        max_traffic = limits.max_traffic if limits else None
+        return {
+            'user_id': principal.id,
+            'enforced': self.enforce and not principal.is_admin,
+            'tunnels': {'used': usage['tunnel_count'], 'limit': max_tunnels},
+            'traffic': {
+                'used': usage['period_traffic'],
+                'limit': max_traffic,
+                'percent': round(usage['period_traffic'] * 100 / max_traffic, 2) if max_traffic else None
+            },
+            'period_start': usage['period_start']
+        }
+
+    def _pending_traffic(self, user_id):
+        from src.services.traffic_aggregator import traffic_aggregator
+        return traffic_aggregator.pending_user_total(user_id)
+
+
+quota_engine = QuotaEngine()
+
+
+def rebuild_usage(conn, user_ids=None, period=None):
+    """按隧道表和每日流量汇总重新计算用量计数（迁移回填、批量导入数据后使用）
+
+    user_ids 为None时重建所有用户，集合操作，不逐行加载。
+    """
+    period = period or current_period()
+    tunnel_count = select(func.count(Tunnel.id)).where(Tunnel.user_id == User.id).scalar_subquery()
+    period_traffic = select(
+        func.coalesce(func.sum(TrafficSummary.upload + TrafficSummary.download), 0)
+    ).where(TrafficSummary.user_id == User.id, TrafficSummary.date >= period).scalar_subquery()
+    now = datetime.utcnow()
+
+    chunks = [None] if user_ids is None else list(chunked(list(user_ids)))
+    for chunk in chunks:
+        users = select(User.id, tunnel_count, literal(period), period_traffic, literal(0), literal(now))
+        delete_stmt = UserQuotaUsage.__table__.delete()
+        if chunk is not None:
+            users = users.where(User.id.in_(chunk))
+            delete_stmt = delete_stmt.where(UserQuotaUsage.user_id.in_(chunk))
+        conn.execute(delete_stmt)
+        conn.execute(insert(UserQuotaUsage).from_select(
+            ['user_id', 'tunnel_count', 'period_start', 'period_traffic', 'notified_level', 'updated_at'], users
+        ))
+
+
+@quota_engine.on_threshold
+def _log_threshold(quota_event):
+    """把阈值事件写入 SystemLog"""
+    from src.models.log import SystemLog
+
+    level = quota_event['level']
+    message = (f"用户 {quota_event['user_id']} 本月流量已使用 {level}%"
+               f"（{quota_event['period_traffic']} / {quota_event['max_traffic']} 字节）")
+    with db.engine.begin() as conn:
+        conn.execute(insert(SystemLog), [{
+            'level': 'WARNING' if level >= 100 else 'INFO',
+            'module': 'quota',
+            'message': message,
+            'details': json.dumps(quota_event, ensure_ascii=False),
+            'created_at': datetime.utcnow()
+        }])
+
+
+@event.listens_for(Session, 'after_commit')
+def _emit_events(session):
+    events = session.info.pop(_SESSION_EVENTS_KEY, None)
+    if events:
+        quota_engine.emit(events)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_events(session, previous_transaction):
+    session.info.pop(_SESSION_EVENTS_KEY, None)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, current_app
+from src.services.conditional import cache_headers, is_not_modified
+from src.services.metrics import registry
+
+logger = logging.getLogger('frp_panel.response_cache')
+
+response_cache_requests = registry.counter(
+    'frp_panel_response_cache_requests_total', '响应缓存查询次数（hit 命中，miss 未命中）',
+    ('namespace', 'result'))
+
+
+class LocalBackend:
+    """进程内的LRU缓存，条目按TTL过期；命名空间版本号不会被淘汰"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, namespace):
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """多个工作进程共享的Redis缓存，值以JSON保存；需要安装 redis 包"""
+
+    def __init__(self, url, prefix='frp_panel:cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.prefix = prefix
+        self.client.ping()
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), px=max(1, int(ttl * 1000)))
+
+    def version(self, namespace):
+        return int(self.client.get(f'{self.prefix}version:{namespace}') or 0)
+
+    def bump(self, namespace):
+        self.client.incr(f'{self.prefix}version:{namespace}')
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class ResponseCache:
+    """读多写少接口的响应缓存
+
+    缓存键为 命名空间:版本号:键，写操作提交后调用 invalidate(命名空间) 递增版本号，
+    旧条目不再被读取并随LRU或TTL淘汰。默认使用进程内缓存（只能使本进程的缓存失效，
+    其他工作进程最多延迟 RESPONSE_CACHE_TTL 秒），RESPONSE_CACHE_BACKEND=redis 时各进程共享缓存，
+    Redis 不可用时退回进程内缓存。
+    """
+
+    def __init__(self):
+        self.ttl = 30.0
+        self.backend = LocalBackend()
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_TTL', 30.0)
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'local')
+        app.config.setdefault('RESPONSE_CACHE_REDIS_URL', None)
+
+        self.ttl = float(app.config['RESPONSE_CACHE_TTL'])
+        self.backend = LocalBackend(app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+        if app.config['RESPONSE_CACHE_BACKEND'] == 'redis' and self.ttl > 0:
+            try:
+                self.backend = RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL'])
+            except Exception as e:
+                logger.warning('响应缓存无法使用Redis，改用进程内缓存: %s', e)
+        app.extensions['response_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _key(self, namespace, key):
+        return f'{namespace}:{self.backend.version(namespace)}:{key}'
+
+    def get_or_build(self, namespace, key, build):
+        """返回缓存的值，未命中时调用 build() 生成并缓存；build() 返回None时不缓存"""
+        if not self.enabled:
+            return build()
+        try:
+            cache_key = self._key(namespace, key)
+            value = self.backend.get(cache_key)
+        except Exception as e:
+            logger.warning('读取响应缓存失败: %s', e)
+            return build()
+        if value is not None:
+            response_cache_requests.labels(namespace, 'hit').inc()
+            return value
+
+        response_cache_requests.labels(namespace, 'miss').inc()
+        value = build()
+        if value is not None:
+            try:
+                self.backend.set(cache_key, value, self.ttl)
+            except Exception as e:
+                logger.warning('写入响应缓存失败: %s', e)
+        return value
+
+    def json_response(self, namespace, key, build):
+        """缓存序列化后的JSON响应，返回支持 If-None-Match 的响应；build() 返回None时返回None"""
+        def build_entry():
+            payload = build()
+            return serialize(payload) if payload is not None else None
+
+        entry = self.get_or_build(namespace, key, build_entry)
+        if entry is None:
+            return None
+        return conditional_response(entry['body'], entry['etag'])
+
+    def invalidate(self, *namespaces):
+        """使命名空间下的所有缓存失效，应在写操作提交之后调用"""
+        for namespace in namespaces:
+            try:
+                self.backend.bump(namespace)
+            except Exception as e:
+                logger.warning('响应缓存失效失败: %s', e)
+
+    def clear(self):
+        self.backend.clear()
+
+
+response_cache = ResponseCache()
+
+
+def serialize(payload):
+    """按 jsonify 的格式序列化并计算 ETag
+
+    直接使用 jsonify 的序列化（紧凑分隔符、键排序、调试模式缩进），缓存命中与未命中的响应逐字节相同。
+    """
+    body = current_app.json.response(payload).get_data(as_text=True)
+    return {'body': body, 'etag': hashlib.sha1(body.encode('utf-8')).hexdigest()}
+
+
+def conditional_response(body, etag):
+    """带 ETag 的JSON响应，客户端的 If-None-Match 匹配时返回304"""
+    if is_not_modified(etag):
+        return cache_headers(Response(status=304), etag)
+    return cache_headers(Response(body, mimetype='application/json'), etag)
+
@@ -0,0 +1,240 @@
+import json
+import logging
+import random
+import time
+from datetime import datetime
+from flask import g, has_request_context, request
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+
+# 报告中单条SQL和参数的最大长度
+MAX_STATEMENT_LENGTH = 500
+MAX_PARAMS_LENGTH = 200
+# 报告中最多列出的慢查询和重复查询条数
+MAX_REPORTED = 10
+
+
+class RequestProfile:
+    """单个请求的SQL执行记录"""
+
+    __slots__ = ('started', 'count', 'total', 'statements', 'slow')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.total = 0.0
+        # 语句文本 -> [执行次数, 总耗时]，同一语句（参数不同）反复执行即可能是 N+1 查询
+        self.statements = {}
+        self.slow = []
+
+    def record(self, statement, parameters, elapsed, slow_query_seconds):
+        self.count += 1
+        self.total += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+        if elapsed >= slow_query_seconds:
+            self.slow.append((elapsed, statement, parameters))
+
+
+def _truncate(text, limit):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def describe_parameters(parameters):
+    """只保留参数的类型，不含取值（参数中可能有密码哈希、令牌、邮箱等）
+
+    单组参数返回各参数的类型名，批量执行（多组参数）返回组数和第一组的类型名。
+    """
+    def types(values):
+        if isinstance(values, dict):
+            return {key: type(value).__name__ for key, value in values.items()}
+        if isinstance(values, (list, tuple)):
+            return [type(value).__name__ for value in values]
+        return type(values).__name__
+
+    if isinstance(parameters, list) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        return {'batches': len(parameters), 'types': types(parameters[0])}
+    return types(parameters)
+
+
+class SqlProfiler:
+    """按比例抽样的SQL性能分析
+
+    被抽中的请求记录每条SQL的耗时，请求结束时若超过阈值（总耗时、SQL条数、单条慢查询）
+    或同一语句重复执行达到 SQL_PROFILER_REPEAT_THRESHOLD 次（可能的 N+1 查询），
+    将报告写入 SystemLog 或日志文件。未抽中的请求只多一次随机数判断。
+    报告中的慢查询默认只记录参数类型，SQL_PROFILER_LOG_PARAMETERS 开启时才记录（截断的）参数值。
+    """
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.slow_request = 0.5
+        self.slow_query = 0.1
+        self.max_queries = 50
+        self.repeat_threshold = 10
+        self.sink = 'systemlog'
+        self.log_parameters = False
+        self.logger = logging.getLogger('frp_panel.sql_profiler')
+        self._app = None
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER_SAMPLE_RATE', 0.0)
+        app.config.setdefault('SQL_PROFILER_SLOW_REQUEST_MS', 500)
+        app.config.setdefault('SQL_PROFILER_SLOW_QUERY_MS', 100)
+        app.config.setdefault('SQL_PROFILER_MAX_QUERIES', 50)
+        app.config.setdefault('SQL_PROFILER_REPEAT_THRESHOLD', 10)
+        app.config.setdefault('SQL_PROFILER_SINK', 'systemlog')
+        app.config.setdefault('SQL_PROFILER_LOG_FILE', 'sql_profile.log')
+        app.config.setdefault('SQL_PROFILER_LOG_PARAMETERS', False)
+
+        self._app = app
+        self.sample_rate = min(1.0, max(0.0, float(app.config['SQL_PROFILER_SAMPLE_RATE'])))
+        self.slow_request = float(app.config['SQL_PROFILER_SLOW_REQUEST_MS']) / 1000
+        self.slow_query = float(app.config['SQL_PROFILER_SLOW_QUERY_MS']) / 1000
+        self.max_queries = int(app.config['SQL_PROFILER_MAX_QUERIES'])
+        self.repeat_threshold = max(2, int(app.config['SQL_PROFILER_REPEAT_THRESHOLD']))
+        self.sink = app.config['SQL_PROFILER_SINK']
+        self.log_parameters = bool(app.config['SQL_PROFILER_LOG_PARAMETERS'])
+        app.extensions['sql_profiler'] = self
+
+        if self.sample_rate <= 0:
+            return
+
+        if self.sink == 'file' and not self.logger.handlers:
+            handler = logging.FileHandler(app.config['SQL_PROFILER_LOG_FILE'], encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+
+        install_engine_listeners()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        if random.random() < self.sample_rate:
+            g._sql_profile = RequestProfile()
+
+    def _after_request(self, response):
+        profile = g.pop('_sql_profile', None)
+        if profile is None:
+            return response
+        try:
+            report = self.analyze(profile, time.perf_counter() - profile.started)
+            if report:
+                report.update({
+                    'method': request.method,
+                    'path': request.path,
+                    'endpoint': request.endpoint,
+                    'status': response.status_code
+                })
+                self.emit(report)
+        except Exception as e:
+            self.logger.warning('SQL性能报告写入失败: %s', e)
+        return response
+
+    def analyze(self, profile, duration):
+        """根据阈值生成报告，未超过任何阈值时返回None"""
+        repeated = sorted(
+            ((statement, stats) for statement, stats in profile.statements.items()
+             if stats[0] >= self.repeat_threshold),
+            key=lambda item: item[1][0], reverse=True
+        )
+
+        reasons = []
+        if duration >= self.slow_request:
+            reasons.append('slow_request')
+        if profile.count > self.max_queries:
+            reasons.append('too_many_queries')
+        if profile.slow:
+            reasons.append('slow_query')
+        if repeated:
+            reasons.append('possible_n_plus_one')
+        if not reasons:
+            return None
+
+        slow = sorted(profile.slow, key=lambda item: item[0], reverse=True)[:MAX_REPORTED]
+        return {
+            'reasons': reasons,
+            'duration_ms': round(duration * 1000, 2),
+            'query_count': profile.count,
+            'query_ms': round(profile.total * 1000, 2),
+            'distinct_statements': len(profile.statements),
+            'slow_queries': [{
+                'statement': _truncate(statement, MAX_STATEMENT_LENGTH),
+                'parameters': (_truncate(parameters, MAX_PARAMS_LENGTH) if self.log_parameters
+                               else describe_parameters(parameters)),
+                'ms': round(elapsed * 1000, 2)
+            } for elapsed, statement, parameters in slow],
+            'repeated': [{
+                'statement': _truncate(statement, MAX_STATEMENT_LENGTH),
+                'count': stats[0],
+                'total_ms': round(stats[1] * 1000, 2)
+            } for statement, stats in repeated[:MAX_REPORTED]]
+        }
+
+    def emit(self, report):
+        message = (f"{report['method']} {report['path']}: {report['query_count']} 条SQL，"
+                   f"SQL耗时 {report['query_ms']} ms，请求耗时 {report['duration_ms']} ms "
+                   f"({', '.join(report['reasons'])})")
+        if self.sink == 'file':
+            self.logger.info('%s %s', message, json.dumps(report, ensure_ascii=False))
+            return
+
+        from src.models.user import db
+        from src.models.log import SystemLog
+
+        # 使用独立连接写入，不影响请求的事务；写入语句本身不会被记录（抽样标记已清除）
+        with db.engine.begin() as conn:
+            conn.execute(insert(SystemLog), [{
+                'level': 'WARNING',
+                'module': 'sql_profiler',
+                'message': message,
+                'details': json.dumps(report, ensure_ascii=False),
+                'created_at': datetime.utcnow()
+            }])
+
+
+sql_profiler = SqlProfiler()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and g.get('_sql_profile') is not None:
+        conn.info.setdefault('profiler_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profiler_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    profile = g.get('_sql_profile') if has_request_context() else None
+    if profile is not None:
+        profile.record(statement, parameters, elapsed, sql_profiler.slow_query)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None:
+        starts = conn.info.get('profiler_query_start')
+        if starts:
+            starts.pop()
+
+
+_engine_listeners_installed = False
+
+
+def install_engine_listeners():
+    """在所有 Engine 上安装SQL计时监听（进程内只安装一次）"""
+    global _engine_listeners_installed
+    if _engine_listeners_installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _engine_listeners_installed = True
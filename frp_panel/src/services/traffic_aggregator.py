@@ -0,0 +1,165 @@
+import atexit
+import threading
+from sqlalchemy import event, update, func
+from sqlalchemy.orm import Session
+from src.models.user import db, User
+from src.models.traffic import TrafficSummary
+from src.services.upsert import upsert_increment
+from src.services.quota import quota_engine
+
+# 会话中暂存待合并增量的键名，事务提交后才进入缓冲区
+_SESSION_PENDING_KEY = 'traffic_aggregator_pending'
+
+
+class TrafficAggregator:
+    """进程内流量增量聚合器（写后缓冲）
+
+    按 (用户, 隧道, 日期) 缓冲每日汇总的上传/下载增量以及用户总流量增量，
+    按固定间隔或缓冲键数达到阈值时，用原子累加语句批量刷新到数据库，
+    使流量上报请求不再竞争 TrafficSummary 和 User 的热点行。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.flush_interval = 5.0
+        self.max_keys = 10000
+        self.dropped = 0
+        self.flush_count = 0
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._summaries = {}
+        self._user_totals = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('TRAFFIC_WRITE_BEHIND', False)
+        app.config.setdefault('TRAFFIC_FLUSH_INTERVAL', 5.0)
+        app.config.setdefault('TRAFFIC_FLUSH_MAX_KEYS', 10000)
+
+        self._app = app
+        self.enabled = bool(app.config['TRAFFIC_WRITE_BEHIND'])
+        self.flush_interval = float(app.config['TRAFFIC_FLUSH_INTERVAL'])
+        self.max_keys = int(app.config['TRAFFIC_FLUSH_MAX_KEYS'])
+        app.extensions['traffic_aggregator'] = self
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='traffic-aggregator', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """停止后台线程并刷新剩余数据"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def stage(self, session, summary_rows, user_totals):
+        """在当前事务中暂存增量，事务提交后才会合并进缓冲区"""
+        pending = session.info.setdefault(_SESSION_PENDING_KEY, [])
+        pending.append((summary_rows, user_totals))
+
+    def add(self, summary_rows, user_totals):
+        """合并增量到缓冲区，缓冲键数达到阈值时立即刷新"""
+        with self._lock:
+            self._merge(summary_rows, user_totals)
+            should_flush = len(self._summaries) >= self.max_keys
+
+        if should_flush:
+            self.flush()
+
+    def _merge(self, summary_rows, user_totals):
+        for row in summary_rows:
+            key = (row['user_id'], row['tunnel_id'], row['date'])
+            delta = self._summaries.setdefault(key, [0, 0])
+            delta[0] += row['upload']
+            delta[1] += row['download']
+        for user_id, total in user_totals.items():
+            self._user_totals[user_id] = self._user_totals.get(user_id, 0) + total
+
+    def pending_keys(self):
+        """缓冲中尚未刷新的键数"""
+        with self._lock:
+            return len(self._summaries) + len(self._user_totals)
+
+    def pending_user_total(self, user_id):
+        """返回该用户尚未刷新到数据库的流量增量"""
+        with self._lock:
+            return self._user_totals.get(user_id, 0)
+
+    def flush(self):
+        """将缓冲的增量写入数据库，写入失败时放回缓冲区等待下次重试"""
+        with self._flush_lock:
+            with self._lock:
+                summaries, self._summaries = self._summaries, {}
+                user_totals, self._user_totals = self._user_totals, {}
+
+            if not summaries and not user_totals:
+                return
+
+            summary_rows = [{
+                'user_id': key[0],
+                'tunnel_id': key[1],
+                'date': key[2],
+                'upload': delta[0],
+                'download': delta[1]
+            } for key, delta in sorted(summaries.items())]
+
+            try:
+                with self._app.app_context():
+                    try:
+                        upsert_increment(
+                            TrafficSummary,
+                            summary_rows,
+                            key_columns=('user_id', 'tunnel_id', 'date'),
+                            increment_columns=('upload', 'download')
+                        )
+                        for user_id, total in sorted(user_totals.items()):
+                            db.session.execute(
+                                update(User).where(User.id == user_id).values(
+                                    total_traffic=func.coalesce(User.total_traffic, 0) + total
+                                ).execution_options(synchronize_session=False)
+                            )
+                        quota_engine.add_traffic(user_totals)
+                        db.session.commit()
+                        self.flush_count += 1
+                    except Exception:
+                        db.session.rollback()
+                        raise
+            except Exception:
+                self._app.logger.exception('刷新流量缓冲失败')
+                self._requeue(summary_rows, user_totals)
+
+    def _requeue(self, summary_rows, user_totals):
+        with self._lock:
+            # 缓冲区上限为阈值的两倍，数据库长时间不可用时丢弃多余数据以限制内存
+            if len(self._summaries) + len(summary_rows) > self.max_keys * 2:
+                self.dropped += len(summary_rows)
+                return
+            self._merge(summary_rows, user_totals)
+
+
+traffic_aggregator = TrafficAggregator()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+    pending = session.info.pop(_SESSION_PENDING_KEY, None)
+    if pending:
+        for summary_rows, user_totals in pending:
+            traffic_aggregator.add(summary_rows, user_totals)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop(_SESSION_PENDING_KEY, None)
@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from src.models.traffic import TrafficLog, TrafficSummary
+
+# 服务端游标每次读取的行数，也是每次写出的行数
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+LOG_COLUMNS = ('id', 'user_id', 'tunnel_id', 'upload', 'download', 'timestamp')
+SUMMARY_COLUMNS = ('id', 'user_id', 'tunnel_id', 'date', 'upload', 'download')
+
+
+def build_export_query(kind, user_id=None, tunnel_id=None, start_date=None, end_date=None):
+    """构建导出查询，kind 为 logs（原始流量日志）或 summary（每日汇总），返回 (语句, 列名)
+
+    只查询需要的列并按时间排序，日期范围包含 start_date 和 end_date 当天。
+    """
+    if kind == 'logs':
+        model, columns, time_column = TrafficLog, LOG_COLUMNS, TrafficLog.timestamp
+        start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+        end = datetime.combine(end_date + timedelta(days=1), datetime.min.time()) if end_date else None
+    else:
+        model, columns, time_column = TrafficSummary, SUMMARY_COLUMNS, TrafficSummary.date
+        start = start_date
+        end = end_date + timedelta(days=1) if end_date else None
+
+    stmt = select(*(getattr(model, name) for name in columns))
+    if user_id is not None:
+        stmt = stmt.where(model.user_id == user_id)
+    if tunnel_id is not None:
+        stmt = stmt.where(model.tunnel_id == tunnel_id)
+    if start is not None:
+        stmt = stmt.where(time_column >= start)
+    if end is not None:
+        stmt = stmt.where(time_column < end)
+    return stmt.order_by(time_column, model.id), columns
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _encode_ndjson(columns, rows):
+    return ''.join(
+        json.dumps(dict(zip(columns, map(_json_value, row))), ensure_ascii=False) + '\n' for row in rows
+    )
+
+
+def _encode_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_json_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def stream_export(engine, stmt, columns, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """逐批读取并编码查询结果的生成器
+
+    使用独立连接和服务端游标（stream_results + yield_per），内存占用只与批大小有关，
+    与导出总行数无关；客户端断开时生成器被关闭，连接随之归还连接池。
+    """
+    encode = _encode_csv if fmt == 'csv' else _encode_ndjson
+    if fmt == 'csv':
+        yield _encode_csv(columns, [columns])
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for rows in result.partitions():
+            yield encode(columns, rows)
@@ -0,0 +1,144 @@
+from datetime import datetime
+from sqlalchemy import select, insert, update, func
+from src.models.user import db, User
+from src.models.tunnel import Tunnel
+from src.models.traffic import TrafficLog, TrafficSummary
+from src.services.upsert import upsert_increment
+from src.services.traffic_aggregator import traffic_aggregator
+from src.services.batching import IN_CLAUSE_CHUNK_SIZE, chunked
+from src.services.metrics import traffic_batches, traffic_samples
+from src.services.quota import quota_engine
+
+# 单次批量上报允许的最大样本数
+MAX_BATCH_SIZE = 5000
+
+def parse_timestamp(value):
+    """解析样本时间戳，支持ISO格式字符串和Unix时间戳，缺省为当前UTC时间"""
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, bool):
+        raise ValueError('timestamp 格式错误')
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            # 统一转换为不带时区的UTC时间
+            parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+        return parsed
+    raise ValueError('timestamp 格式错误')
+
+
+def normalize_sample(data):
+    """校验并规范化单条流量样本，返回 (sample, error)"""
+    if not isinstance(data, dict):
+        return None, '样本格式错误'
+
+    for field in ('tunnel_id', 'upload', 'download'):
+        if field not in data:
+            return None, f'{field} 不能为空'
+
+    try:
+        tunnel_id = int(data['tunnel_id'])
+        upload = int(data['upload'])
+        download = int(data['download'])
+    except (TypeError, ValueError):
+        return None, 'tunnel_id、upload、download 必须为整数'
+
+    if upload < 0 or download < 0:
+        return None, '流量数据不能为负数'
+
+    try:
+        timestamp = parse_timestamp(data.get('timestamp'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None, 'timestamp 格式错误'
+
+    return {
+        'tunnel_id': tunnel_id,
+        'upload': upload,
+        'download': download,
+        'timestamp': timestamp
+    }, None
+
+
+def record_ingest_metrics(endpoint, accepted=0, rejected=0, denied=0):
+    """记录一次上报请求的样本处理结果"""
+    traffic_batches.labels(endpoint).inc()
+    for result, count in (('accepted', accepted), ('rejected', rejected), ('denied', denied)):
+        if count:
+            traffic_samples.labels(result).inc(count)
+
+
+def get_owned_tunnel_ids(user_id, tunnel_ids):
+    """一次性查询属于该用户的隧道ID集合"""
+    owned = set()
+    for chunk in chunked(sorted(tunnel_ids), IN_CLAUSE_CHUNK_SIZE):
+        owned.update(db.session.execute(
+            select(Tunnel.id).where(Tunnel.user_id == user_id, Tunnel.id.in_(chunk))
+        ).scalars())
+    return owned
+
+
+def ingest_samples(user_id, samples):
+    """批量写入已校验的流量样本
+
+    在同一事务内完成：隧道归属校验、流量日志批量插入、
+    按 (用户, 隧道, 日期) 合并后的每日汇总累加，以及用户总流量和配额周期流量累加。
+    启用写后缓冲（TRAFFIC_WRITE_BEHIND）时，后几项在事务提交后由聚合器异步写入。
+    返回 (已写入样本列表, 无权限的隧道ID集合)。调用方负责提交事务。
+    """
+    if not samples:
+        return [], set()
+
+    owned = get_owned_tunnel_ids(user_id, {s['tunnel_id'] for s in samples})
+    accepted = [s for s in samples if s['tunnel_id'] in owned]
+    denied = {s['tunnel_id'] for s in samples if s['tunnel_id'] not in owned}
+
+    if not accepted:
+        return [], denied
+
+    # 批量插入流量日志
+    db.session.execute(insert(TrafficLog), [{
+        'user_id': user_id,
+        'tunnel_id': s['tunnel_id'],
+        'upload': s['upload'],
+        'download': s['download'],
+        'timestamp': s['timestamp']
+    } for s in accepted])
+
+    # 按 (用户, 隧道, 日期) 合并增量
+    deltas = {}
+    for s in accepted:
+        key = (user_id, s['tunnel_id'], s['timestamp'].date())
+        delta = deltas.setdefault(key, [0, 0])
+        delta[0] += s['upload']
+        delta[1] += s['download']
+
+    summary_rows = [{
+        'user_id': key[0],
+        'tunnel_id': key[1],
+        'date': key[2],
+        'upload': delta[0],
+        'download': delta[1]
+    } for key, delta in sorted(deltas.items())]
+    total = sum(s['upload'] + s['download'] for s in accepted)
+
+    # 启用写后缓冲时，汇总和总流量的累加在事务提交后交给聚合器异步刷新
+    if traffic_aggregator.enabled:
+        traffic_aggregator.stage(db.session, summary_rows, {user_id: total})
+        return accepted, denied
+
+    upsert_increment(
+        TrafficSummary,
+        summary_rows,
+        key_columns=('user_id', 'tunnel_id', 'date'),
+        increment_columns=('upload', 'download')
+    )
+
+    # 更新用户总流量
+    db.session.execute(
+        update(User).where(User.id == user_id).values(total_traffic=func.coalesce(User.total_traffic, 0) + total)
+    )
+    quota_engine.add_traffic({user_id: total})
+
+    return accepted, denied
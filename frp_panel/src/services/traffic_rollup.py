@@ -0,0 +1,319 @@
+import atexit
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, func
+from src.models.user import db
+from src.models.traffic import TrafficLog, TrafficRollup, TrafficRollupCheckpoint
+from src.services.upsert import upsert_increment
+
+# 汇总粒度（由细到粗）及对应的时间桶长度
+RESOLUTIONS = (
+    ('minute', timedelta(minutes=1)),
+    ('hour', timedelta(hours=1)),
+    ('day', timedelta(days=1)),
+)
+
+RESOLUTION_SECONDS = {name: int(size.total_seconds()) for name, size in RESOLUTIONS}
+
+# 汇总任务在检查点表中的名称
+CHECKPOINT_NAME = 'traffic_rollup'
+
+# 单次查询返回的最大时间桶数量，自动选择粒度时以此为上限
+MAX_POINTS = 1440
+
+# 默认稳定期（秒），应大于流量上报事务的最长耗时
+DEFAULT_SETTLE_SECONDS = 30.0
+
+
+def truncate(timestamp, resolution):
+    """将时间截断到所在时间桶的起始时间"""
+    if resolution == 'minute':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'未知的汇总粒度: {resolution}')
+
+
+def fold_logs(rows):
+    """将流量日志行 (user_id, tunnel_id, upload, download, timestamp) 合并为各粒度的时间桶增量"""
+    buckets = {}
+    for user_id, tunnel_id, upload, download, timestamp in rows:
+        if timestamp is None:
+            continue
+        for resolution, _ in RESOLUTIONS:
+            key = (resolution, user_id, tunnel_id, truncate(timestamp, resolution))
+            delta = buckets.setdefault(key, [0, 0])
+            delta[0] += upload or 0
+            delta[1] += download or 0
+    return buckets
+
+
+def _get_checkpoint(lock=False):
+    query = select(TrafficRollupCheckpoint).where(TrafficRollupCheckpoint.name == CHECKPOINT_NAME)
+    if lock:
+        query = query.with_for_update()
+    checkpoint = db.session.execute(query).scalar_one_or_none()
+    if checkpoint is None:
+        checkpoint = TrafficRollupCheckpoint(name=CHECKPOINT_NAME, last_log_id=0)
+        db.session.add(checkpoint)
+        db.session.flush()
+    return checkpoint
+
+
+def get_rolled_up_log_id():
+    """返回已汇总的最大流量日志ID"""
+    checkpoint = db.session.get(TrafficRollupCheckpoint, CHECKPOINT_NAME)
+    return checkpoint.last_log_id if checkpoint else 0
+
+
+def settle_checkpoint(checkpoint, settle_seconds, now=None):
+    """推进可以安全汇总的日志ID上界（调用方持有检查点行锁），返回 settled_log_id
+
+    上一次观察到的最大ID经过 settle_seconds 后才视为稳定：在此之前分配了更小ID的事务
+    已经提交或回滚，不会再出现新的较小ID，按ID推进检查点不会漏掉晚提交的日志。
+    settle_seconds 为0时直接以当前最大ID为上界（仅用于没有并发写入的离线脚本）。
+    """
+    now = now or datetime.utcnow()
+    if settle_seconds <= 0:
+        checkpoint.settled_log_id = db.session.scalar(select(func.max(TrafficLog.id))) or 0
+        return checkpoint.settled_log_id
+
+    if checkpoint.observed_at is None or checkpoint.observed_at <= now - timedelta(seconds=settle_seconds):
+        if checkpoint.observed_at is not None:
+            checkpoint.settled_log_id = max(checkpoint.settled_log_id or 0, checkpoint.observed_log_id or 0)
+        checkpoint.observed_log_id = db.session.scalar(select(func.max(TrafficLog.id))) or 0
+        checkpoint.observed_at = now
+    return checkpoint.settled_log_id or 0
+
+
+def rollup_pending(batch_size=10000, max_batches=100, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """将检查点之后、稳定上界之内的流量日志增量汇总到各粒度的时间桶
+
+    每批在一个事务内完成汇总和检查点推进，检查点行加锁以保证多进程下不会重复汇总。
+    检查点只推进到 settle_checkpoint 给出的上界，尚在稳定期内的日志留到下一轮，
+    查询时由 query_history 从原始日志合并。返回本次汇总的日志条数。
+    """
+    processed = 0
+    for _ in range(max_batches):
+        try:
+            checkpoint = _get_checkpoint(lock=True)
+            upper = settle_checkpoint(checkpoint, settle_seconds)
+            rows = db.session.execute(
+                select(TrafficLog.id, TrafficLog.user_id, TrafficLog.tunnel_id,
+                       TrafficLog.upload, TrafficLog.download, TrafficLog.timestamp)
+                .where(TrafficLog.id > checkpoint.last_log_id, TrafficLog.id <= upper)
+                .order_by(TrafficLog.id)
+                .limit(batch_size)
+            ).all()
+
+            if not rows:
+                db.session.commit()
+                break
+
+            buckets = fold_logs(row[1:] for row in rows)
+            upsert_increment(
+                TrafficRollup,
+                [{
+                    'resolution': key[0],
+                    'user_id': key[1],
+                    'tunnel_id': key[2],
+                    'bucket_start': key[3],
+                    'upload': delta[0],
+                    'download': delta[1]
+                } for key, delta in sorted(buckets.items())],
+                key_columns=('resolution', 'user_id', 'tunnel_id', 'bucket_start'),
+                increment_columns=('upload', 'download')
+            )
+
+            checkpoint.last_log_id = rows[-1][0]
+            db.session.commit()
+            processed += len(rows)
+
+            if len(rows) < batch_size:
+                break
+        except Exception:
+            db.session.rollback()
+            raise
+    return processed
+
+
+def purge_expired(raw_retention_days, minute_retention_days, hour_retention_days, batch_size=10000):
+    """清理超出保留期的原始流量日志及细粒度汇总
+
+    原始日志只删除已汇总（ID不大于检查点，检查点不超过稳定上界）的部分，按批删除避免长事务。
+    返回各类数据的删除条数。
+    """
+    now = datetime.utcnow()
+    result = {'raw': 0, 'minute': 0, 'hour': 0}
+
+    last_log_id = get_rolled_up_log_id()
+    raw_cutoff = now - timedelta(days=raw_retention_days)
+    while True:
+        ids = db.session.execute(
+            select(TrafficLog.id)
+            .where(TrafficLog.timestamp < raw_cutoff, TrafficLog.id <= last_log_id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(delete(TrafficLog).where(TrafficLog.id.in_(ids)))
+        db.session.commit()
+        result['raw'] += len(ids)
+
+    for resolution, days in (('minute', minute_retention_days), ('hour', hour_retention_days)):
+        deleted = db.session.execute(
+            delete(TrafficRollup).where(
+                TrafficRollup.resolution == resolution,
+                TrafficRollup.bucket_start < now - timedelta(days=days)
+            )
+        ).rowcount
+        db.session.commit()
+        result[resolution] = deleted or 0
+
+    return result
+
+
+def choose_resolution(start, end, retention_days):
+    """选择能覆盖查询范围的汇总粒度
+
+    从细到粗依次尝试，返回第一个保留期覆盖查询起点且时间桶数量不超过 MAX_POINTS 的粒度，
+    都不满足时使用按天汇总。
+    """
+    now = datetime.utcnow()
+    span = (end - start).total_seconds()
+    for resolution, size in RESOLUTIONS:
+        days = retention_days.get(resolution)
+        if days is not None and start < now - timedelta(days=days):
+            continue
+        if span / size.total_seconds() <= MAX_POINTS:
+            return resolution
+    return 'day'
+
+
+def query_history(user_id, start, end, resolution, tunnel_id=None):
+    """查询指定粒度的流量时间序列
+
+    已汇总部分直接读取时间桶，检查点之后尚未汇总的少量日志在内存中合并，
+    查询开销只与时间桶数量相关。未指定隧道时按时间桶合并所有隧道。
+    """
+    bucket_start = truncate(start, resolution)
+
+    query = select(
+        TrafficRollup.bucket_start,
+        func.sum(TrafficRollup.upload),
+        func.sum(TrafficRollup.download)
+    ).where(
+        TrafficRollup.resolution == resolution,
+        TrafficRollup.user_id == user_id,
+        TrafficRollup.bucket_start >= bucket_start,
+        TrafficRollup.bucket_start < end
+    )
+    if tunnel_id:
+        query = query.where(TrafficRollup.tunnel_id == tunnel_id)
+    query = query.group_by(TrafficRollup.bucket_start)
+
+    series = {}
+    for bucket, upload, download in db.session.execute(query):
+        series[bucket] = [int(upload or 0), int(download or 0)]
+
+    # 合并尚未汇总的日志
+    tail_query = select(
+        TrafficLog.user_id, TrafficLog.tunnel_id, TrafficLog.upload,
+        TrafficLog.download, TrafficLog.timestamp
+    ).where(
+        TrafficLog.id > get_rolled_up_log_id(),
+        TrafficLog.user_id == user_id,
+        TrafficLog.timestamp >= bucket_start,
+        TrafficLog.timestamp < end
+    )
+    if tunnel_id:
+        tail_query = tail_query.where(TrafficLog.tunnel_id == tunnel_id)
+
+    for key, delta in fold_logs(db.session.execute(tail_query)).items():
+        if key[0] != resolution:
+            continue
+        point = series.setdefault(key[3], [0, 0])
+        point[0] += delta[0]
+        point[1] += delta[1]
+
+    return [{
+        'bucket_start': bucket.isoformat(),
+        'upload': point[0],
+        'download': point[1],
+        'total': point[0] + point[1]
+    } for bucket, point in sorted(series.items())]
+
+
+class TrafficRollupScheduler:
+    """后台流量汇总与数据清理任务"""
+
+    def __init__(self):
+        self.interval = 60.0
+        self.settle_seconds = DEFAULT_SETTLE_SECONDS
+        self.retention_days = {}
+        self._app = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('TRAFFIC_ROLLUP_INTERVAL', 60.0)
+        app.config.setdefault('TRAFFIC_ROLLUP_SETTLE_SECONDS', DEFAULT_SETTLE_SECONDS)
+        app.config.setdefault('TRAFFIC_RAW_RETENTION_DAYS', 3)
+        app.config.setdefault('TRAFFIC_MINUTE_RETENTION_DAYS', 7)
+        app.config.setdefault('TRAFFIC_HOUR_RETENTION_DAYS', 90)
+
+        self._app = app
+        self.interval = float(app.config['TRAFFIC_ROLLUP_INTERVAL'])
+        self.settle_seconds = float(app.config['TRAFFIC_ROLLUP_SETTLE_SECONDS'])
+        self.retention_days = {
+            'raw': int(app.config['TRAFFIC_RAW_RETENTION_DAYS']),
+            'minute': int(app.config['TRAFFIC_MINUTE_RETENTION_DAYS']),
+            'hour': int(app.config['TRAFFIC_HOUR_RETENTION_DAYS']),
+        }
+        app.extensions['traffic_rollup'] = self
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='traffic-rollup', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """停止后台线程"""
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.run_once()
+
+    def raw_log_start_date(self, now=None):
+        """原始流量日志完整保留的最早日期，未启用清理任务时返回None
+
+        早于该日期的原始日志可能已被清理（部分或全部），只能从每日汇总获取。
+        """
+        if self.interval <= 0:
+            return None
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days['raw'])
+        # 截止时刻所在的那一天只保留了后半段
+        return cutoff.date() + timedelta(days=1) if cutoff.time() != datetime.min.time() else cutoff.date()
+
+    def run_once(self):
+        """执行一轮汇总和清理"""
+        try:
+            with self._app.app_context():
+                rollup_pending(settle_seconds=self.settle_seconds)
+                purge_expired(
+                    self.retention_days['raw'],
+                    self.retention_days['minute'],
+                    self.retention_days['hour']
+                )
+        except Exception:
+            self._app.logger.exception('流量汇总任务失败')
+
+
+traffic_rollup_scheduler = TrafficRollupScheduler()
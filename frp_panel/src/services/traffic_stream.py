@@ -0,0 +1,303 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import func, select
+from src.models.user import db
+from src.models.traffic import TrafficLog
+from src.services.batching import chunked
+
+
+class Subscription:
+    """一个SSE连接的订阅状态"""
+
+    __slots__ = ('user_id', 'cursor', 'reset')
+
+    def __init__(self, user_id, cursor, reset):
+        self.user_id = user_id
+        self.cursor = cursor
+        self.reset = reset
+
+
+class TrafficBroker:
+    """进程内的实时流量发布/订阅
+
+    流量上报提交后按用户发布样本，只为有订阅者（或订阅者断开不足 TRAFFIC_STREAM_RETAIN 秒）
+    的用户保留最近 TRAFFIC_STREAM_BUFFER 条样本，供断线重连时按 Last-Event-ID 补发。
+    样本序号在进程内递增，事件ID带有进程标识，重连到其他进程或补发范围已被淘汰时通知客户端重置。
+
+    多个工作进程时，上报请求和SSE连接可能落在不同进程；设置 TRAFFIC_STREAM_POLL_INTERVAL 后
+    改为由后台线程按间隔读取新增的流量日志（每个进程一条查询，与连接数无关），事件ID即日志ID。
+    自增ID在提交后才可见，较小的ID可能晚于较大的ID提交，因此只读取观察到已超过
+    TRAFFIC_STREAM_SETTLE_SECONDS 秒的最大ID之内的日志，推送相应延迟。
+    """
+
+    def __init__(self):
+        self.buffer_size = 1000
+        self.retain = 60.0
+        self.interval = 1.0
+        self.heartbeat = 15.0
+        self.poll_interval = 0.0
+        self.settle_seconds = 2.0
+        self.epoch = None
+        self._app = None
+        self._seq = 0
+        # 轮询时观察到的 (时间, 最大日志ID)，超过稳定期后作为读取上界
+        self._observed = deque()
+        self._buffers = {}
+        # 用户ID -> [订阅数, 最后一个订阅结束的时间, 可补发的最小序号]
+        self._watch = {}
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault('TRAFFIC_STREAM_BUFFER', 1000)
+        app.config.setdefault('TRAFFIC_STREAM_RETAIN', 60.0)
+        app.config.setdefault('TRAFFIC_STREAM_INTERVAL', 1.0)
+        app.config.setdefault('TRAFFIC_STREAM_HEARTBEAT', 15.0)
+        app.config.setdefault('TRAFFIC_STREAM_POLL_INTERVAL', 0.0)
+        app.config.setdefault('TRAFFIC_STREAM_SETTLE_SECONDS', 2.0)
+
+        self._app = app
+        self.buffer_size = max(1, int(app.config['TRAFFIC_STREAM_BUFFER']))
+        self.retain = float(app.config['TRAFFIC_STREAM_RETAIN'])
+        self.interval = max(0.1, float(app.config['TRAFFIC_STREAM_INTERVAL']))
+        self.heartbeat = max(1.0, float(app.config['TRAFFIC_STREAM_HEARTBEAT']))
+        self.poll_interval = float(app.config['TRAFFIC_STREAM_POLL_INTERVAL'])
+        self.settle_seconds = float(app.config['TRAFFIC_STREAM_SETTLE_SECONDS'])
+        self.epoch = 'db' if self.polling else f'{os.getpid():x}{int(time.time()):x}'
+        app.extensions['traffic_broker'] = self
+
+    @property
+    def polling(self):
+        return self.poll_interval > 0
+
+    def start(self):
+        """启动读取新增流量日志的后台线程（仅 TRAFFIC_STREAM_POLL_INTERVAL > 0 时）"""
+        if not self.polling or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='traffic-stream', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.poll_interval + 5)
+
+    def _run(self):
+        with self._app.app_context():
+            self._seq = db.session.scalar(select(func.max(TrafficLog.id))) or 0
+            db.session.remove()
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                with self._app.app_context():
+                    self.poll()
+            except Exception:
+                self._app.logger.exception('读取实时流量失败')
+
+    def poll(self):
+        """读取订阅用户新增的流量日志并发布，没有订阅用户时只推进游标"""
+        try:
+            upper = self._settled_upper(db.session.scalar(select(func.max(TrafficLog.id))) or 0)
+            with self._cond:
+                user_ids = list(self._watch)
+                last_id = self._seq
+            if upper <= last_id:
+                return
+
+            for chunk in chunked(user_ids):
+                rows = db.session.execute(
+                    select(TrafficLog.id, TrafficLog.user_id, TrafficLog.tunnel_id, TrafficLog.upload,
+                           TrafficLog.download, TrafficLog.timestamp)
+                    .where(TrafficLog.id > last_id, TrafficLog.id <= upper, TrafficLog.user_id.in_(chunk))
+                    .order_by(TrafficLog.id)
+                ).all()
+                with self._cond:
+                    for row in rows:
+                        self._append(row.user_id, row.id, row.tunnel_id, row.upload, row.download, row.timestamp)
+            with self._cond:
+                self._seq = max(self._seq, upper)
+                self._cond.notify_all()
+        finally:
+            db.session.remove()
+
+    def _settled_upper(self, current, now=None):
+        """返回已过稳定期的最大日志ID（只在轮询线程中调用）
+
+        与流量汇总的检查点相同：观察到的最大ID经过 settle_seconds 后，分配了更小ID的事务
+        已经提交或回滚，按ID推进游标不会跳过晚提交的日志。
+        """
+        if self.settle_seconds <= 0:
+            return current
+        now = time.monotonic() if now is None else now
+        self._observed.append((now, current))
+        upper = self._seq
+        while self._observed and self._observed[0][0] <= now - self.settle_seconds:
+            upper = max(upper, self._observed.popleft()[1])
+        return upper
+
+    def publish(self, user_id, samples):
+        """发布用户已提交的流量样本，没有订阅者时只做一次字典查找"""
+        if self.polling or user_id not in self._watch:
+            return
+        with self._cond:
+            if user_id not in self._watch:
+                return
+            for sample in samples:
+                self._seq += 1
+                self._append(user_id, self._seq, sample['tunnel_id'], sample['upload'], sample['download'],
+                             sample['timestamp'])
+            self._cond.notify_all()
+
+    def _append(self, user_id, seq, tunnel_id, upload, download, timestamp):
+        buffer = self._buffers.get(user_id)
+        if buffer is None:
+            return
+        if len(buffer) == buffer.maxlen:
+            # 最早的样本被淘汰，更早的事件ID无法再补发
+            self._watch[user_id][2] = buffer[0][0]
+        buffer.append((seq, tunnel_id, upload, download, timestamp))
+
+    def parse_event_id(self, event_id):
+        """解析 Last-Event-ID，返回序号；进程标识不一致或格式错误时返回None"""
+        if not event_id:
+            return None
+        epoch, _, seq = str(event_id).partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def event_id(self, seq):
+        return f'{self.epoch}:{seq}'
+
+    def subscribe(self, user_id, last_event_id=None):
+        """开始订阅；Last-Event-ID 之后的样本仍在缓冲区时从该处继续，否则需要客户端重置"""
+        last_seq = self.parse_event_id(last_event_id)
+        with self._cond:
+            self._prune()
+            watch = self._watch.get(user_id)
+            if watch is None:
+                watch = self._watch[user_id] = [0, None, self._seq]
+                self._buffers[user_id] = deque(maxlen=self.buffer_size)
+            watch[0] += 1
+            watch[1] = None
+            if last_seq is not None and watch[2] <= last_seq <= self._seq:
+                return Subscription(user_id, last_seq, False)
+            return Subscription(user_id, self._seq, last_event_id is not None)
+
+    def unsubscribe(self, subscription):
+        with self._cond:
+            watch = self._watch.get(subscription.user_id)
+            if watch is not None:
+                watch[0] -= 1
+                if watch[0] <= 0:
+                    watch[1] = time.monotonic()
+
+    def _prune(self):
+        """清理订阅已结束超过 retain 秒的用户缓冲区（调用方持有锁）"""
+        now = time.monotonic()
+        for user_id, (count, ended, _) in list(self._watch.items()):
+            if count <= 0 and ended is not None and now - ended > self.retain:
+                del self._watch[user_id]
+                del self._buffers[user_id]
+
+    def wait(self, subscription, timeout):
+        """等待订阅用户的新样本，返回游标之后的样本列表（超时返回空列表）"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                buffer = self._buffers.get(subscription.user_id)
+                events = [event for event in buffer if event[0] > subscription.cursor] if buffer else []
+                if events:
+                    subscription.cursor = events[-1][0]
+                    return events
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_event.is_set():
+                    return []
+                self._cond.wait(remaining)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'users': len(self._watch),
+                'subscribers': sum(watch[0] for watch in self._watch.values()),
+                'buffered': sum(len(buffer) for buffer in self._buffers.values())
+            }
+
+
+traffic_broker = TrafficBroker()
+
+
+def aggregate_rates(events, elapsed):
+    """把一段时间内的样本按隧道合并为增量和速率（字节/秒）"""
+    tunnels = {}
+    for _, tunnel_id, upload, download, timestamp in events:
+        entry = tunnels.get(tunnel_id)
+        if entry is None:
+            entry = tunnels[tunnel_id] = {'tunnel_id': tunnel_id, 'upload': 0, 'download': 0, 'samples': 0}
+        entry['upload'] += upload
+        entry['download'] += download
+        entry['samples'] += 1
+        entry['last_timestamp'] = timestamp.isoformat() if hasattr(timestamp, 'isoformat') else timestamp
+    elapsed = max(elapsed, 0.001)
+    for entry in tunnels.values():
+        entry['upload_rate'] = round(entry['upload'] / elapsed, 2)
+        entry['download_rate'] = round(entry['download'] / elapsed, 2)
+    return list(tunnels.values())
+
+
+def sse_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_traffic(broker, user_id, last_event_id=None, expires_at=None):
+    """SSE事件生成器：每 TRAFFIC_STREAM_INTERVAL 秒最多发送一次各隧道的增量和速率，空闲时发送心跳
+
+    在生成器内订阅，响应未开始发送就被关闭时不会遗留订阅。
+    连接持续到客户端断开或访问令牌过期（event: expired，客户端应换新令牌重连）。
+    """
+    subscription = broker.subscribe(user_id, last_event_id)
+    try:
+        yield f'retry: {int(broker.interval * 3000)}\n\n'
+        if subscription.reset:
+            # 断线期间的样本已无法补发，客户端应重新拉取 /traffic/realtime 后继续接收增量
+            yield sse_event({'reason': 'gap'}, event='reset', event_id=broker.event_id(subscription.cursor))
+
+        last_emit = time.monotonic()
+        while True:
+            timeout = broker.heartbeat
+            if expires_at is not None:
+                timeout = min(timeout, expires_at - time.time())
+                if timeout <= 0:
+                    yield sse_event({}, event='expired')
+                    return
+
+            events = broker.wait(subscription, timeout)
+            if not events:
+                yield ': keepalive\n\n'
+                continue
+
+            # 合并一个间隔内到达的样本，限制发送频率
+            delay = last_emit + broker.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                events += broker.wait(subscription, 0)
+            now = time.monotonic()
+            yield sse_event({
+                'tunnels': aggregate_rates(events, now - last_emit),
+                'interval': round(now - last_emit, 3)
+            }, event='traffic', event_id=broker.event_id(subscription.cursor))
+            last_emit = now
+    finally:
+        broker.unsubscribe(subscription)
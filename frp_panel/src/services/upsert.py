@@ -0,0 +1,49 @@
+from sqlalchemy import update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from src.models.user import db
+
+# 单条语句携带的最大行数，避免超出数据库的参数数量限制
+UPSERT_CHUNK_SIZE = 500
+
+
+def upsert_increment(model, rows, key_columns, increment_columns):
+    """按唯一键批量累加：键不存在时插入，存在时执行 col = col + :delta
+
+    rows 为字典列表，每个字典需包含 key_columns 与 increment_columns 中的全部字段，
+    同一批次内的键应事先合并，保证每个键只出现一次。
+    """
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        _upsert_chunk(model, rows[start:start + UPSERT_CHUNK_SIZE], key_columns, increment_columns)
+
+
+def _upsert_chunk(model, rows, key_columns, increment_columns):
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {col: table.c[col] + stmt.inserted[col] for col in increment_columns}
+        )
+        db.session.execute(stmt)
+    elif dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[col] for col in key_columns],
+            set_={col: table.c[col] + stmt.excluded[col] for col in increment_columns}
+        )
+        db.session.execute(stmt)
+    else:
+        # 其他数据库：先原子更新，未命中再插入
+        for row in rows:
+            stmt = update(table).where(
+                *[table.c[col] == row[col] for col in key_columns]
+            ).values(
+                {col: table.c[col] + row[col] for col in increment_columns}
+            )
+            if db.session.execute(stmt).rowcount == 0:
+                db.session.execute(table.insert().values(row))
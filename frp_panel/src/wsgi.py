@@ -0,0 +1,9 @@
+import os
+import sys
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.main import create_app
+
+# gunicorn 入口：gunicorn -c gunicorn.conf.py src.wsgi:app
+app = create_app()